@@ -0,0 +1,45 @@
+"""notify workers when a users row changes (principal cache invalidation)
+
+Revision ID: a3b4c5d6e7f8
+Revises: f2a3b4c5d6e7
+Create Date: 2026-10-17
+
+Every API worker caches the authenticated user (app.utils.deps). This trigger
+sends NOTIFY cache_invalidation on update or delete of a users row, however it
+is changed (API or manual SQL), so a deactivation takes effect in all workers
+on commit. Postgres only.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = 'a3b4c5d6e7f8'
+down_revision: Union[str, None] = 'f2a3b4c5d6e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_principal_invalidation() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('cache_invalidation', json_build_object('topic', 'principal', 'key', OLD.id)::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER users_principal_invalidation
+        AFTER UPDATE OR DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION notify_principal_invalidation()
+    """)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP TRIGGER IF EXISTS users_principal_invalidation ON users")
+    op.execute("DROP FUNCTION IF EXISTS notify_principal_invalidation()")
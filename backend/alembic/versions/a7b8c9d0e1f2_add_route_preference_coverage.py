@@ -0,0 +1,41 @@
+"""add route_preference_coverage table
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'a7b8c9d0e1f2'
+down_revision: Union[str, None] = 'f6a7b8c9d0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'route_preference_coverage',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('route_option_id', sa.Integer(), nullable=False),
+        sa.Column('preference_id', sa.Integer(), nullable=False),
+        sa.Column('mentioned', sa.Boolean(), nullable=False),
+        sa.Column('match_span', sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(['route_option_id'], ['route_options.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['preference_id'], ['place_preferences.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('route_option_id', 'preference_id', name='uq_route_preference_coverage'),
+    )
+    op.create_index(op.f('ix_route_preference_coverage_id'), 'route_preference_coverage', ['id'], unique=False)
+    op.create_index(op.f('ix_route_preference_coverage_preference_id'), 'route_preference_coverage', ['preference_id'], unique=False)
+    # Existing routes are backfilled by revision c5d6e7f8a9b0
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_route_preference_coverage_preference_id'), table_name='route_preference_coverage')
+    op.drop_index(op.f('ix_route_preference_coverage_id'), table_name='route_preference_coverage')
+    op.drop_table('route_preference_coverage')
@@ -0,0 +1,48 @@
+"""add llm_rate_buckets and llm_call_slots tables
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b8c9d0e1f2a3'
+down_revision: Union[str, None] = 'a7b8c9d0e1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'llm_rate_buckets',
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('request_tokens', sa.Float(), nullable=False),
+        sa.Column('token_tokens', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_table(
+        'llm_call_slots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bucket_key', sa.String(length=128), nullable=False),
+        sa.Column('trip_id', sa.Integer(), nullable=True),
+        sa.Column('worker_id', sa.String(length=100), nullable=True),
+        sa.Column('tokens', sa.Integer(), nullable=False),
+        sa.Column('acquired_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_llm_call_slots_id'), 'llm_call_slots', ['id'], unique=False)
+    op.create_index(op.f('ix_llm_call_slots_bucket_key'), 'llm_call_slots', ['bucket_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_llm_call_slots_bucket_key'), table_name='llm_call_slots')
+    op.drop_index(op.f('ix_llm_call_slots_id'), table_name='llm_call_slots')
+    op.drop_table('llm_call_slots')
+    op.drop_table('llm_rate_buckets')
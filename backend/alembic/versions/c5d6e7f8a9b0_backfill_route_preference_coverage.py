@@ -0,0 +1,68 @@
+"""backfill route_preference_coverage for routes generated before it existed
+
+Revision ID: c5d6e7f8a9b0
+Revises: b4c5d6e7f8a9
+Create Date: 2026-10-17
+
+Coverage is computed in Python (app.services.coverage) for every route and
+inserted with ON CONFLICT DO NOTHING, so pairs already written at generation
+are kept and the migration can be re-run safely. Reads never build coverage.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.services.coverage import coverage_values
+
+
+revision: str = 'c5d6e7f8a9b0'
+down_revision: Union[str, None] = 'b4c5d6e7f8a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+route_options = sa.table(
+    'route_options',
+    sa.column('id', sa.Integer),
+    sa.column('trip_id', sa.Integer),
+    sa.column('description', sa.Text),
+    sa.column('reasoning', sa.Text),
+    sa.column('route_data', sa.JSON),
+)
+place_preferences = sa.table(
+    'place_preferences',
+    sa.column('id', sa.Integer),
+    sa.column('trip_id', sa.Integer),
+    sa.column('city', sa.String),
+    sa.column('location', sa.String),
+)
+route_preference_coverage = sa.table(
+    'route_preference_coverage',
+    sa.column('route_option_id', sa.Integer),
+    sa.column('preference_id', sa.Integer),
+    sa.column('mentioned', sa.Boolean),
+    sa.column('match_span', sa.String),
+)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+    trip_ids = conn.execute(sa.select(route_options.c.trip_id).distinct()).scalars().all()
+    for trip_id in trip_ids:
+        routes = conn.execute(sa.select(route_options).where(route_options.c.trip_id == trip_id)).all()
+        prefs = conn.execute(sa.select(place_preferences).where(place_preferences.c.trip_id == trip_id)).all()
+        values = coverage_values(routes, prefs)
+        if values:
+            conn.execute(
+                dialect.insert(route_preference_coverage).values(values).on_conflict_do_nothing(
+                    index_elements=['route_option_id', 'preference_id']
+                )
+            )
+
+
+def downgrade() -> None:
+    # Coverage rows are valid under the previous revision as well
+    pass
@@ -0,0 +1,36 @@
+"""add llm_shared_responses table
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2026-10-16
+
+A row with response NULL is a claim: the worker making the call holds it until
+claimed_until, then writes the response.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c9d0e1f2a3b4'
+down_revision: Union[str, None] = 'b8c9d0e1f2a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'llm_shared_responses',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('response', sa.Text(), nullable=True),
+        sa.Column('claimed_until', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index(op.f('ix_llm_shared_responses_created_at'), 'llm_shared_responses', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_llm_shared_responses_created_at'), table_name='llm_shared_responses')
+    op.drop_table('llm_shared_responses')
@@ -0,0 +1,45 @@
+"""add indexes for trip-scoped queries
+
+Revision ID: d0e1f2a3b4c5
+Revises: c9d0e1f2a3b4
+Create Date: 2026-10-17
+
+Built with CREATE INDEX CONCURRENTLY (outside the migration transaction) so
+existing tables stay writable. Columns already leading a unique constraint
+(trip_participants.trip_id, reactions.preference_id, votes.user_id) are not
+indexed again. If a concurrent build fails it leaves an INVALID index: drop
+it and run the upgrade again.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = 'd0e1f2a3b4c5'
+down_revision: Union[str, None] = 'c9d0e1f2a3b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_place_preferences_trip_id_priority_created_at', 'place_preferences', ['trip_id', 'priority', 'created_at']),
+    ('ix_route_options_trip_id_option_number', 'route_options', ['trip_id', 'option_number']),
+    ('ix_votes_trip_id_user_id', 'votes', ['trip_id', 'user_id']),
+    ('ix_votes_route_option_id', 'votes', ['route_option_id']),
+    ('ix_trip_participants_user_id_trip_id', 'trip_participants', ['user_id', 'trip_id']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_concurrently=True, if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
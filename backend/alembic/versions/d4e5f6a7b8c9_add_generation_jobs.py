@@ -0,0 +1,52 @@
+"""add generation_jobs table
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'd4e5f6a7b8c9'
+down_revision: Union[str, None] = 'c3d4e5f6a7b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'generation_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.Enum('GENERATE_ROUTES', 'GENERATE_CHECKLIST', name='jobkind'), nullable=False),
+        sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', name='jobstatus'), nullable=False),
+        sa.Column('trip_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('worker_id', sa.String(length=100), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('error_code', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['trip_id'], ['trips.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_generation_jobs_id'), 'generation_jobs', ['id'], unique=False)
+    op.create_index('ix_generation_jobs_status_created_at', 'generation_jobs', ['status', 'created_at'], unique=False)
+    op.create_index('ix_generation_jobs_trip_id_kind', 'generation_jobs', ['trip_id', 'kind'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generation_jobs_trip_id_kind', table_name='generation_jobs')
+    op.drop_index('ix_generation_jobs_status_created_at', table_name='generation_jobs')
+    op.drop_index(op.f('ix_generation_jobs_id'), table_name='generation_jobs')
+    op.drop_table('generation_jobs')
+    sa.Enum(name='jobstatus').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='jobkind').drop(op.get_bind(), checkfirst=True)
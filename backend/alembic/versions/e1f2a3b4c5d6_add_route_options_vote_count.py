@@ -0,0 +1,31 @@
+"""add route_options.vote_count
+
+Revision ID: e1f2a3b4c5d6
+Revises: d0e1f2a3b4c5
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e1f2a3b4c5d6'
+down_revision: Union[str, None] = 'd0e1f2a3b4c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('route_options', sa.Column('vote_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        "UPDATE route_options SET vote_count = "
+        "(SELECT count(*) FROM votes WHERE votes.route_option_id = route_options.id)"
+    )
+    op.create_index('ix_route_options_trip_id_vote_count', 'route_options', ['trip_id', 'vote_count'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_route_options_trip_id_vote_count', table_name='route_options')
+    op.drop_column('route_options', 'vote_count')
@@ -0,0 +1,36 @@
+"""add route_generation_cache table and generation_jobs.params
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e5f6a7b8c9d0'
+down_revision: Union[str, None] = 'd4e5f6a7b8c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'route_generation_cache',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('model', sa.String(length=100), nullable=False),
+        sa.Column('routes', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_hit_at', sa.DateTime(), nullable=True),
+        sa.Column('hit_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.add_column('generation_jobs', sa.Column('params', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('generation_jobs', 'params')
+    op.drop_table('route_generation_cache')
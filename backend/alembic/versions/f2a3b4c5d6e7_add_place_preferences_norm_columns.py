@@ -0,0 +1,71 @@
+"""add normalized place columns and trigram indexes to place_preferences
+
+Revision ID: f2a3b4c5d6e7
+Revises: e1f2a3b4c5d6
+Create Date: 2026-10-17
+
+country_norm/city_norm/location_norm hold fold_text() of the user-entered names
+and are backfilled here in Python (the folding is not expressible in SQL).
+On Postgres the trigram indexes are GIN (trip_id, *_norm gin_trgm_ops), which
+needs the pg_trgm and btree_gin extensions.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.text import fold_text
+
+
+revision: str = 'f2a3b4c5d6e7'
+down_revision: Union[str, None] = 'e1f2a3b4c5d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COLUMNS = ['country', 'city', 'location']
+INDEXES = [
+    ('ix_place_preferences_trip_id_city_norm_trgm', 'city_norm'),
+    ('ix_place_preferences_trip_id_location_norm_trgm', 'location_norm'),
+]
+
+
+def upgrade() -> None:
+    for column in COLUMNS:
+        op.add_column('place_preferences', sa.Column(f'{column}_norm', sa.Text(), server_default='', nullable=False))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text('SELECT id, country, city, location FROM place_preferences')).all()
+    if rows:
+        conn.execute(
+            sa.text(
+                'UPDATE place_preferences '
+                'SET country_norm = :country_norm, city_norm = :city_norm, location_norm = :location_norm '
+                'WHERE id = :id'
+            ),
+            [
+                {
+                    'id': row.id,
+                    'country_norm': fold_text(row.country),
+                    'city_norm': fold_text(row.city),
+                    'location_norm': fold_text(row.location),
+                }
+                for row in rows
+            ],
+        )
+
+    if conn.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+    for name, column in INDEXES:
+        op.create_index(
+            name, 'place_preferences', ['trip_id', column], unique=False,
+            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+        )
+
+
+def downgrade() -> None:
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name='place_preferences')
+    for column in COLUMNS:
+        op.drop_column('place_preferences', f'{column}_norm')
@@ -0,0 +1,40 @@
+"""add route_exclusion_reasons table
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'route_exclusion_reasons',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('route_option_id', sa.Integer(), nullable=False),
+        sa.Column('preference_id', sa.Integer(), nullable=False),
+        sa.Column('reason', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['route_option_id'], ['route_options.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['preference_id'], ['place_preferences.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('route_option_id', 'preference_id', name='uq_route_exclusion_reason'),
+    )
+    op.create_index(op.f('ix_route_exclusion_reasons_id'), 'route_exclusion_reasons', ['id'], unique=False)
+    op.create_index(op.f('ix_route_exclusion_reasons_preference_id'), 'route_exclusion_reasons', ['preference_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_route_exclusion_reasons_preference_id'), table_name='route_exclusion_reasons')
+    op.drop_index(op.f('ix_route_exclusion_reasons_id'), table_name='route_exclusion_reasons')
+    op.drop_table('route_exclusion_reasons')
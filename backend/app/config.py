@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from pydantic import model_validator
 from functools import lru_cache
+from typing import Literal
 
 class Settings(BaseSettings):
     # Database (в production задайте DATABASE_URL в .env)
@@ -16,19 +17,87 @@ class Settings(BaseSettings):
     deepseek_api_key: str = ""  # Set via DEEPSEEK_API_KEY environment variable
     deepseek_base_url: str = "https://api.deepseek.com"
     deepseek_model: str = "deepseek-chat"
+
+    # LLM HTTP client: one pooled AsyncOpenAI client per worker process
+    llm_max_connections: int = 20
+    llm_max_keepalive_connections: int = 10
+    llm_keepalive_expiry: float = 30.0  # seconds
+    llm_connect_timeout: float = 10.0  # seconds
+    llm_max_retries: int = 2
+    # Per-call read timeouts (seconds)
+    llm_routes_timeout: float = 120.0
+    llm_suggestions_timeout: float = 30.0
+    llm_packing_timeout: float = 60.0
+    llm_explain_timeout: float = 20.0
+    llm_explain_batch_timeout: float = 60.0
+    # Provider rate limits per API key, shared by all workers via the llm_rate_buckets table (0 = unlimited)
+    llm_requests_per_minute: int = 60
+    llm_tokens_per_minute: int = 200000
+    llm_max_concurrency: int = 8  # in-flight calls
+    llm_limit_max_wait: float = 30.0  # seconds a call may queue before failing with 429
+    llm_limit_poll_interval: float = 0.25  # seconds between attempts while queued
+    llm_local_budget_share: float = 0.1  # share of the per-minute limits a worker takes from the shared buckets at once
+    llm_slot_idle_seconds: float = 5.0  # a worker keeps a freed concurrency slot this long for its next call
+    # Identical concurrent LLM requests share one call (across workers via llm_shared_responses + NOTIFY on Postgres)
+    llm_single_flight: bool = True
+    llm_single_flight_poll_interval: float = 1.0  # seconds a waiting worker rechecks the call if no notification arrives
+    # Route output: "json" (structured days/slots/places, stored in route_data) or "markdown" (legacy)
+    llm_routes_output_format: Literal["json", "markdown"] = "json"
+    llm_routes_max_tokens: int = 8000  # structured JSON for three routes is several times longer than markdown
+
+    # Route generation cache (same prompt + model + params -> stored result, no new LLM call)
+    route_cache_ttl_days: int = 30
+
+    # Place suggestions cache (shared by all trips, per worker)
+    suggestions_cache_size: int = 500  # cities
+    suggestions_cache_ttl_hours: int = 24
+
+    # Password hashing: bcrypt in a process pool, so a login storm does not starve the API
+    bcrypt_rounds: int = 12  # cost factor; existing hashes are rehashed on the next login
+    password_hash_workers: int = 2  # processes per API worker
+    password_hash_max_pending: int = 32  # queued + running hashes before new ones get 503
+    
+    # Auth caches (per worker): verified access tokens and user rows for get_current_user
+    verified_token_cache_size: int = 10000  # tokens
+    principal_cache_size: int = 10000  # users
+    principal_cache_ttl: float = 60.0  # seconds; deactivation is pushed to all workers on Postgres
+
+    # Live trip events (SSE / WebSocket), fanned out across workers with Postgres LISTEN/NOTIFY
+    trip_events_queue_size: int = 100  # undelivered events per connection before it is told to resync
+    trip_events_keepalive: float = 15.0  # seconds between keepalive messages on idle streams
+    pg_listener_keepalive: float = 30.0  # seconds between checks of the LISTEN connection
+    
+    # Responses of trip read endpoints, keyed by trip version (per worker; writes drop a trip's entries in all workers)
+    trip_response_cache_size: int = 5000  # responses
+    trip_response_cache_ttl: float = 600.0  # seconds
     
+    # Trip membership cache for trip-scoped endpoints (per worker; join/leave/delete drop a trip's entries in all workers)
+    trip_access_cache_size: int = 10000  # (trip, user) pairs
+    trip_access_cache_ttl: float = 10.0  # seconds a membership may stay stale if an invalidation event is missed
+
+    # Background generation jobs
+    job_workers: int = 2  # worker coroutines inside each API process (0 = only `python -m app.worker`)
+    job_poll_interval: float = 1.0  # seconds between polls when the queue is empty
+    job_lease_seconds: int = 90  # renewed by heartbeat while the job runs
+    job_max_attempts: int = 3
+    job_recovery_interval: float = 30.0  # seconds between stale job/trip recovery passes
+
     # Yandex Maps API
     yandex_api_key: str = ""  # Set via YANDEX_API_KEY environment variable
     
     # App
     app_env: str = "development"
     frontend_url: str = "http://localhost:3000"
+    health_token: str = ""  # X-Health-Token for /health/caches; empty disables the endpoint
     
     # Limits
     max_generation_count: int = 10
     max_participants_per_trip: int = 10
     max_preferences_per_trip: int = 50
     
+    # Duplicate place warning: trigram similarity (0..1) of folded city/location names
+    duplicate_similarity_threshold: float = 0.5
+    
     @model_validator(mode="after")
     def require_secret_in_production(self):
         if self.app_env == "production" and not (self.jwt_secret and self.jwt_secret.strip()):
@@ -1,23 +1,55 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 from app.config import settings
 
-engine = create_engine(
-    settings.database_url,
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with an async driver (postgresql:// -> postgresql+asyncpg://).
+
+    The plain URL stays valid for Alembic, which migrates with the sync psycopg2 driver.
+    """
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+# aiosqlite (local runs) uses NullPool, which takes no pool sizing
+pool_options = {} if settings.database_url.startswith("sqlite") else {"pool_size": 5, "max_overflow": 10}
+
+engine = create_async_engine(
+    async_database_url(settings.database_url),
     pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10,
+    **pool_options,
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if engine.dialect.name == "sqlite":
+    # Child rows are deleted by ON DELETE CASCADE (passive_deletes), which SQLite enforces only when asked
+    @event.listens_for(engine.sync_engine, "connect")
+    def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+# expire_on_commit=False: attributes stay readable after commit without an implicit (sync) reload
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 
-def get_db():
+def dialect_insert(model):
+    """INSERT with ON CONFLICT support (Postgres, or SQLite in development)."""
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+async def get_db():
     """Dependency for getting database session."""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
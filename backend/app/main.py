@@ -1,6 +1,15 @@
-from fastapi import FastAPI
+import asyncio
+import secrets
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
+from app.database import engine
+from app.services.llm_service import close_llm_client
+from app.services.jobs import start_workers
+from app.services.notifications import run_notification_listener
+from app.services.password_hasher import shutdown_password_hasher
+from app.utils.cache import all_cache_stats
 from app.routers import auth
 from app.routers import trips
 from app.routers import preferences
@@ -9,11 +18,37 @@ from app.routers import votes
 from app.routers import reactions
 from app.routers import suggestions
 from app.routers import checklist
+from app.routers import jobs
+from app.routers import dashboard
+from app.routers import events
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background generation workers (can also run separately: python -m app.worker)
+    stop = asyncio.Event()
+    workers = start_workers(settings.job_workers, stop)
+    # LISTEN/NOTIFY: cache invalidations and trip events from all workers (Postgres only)
+    notification_listener = asyncio.create_task(run_notification_listener(stop))
+    yield
+    stop.set()
+    await notification_listener
+    if workers:
+        # Interrupted jobs keep their lease and are picked up again after it expires
+        _, pending = await asyncio.wait(workers, timeout=10)
+        for task in pending:
+            task.cancel()
+    # Release pooled LLM and database connections
+    await close_llm_client()
+    await engine.dispose()
+    shutdown_password_hasher()
+
 
 app = FastAPI(
     title="TripTogether API",
     description="API для сервиса группового планирования путешествий",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -36,6 +71,16 @@ def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/health/caches")
+def cache_stats(x_health_token: str | None = Header(None)):
+    """Hit/miss counters of this worker's caches. Internal: requires X-Health-Token (HEALTH_TOKEN)."""
+    if not settings.health_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_health_token or not secrets.compare_digest(x_health_token, settings.health_token):
+        raise HTTPException(status_code=403, detail="Неверный токен мониторинга")
+    return all_cache_stats()
+
+
 # Auth routes
 app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
 
@@ -59,3 +104,12 @@ app.include_router(suggestions.router, prefix="/api", tags=["Suggestions"])
 
 # Packing checklist (after routes generated)
 app.include_router(checklist.router, prefix="/api/trips", tags=["Checklist"])
+
+# Background generation jobs (status polling)
+app.include_router(jobs.router, prefix="/api/trips", tags=["Jobs"])
+
+# Trip page data in one request
+app.include_router(dashboard.router, prefix="/api/trips", tags=["Dashboard"])
+
+# Live trip events (SSE and WebSocket)
+app.include_router(events.router, prefix="/api/trips", tags=["Events"])
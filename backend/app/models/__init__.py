@@ -1,10 +1,12 @@
 from app.models.user import User
 from app.models.trip import Trip, TripParticipant, GenerationStatus, ParticipantRole
 from app.models.preference import PlacePreference, PlaceType
-from app.models.route import RouteOption
+from app.models.route import RouteOption, RoutePreferenceCoverage, RouteExclusionReason, RouteGenerationCache
 from app.models.vote import Vote
 from app.models.reaction import Reaction
 from app.models.checklist import TripChecklist
+from app.models.job import GenerationJob, JobKind, JobStatus
+from app.models.llm_limit import LLMRateBucket, LLMCallSlot, LLMSharedResponse
 
 __all__ = [
     "User",
@@ -15,7 +17,16 @@ __all__ = [
     "PlacePreference",
     "PlaceType",
     "RouteOption",
+    "RoutePreferenceCoverage",
+    "RouteExclusionReason",
+    "RouteGenerationCache",
     "Vote",
     "Reaction",
     "TripChecklist",
+    "GenerationJob",
+    "JobKind",
+    "JobStatus",
+    "LLMRateBucket",
+    "LLMCallSlot",
+    "LLMSharedResponse",
 ]
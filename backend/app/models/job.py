@@ -0,0 +1,52 @@
+import enum
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Text, JSON, Index
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+
+class JobKind(str, enum.Enum):
+    GENERATE_ROUTES = "generate_routes"
+    GENERATE_CHECKLIST = "generate_checklist"
+
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class GenerationJob(Base):
+    """Durable background job for LLM generation. Claimed by workers with FOR UPDATE SKIP LOCKED."""
+    __tablename__ = "generation_jobs"
+    __table_args__ = (
+        Index("ix_generation_jobs_status_created_at", "status", "created_at"),
+        Index("ix_generation_jobs_trip_id_kind", "trip_id", "kind"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(Enum(JobKind), nullable=False)
+    status = Column(Enum(JobStatus), default=JobStatus.QUEUED, nullable=False)
+
+    trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+
+    params = Column(JSON, nullable=True)  # handler options, e.g. { "force": true }
+    attempts = Column(Integer, default=0, nullable=False)
+    worker_id = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)  # RUNNING job is reclaimable after this moment
+
+    result = Column(JSON, nullable=True)  # e.g. { "route_ids": [...] } or { "checklist_id": 1 }
+    error = Column(Text, nullable=True)
+    error_code = Column(Integer, nullable=True)  # HTTP status the synchronous endpoint would have returned
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    trip = relationship("Trip", back_populates="generation_jobs")
+
+    def __repr__(self):
+        return f"<GenerationJob(id={self.id}, kind={self.kind}, status={self.status})>"
@@ -0,0 +1,45 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text
+from app.database import Base
+
+
+class LLMRateBucket(Base):
+    """Token buckets (requests/min and tokens/min) of one LLM provider key, shared by all workers."""
+    __tablename__ = "llm_rate_buckets"
+
+    key = Column(String(128), primary_key=True)  # base_url + api key fingerprint
+    request_tokens = Column(Float, nullable=False)  # requests still allowed, refilled at requests_per_minute
+    token_tokens = Column(Float, nullable=False)  # LLM tokens still allowed, refilled at tokens_per_minute
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<LLMRateBucket(key={self.key}, requests={self.request_tokens:.1f}, tokens={self.token_tokens:.0f})>"
+
+
+class LLMCallSlot(Base):
+    """An in-flight LLM call. Counts towards llm_max_concurrency until released or expired."""
+    __tablename__ = "llm_call_slots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket_key = Column(String(128), nullable=False, index=True)
+    trip_id = Column(Integer, nullable=True)
+    worker_id = Column(String(100), nullable=True)
+    tokens = Column(Integer, nullable=False, default=0)  # estimated tokens charged for the call
+    acquired_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)  # slot of a crashed worker is ignored after this moment
+
+    def __repr__(self):
+        return f"<LLMCallSlot(id={self.id}, bucket_key={self.bucket_key}, trip_id={self.trip_id})>"
+
+
+class LLMSharedResponse(Base):
+    """Coalesced LLM call: claimed while in flight, then its response for identical callers waiting in other workers."""
+    __tablename__ = "llm_shared_responses"
+
+    key = Column(String(64), primary_key=True)  # sha256 of the request (see request_cache_key)
+    response = Column(Text, nullable=True)  # serialized completion; NULL while the call is in flight
+    claimed_until = Column(DateTime, nullable=True)  # claim of the calling worker expires (it may have crashed)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<LLMSharedResponse(key={self.key}, created_at={self.created_at})>"
@@ -1,8 +1,9 @@
 import enum
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Text, Index
+from sqlalchemy.orm import relationship, validates
 from app.database import Base
+from app.utils.text import fold_text
 
 
 class PlaceType(str, enum.Enum):
@@ -15,8 +16,24 @@ class PlaceType(str, enum.Enum):
     OTHER = "other"
 
 
+def _folded(column: str):
+    """Insert default of a *_norm column, for inserts that bypass the ORM attributes (bulk insert)."""
+    def default(context):
+        return fold_text(context.get_current_parameters().get(column))
+    return default
+
+
 class PlacePreference(Base):
     __tablename__ = "place_preferences"
+    __table_args__ = (
+        # Trip preference list: WHERE trip_id = ? ORDER BY priority DESC, created_at DESC
+        Index("ix_place_preferences_trip_id_priority_created_at", "trip_id", "priority", "created_at"),
+        # Near-duplicate search within a trip (GIN with btree_gin + pg_trgm on Postgres)
+        Index("ix_place_preferences_trip_id_city_norm_trgm", "trip_id", "city_norm",
+              postgresql_using="gin", postgresql_ops={"city_norm": "gin_trgm_ops"}),
+        Index("ix_place_preferences_trip_id_location_norm_trgm", "trip_id", "location_norm",
+              postgresql_using="gin", postgresql_ops={"location_norm": "gin_trgm_ops"}),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
@@ -26,6 +43,12 @@ class PlacePreference(Base):
     city = Column(String(100), nullable=False)
     location = Column(String(255), nullable=True)  # Optional specific place
     
+    # fold_text() of the fields above, kept in sync on assignment, for duplicate detection
+    # (Text: transliteration may lengthen a name)
+    country_norm = Column(Text, nullable=False, default=_folded("country"), server_default="")
+    city_norm = Column(Text, nullable=False, default=_folded("city"), server_default="")
+    location_norm = Column(Text, nullable=False, default=_folded("location"), server_default="")
+    
     place_type = Column(Enum(PlaceType), default=PlaceType.OTHER, nullable=False)
     priority = Column(Integer, default=3)  # 1-5, default middle
     comment = Column(Text, nullable=True)
@@ -36,7 +59,12 @@ class PlacePreference(Base):
     # Relationships
     trip = relationship("Trip", back_populates="preferences")
     user = relationship("User", back_populates="preferences")
-    reactions = relationship("Reaction", back_populates="preference", cascade="all, delete-orphan")
+    reactions = relationship("Reaction", back_populates="preference", cascade="all, delete-orphan", passive_deletes=True)
+
+    @validates("country", "city", "location")
+    def _set_norm(self, key, value):
+        setattr(self, f"{key}_norm", fold_text(value))
+        return value
 
     def __repr__(self):
         return f"<PlacePreference(id={self.id}, country={self.country}, city={self.city})>"
@@ -1,11 +1,15 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 
 class RouteOption(Base):
     __tablename__ = "route_options"
+    __table_args__ = (
+        Index("ix_route_options_trip_id_option_number", "trip_id", "option_number"),
+        Index("ix_route_options_trip_id_vote_count", "trip_id", "vote_count"),  # winner lookup
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
@@ -16,12 +20,64 @@ class RouteOption(Base):
     reasoning = Column(Text, nullable=True)  # Why this route was suggested
     
     route_data = Column(JSON, nullable=True)  # Detailed itinerary data
+    # Number of votes, updated in the same transaction as votes (see app.services.votes)
+    vote_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     trip = relationship("Trip", back_populates="route_options")
-    votes = relationship("Vote", back_populates="route_option", cascade="all, delete-orphan")
+    votes = relationship("Vote", back_populates="route_option", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<RouteOption(id={self.id}, trip_id={self.trip_id}, title={self.title})>"
+
+
+class RoutePreferenceCoverage(Base):
+    """Whether a route mentions a preference. Written at generation, refreshed on preference changes."""
+    __tablename__ = "route_preference_coverage"
+    __table_args__ = (
+        UniqueConstraint('route_option_id', 'preference_id', name='uq_route_preference_coverage'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    route_option_id = Column(Integer, ForeignKey("route_options.id", ondelete="CASCADE"), nullable=False)
+    preference_id = Column(Integer, ForeignKey("place_preferences.id", ondelete="CASCADE"), nullable=False, index=True)
+    mentioned = Column(Boolean, nullable=False)
+    match_span = Column(String(255), nullable=True)  # normalized phrase found in the route text
+
+    def __repr__(self):
+        return f"<RoutePreferenceCoverage(route_option_id={self.route_option_id}, preference_id={self.preference_id}, mentioned={self.mentioned})>"
+
+
+class RouteExclusionReason(Base):
+    """AI explanation of why a preference was not included in a route (generated once, then reused)."""
+    __tablename__ = "route_exclusion_reasons"
+    __table_args__ = (
+        UniqueConstraint('route_option_id', 'preference_id', name='uq_route_exclusion_reason'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    route_option_id = Column(Integer, ForeignKey("route_options.id", ondelete="CASCADE"), nullable=False)
+    preference_id = Column(Integer, ForeignKey("place_preferences.id", ondelete="CASCADE"), nullable=False, index=True)
+    reason = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<RouteExclusionReason(route_option_id={self.route_option_id}, preference_id={self.preference_id})>"
+
+
+class RouteGenerationCache(Base):
+    """LLM route generation result keyed by a hash of the full request (prompts, model, sampling params)."""
+    __tablename__ = "route_generation_cache"
+
+    key = Column(String(64), primary_key=True)  # sha256 hex
+    model = Column(String(100), nullable=False)
+    routes = Column(JSON, nullable=False)  # [ { "title", "description", "reasoning" }, ... ]
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_hit_at = Column(DateTime, nullable=True)
+    hit_count = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<RouteGenerationCache(key={self.key[:12]}, model={self.model})>"
@@ -1,7 +1,7 @@
 import enum
 import secrets
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Date, Enum, ForeignKey, Text, UniqueConstraint
+from sqlalchemy import Column, Integer, String, DateTime, Date, Enum, ForeignKey, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -41,6 +41,8 @@ class Trip(Base):
         nullable=False
     )
     generation_count = Column(Integer, default=0)
+    # Bumped by every write in the trip (app.services.trip_events); weak ETag of trip-scoped GETs
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     created_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -48,10 +50,13 @@ class Trip(Base):
 
     # Relationships
     created_by = relationship("User", back_populates="created_trips")
-    participants = relationship("TripParticipant", back_populates="trip", cascade="all, delete-orphan")
-    preferences = relationship("PlacePreference", back_populates="trip", cascade="all, delete-orphan")
-    route_options = relationship("RouteOption", back_populates="trip", cascade="all, delete-orphan")
-    checklist = relationship("TripChecklist", back_populates="trip", uselist=False, cascade="all, delete-orphan")
+    # passive_deletes: children are removed by ON DELETE CASCADE, not loaded and deleted one by one
+    participants = relationship("TripParticipant", back_populates="trip", cascade="all, delete-orphan", passive_deletes=True)
+    preferences = relationship("PlacePreference", back_populates="trip", cascade="all, delete-orphan", passive_deletes=True)
+    route_options = relationship("RouteOption", back_populates="trip", cascade="all, delete-orphan", passive_deletes=True)
+    checklist = relationship("TripChecklist", back_populates="trip", uselist=False, cascade="all, delete-orphan",
+                             passive_deletes=True)
+    generation_jobs = relationship("GenerationJob", back_populates="trip", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<Trip(id={self.id}, title={self.title})>"
@@ -61,6 +66,7 @@ class TripParticipant(Base):
     __tablename__ = "trip_participants"
     __table_args__ = (
         UniqueConstraint('trip_id', 'user_id', name='unique_trip_user'),
+        Index("ix_trip_participants_user_id_trip_id", "user_id", "trip_id"),  # trips of a user
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -21,6 +21,8 @@ class Vote(Base):
     # Unique constraint: one vote per user per route option
     __table_args__ = (
         UniqueConstraint('user_id', 'route_option_id', name='uq_user_route_vote'),
+        Index("ix_votes_trip_id_user_id", "trip_id", "user_id"),  # my-votes
+        Index("ix_votes_route_option_id", "route_option_id"),  # vote counts per route
     )
 
     def __repr__(self):
@@ -0,0 +1,21 @@
+"""Rebuild route vote counters from the votes table: `python -m app.reconcile_votes [--trip-id N]`."""
+import argparse
+import asyncio
+from app.database import SessionLocal, engine
+from app.services.votes import reconcile_vote_counts
+
+
+async def main(trip_id: int | None) -> None:
+    try:
+        async with SessionLocal() as db:
+            corrected = await reconcile_vote_counts(db, trip_id)
+        print(f"Corrected vote counts of {corrected} route(s)")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TripTogether vote counter reconciliation")
+    parser.add_argument("--trip-id", type=int, default=None, help="only routes of this trip")
+    args = parser.parse_args()
+    asyncio.run(main(args.trip_id))
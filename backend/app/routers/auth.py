@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.models.user import User
 from app.schemas.user import (
@@ -10,24 +11,31 @@ from app.schemas.user import (
     RefreshTokenRequest
 )
 from app.utils.security import (
-    hash_password, 
-    verify_password, 
     create_tokens,
     decode_token
 )
-from app.utils.deps import get_current_user
+from app.services.password_hasher import hash_password_async, verify_password_async, PasswordHasherBusy
+from app.utils.deps import get_current_user, Principal
 
 router = APIRouter()
 
 
+def _hasher_busy_error(e: PasswordHasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """
     Register a new user.
     Returns access and refresh tokens on success.
     """
     # Check if email already exists
-    existing_email = db.query(User).filter(User.email == user_data.email).first()
+    existing_email = (await db.execute(select(User).filter(User.email == user_data.email))).scalars().first()
     if existing_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -35,15 +43,18 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Check if username already exists
-    existing_username = db.query(User).filter(User.username == user_data.username).first()
+    existing_username = (await db.execute(select(User).filter(User.username == user_data.username))).scalars().first()
     if existing_username:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Это имя пользователя уже занято"
         )
     
-    # Create new user
-    hashed_pw = hash_password(user_data.password)
+    # Create new user (bcrypt is CPU-bound: runs in the password hasher processes)
+    try:
+        hashed_pw = await hash_password_async(user_data.password)
+    except PasswordHasherBusy as e:
+        raise _hasher_busy_error(e)
     new_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -51,22 +62,29 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # Return tokens
     return create_tokens(new_user.id)
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """
     Login with email and password.
     Returns access and refresh tokens on success.
     """
-    user = db.query(User).filter(User.email == credentials.email).first()
+    user = (await db.execute(select(User).filter(User.email == credentials.email))).scalars().first()
     
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        try:
+            valid, new_hash = await verify_password_async(credentials.password, user.hashed_password)
+        except PasswordHasherBusy as e:
+            raise _hasher_busy_error(e)
+    
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль"
@@ -78,11 +96,16 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
             detail="Аккаунт деактивирован"
         )
     
+    # Hash made with another bcrypt cost (BCRYPT_ROUNDS changed): store the upgraded one
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    
     return create_tokens(user.id)
 
 
 @router.post("/refresh", response_model=TokenResponse)
-def refresh_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+async def refresh_token(request: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
     """
     Refresh access token using refresh token.
     Returns new access and refresh tokens.
@@ -102,7 +125,7 @@ def refresh_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
         )
     
     user_id = int(payload.get("sub"))
-    user = db.query(User).filter(User.id == user_id, User.is_active == True).first()
+    user = (await db.execute(select(User).filter(User.id == user_id, User.is_active == True))).scalars().first()
     
     if not user:
         raise HTTPException(
@@ -114,7 +137,7 @@ def refresh_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=UserResponse)
-def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: Principal = Depends(get_current_user)):
     """
     Get current authenticated user info.
     """
@@ -0,0 +1,92 @@
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel
+from app.database import get_db
+from app.schemas.trip import TripDetailResponse, ParticipantResponse
+from app.schemas.preference import PreferenceResponse
+from app.schemas.route import RouteOptionResponse
+from app.schemas.checklist import ChecklistResponse
+from app.routers.trips import list_participants, trip_detail
+from app.routers.preferences import list_preferences
+from app.routers.reactions import list_trip_reactions, PreferenceReactionsResponse
+from app.routers.routes import list_routes
+from app.routers.votes import my_vote_ids, pick_winner_id, VotingResultItem, VotingResultsResponse
+from app.routers.checklist import load_checklist
+from app.utils.deps import get_trip_read_access, TripAccess
+
+router = APIRouter()
+
+DashboardSection = Literal[
+    "trip", "participants", "preferences", "reactions", "routes", "my_votes", "voting_results", "checklist"
+]
+
+
+class TripDashboardResponse(BaseModel):
+    """Trip page data in one response. Sections that were not requested are null."""
+    trip: Optional[TripDetailResponse] = None
+    participants: Optional[List[ParticipantResponse]] = None
+    preferences: Optional[List[PreferenceResponse]] = None
+    reactions: Optional[List[PreferenceReactionsResponse]] = None
+    routes: Optional[List[RouteOptionResponse]] = None
+    my_votes: Optional[List[int]] = None  # route option ids
+    voting_results: Optional[VotingResultsResponse] = None
+    checklist: Optional[ChecklistResponse] = None
+
+
+def _voting_results_from_routes(routes: List[RouteOptionResponse]) -> List[VotingResultItem]:
+    """Same order as GET voting-results: most voted first, then by option number."""
+    return [
+        VotingResultItem(route_option_id=r.id, title=r.title, vote_count=r.vote_count)
+        for r in sorted(routes, key=lambda r: (-r.vote_count, r.option_number))
+    ]
+
+
+@router.get("/{trip_id}/dashboard", response_model=TripDashboardResponse)
+async def get_trip_dashboard(
+    trip_id: int,
+    include: Optional[List[DashboardSection]] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_read_access)
+):
+    """Everything the trip page shows, behind a single access check.
+
+    `include` (repeatable, e.g. ?include=routes&include=my_votes) limits the response
+    to the given sections; by default all are returned. One query per section at most:
+    voting results are derived from the routes, participants are shared with the trip.
+    """
+    sections = set(include) if include else set(DashboardSection.__args__)
+    response = TripDashboardResponse()
+
+    if sections & {"trip", "participants"}:
+        participants = await list_participants(trip_id, db)
+        if "trip" in sections:
+            response.trip = trip_detail(access.trip, participants)
+        if "participants" in sections:
+            response.participants = participants
+
+    if "preferences" in sections:
+        response.preferences = await list_preferences(trip_id, db)
+
+    if "reactions" in sections:
+        response.reactions = await list_trip_reactions(trip_id, access.user.id, db)
+
+    if sections & {"routes", "voting_results"}:
+        routes = await list_routes(trip_id, db)
+        if "routes" in sections:
+            response.routes = routes
+        if "voting_results" in sections:
+            result_items = _voting_results_from_routes(routes)
+            response.voting_results = VotingResultsResponse(
+                results=result_items,
+                is_finished=False,
+                winner_id=pick_winner_id(result_items)
+            )
+
+    if "my_votes" in sections:
+        response.my_votes = await my_vote_ids(trip_id, access.user.id, db)
+
+    if "checklist" in sections:
+        response.checklist = await load_checklist(trip_id, db)
+
+    return response
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator
+from fastapi import APIRouter, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from app.config import settings
+from app.database import SessionLocal
+from app.services.trip_events import subscribe
+from app.utils.deps import resolve_trip_access, access_token_expiry
+
+router = APIRouter()
+
+# Browsers cannot set the Authorization header on EventSource / WebSocket, so the
+# access token may also be passed as ?access_token=...
+
+
+class _StreamAccess:
+    """Access of the user to an open event stream of a trip.
+
+    Checked at connect and again when the token expires; the stream is closed when that
+    check fails, when the trip is deleted or when the user leaves it.
+    """
+
+    def __init__(self, trip_id: int, token: str | None):
+        self.trip_id = trip_id
+        self.token = token
+        self.user_id: int | None = None
+        self.expires_at = 0.0
+
+    async def check(self) -> None:
+        """Raises HTTPException (401/403/404) if the user may not read the trip's events."""
+        if not self.token:
+            raise HTTPException(status_code=401, detail="Недействительный или истёкший токен")
+        # Short-lived session: the stream itself holds no database connection
+        async with SessionLocal() as db:
+            access = await resolve_trip_access(self.trip_id, self.token, db)
+        self.user_id = access.user.id
+        self.expires_at = access_token_expiry(self.token)
+
+    def wait_timeout(self) -> float:
+        """Seconds to wait for an event before a keepalive or the check at token expiry."""
+        return max(min(settings.trip_events_keepalive, self.expires_at - time.time()), 0.0)
+
+    async def check_if_expired(self) -> None:
+        if time.time() >= self.expires_at:
+            await self.check()
+
+    def closing_error(self, trip_event: dict) -> HTTPException | None:
+        """Error that ends the stream after `trip_event` (the trip is gone or the user left it)."""
+        if trip_event["type"] == "trip_deleted":
+            return HTTPException(status_code=404, detail="Поездка не найдена")
+        if trip_event["type"] == "participant_left" and trip_event["data"].get("user_id") == self.user_id:
+            return HTTPException(status_code=403, detail="Вы не являетесь участником этой поездки")
+        return None
+
+
+def _bearer_token(authorization: str | None) -> str | None:
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return None
+
+
+async def _sse_events(access: _StreamAccess) -> AsyncIterator[str]:
+    with subscribe(access.trip_id) as queue:
+        yield ": connected\n\n"
+        while True:
+            try:
+                trip_event = await asyncio.wait_for(queue.get(), timeout=access.wait_timeout())
+            except asyncio.TimeoutError:
+                try:
+                    await access.check_if_expired()
+                except HTTPException:
+                    return
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {trip_event['type']}\ndata: {json.dumps(trip_event, ensure_ascii=False)}\n\n"
+            if access.closing_error(trip_event) is not None:
+                return
+
+
+@router.get("/{trip_id}/events")
+async def trip_events(
+    trip_id: int,
+    access_token: str | None = Query(None, description="Токен, если нельзя передать заголовок Authorization"),
+    authorization: str | None = Header(None),
+):
+    """Live trip events as Server-Sent Events (votes, reactions, preferences, participants, generation).
+
+    Each event is `{"type", "trip_id", "data"}` with the type also as the SSE event name.
+    `resync` means events were lost: reload the trip. The stream ends after `trip_deleted`,
+    after `participant_left` of the user, and when the token expires (reconnect with a new one).
+    """
+    access = _StreamAccess(trip_id, _bearer_token(authorization) or access_token)
+    await access.check()
+    return StreamingResponse(
+        _sse_events(access),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/{trip_id}/events")
+async def trip_events_ws(websocket: WebSocket, trip_id: int, access_token: str | None = None):
+    """The same events as JSON WebSocket messages.
+
+    Auth errors, at connect or later (the trip deleted, the user left, the token expired),
+    close with code 4000 + HTTP status.
+    """
+    await websocket.accept()
+    access = _StreamAccess(trip_id, _bearer_token(websocket.headers.get("authorization")) or access_token)
+    try:
+        await access.check()
+    except HTTPException as e:
+        await websocket.close(code=4000 + e.status_code, reason=str(e.detail))
+        return
+
+    with subscribe(trip_id) as queue:
+        # The client sends nothing; reading only notices that it went away
+        disconnected = asyncio.create_task(websocket.receive())
+        next_event = None
+        try:
+            while True:
+                if next_event is None:
+                    next_event = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected},
+                    timeout=access.wait_timeout(),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected in done:
+                    return
+                if next_event in done:
+                    trip_event = next_event.result()
+                    next_event = None
+                    await websocket.send_json(trip_event)
+                    error = access.closing_error(trip_event)
+                    if error is not None:
+                        raise error
+                else:
+                    await access.check_if_expired()
+                    await websocket.send_json({"type": "keepalive"})
+        except HTTPException as e:
+            await websocket.close(code=4000 + e.status_code, reason=str(e.detail))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            disconnected.cancel()
+            if next_event is not None:
+                next_event.cancel()
@@ -0,0 +1,43 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.models import GenerationJob
+from app.schemas.job import JobResponse
+from app.utils.deps import get_trip_access, TripAccess
+
+router = APIRouter()
+
+
+@router.get("/{trip_id}/jobs", response_model=List[JobResponse])
+async def get_jobs(
+    trip_id: int,
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
+):
+    """Recent generation jobs of the trip, newest first."""
+    result = await db.execute(select(GenerationJob).filter(
+        GenerationJob.trip_id == trip_id
+    ).order_by(
+        GenerationJob.created_at.desc()
+    ).limit(20))
+    return result.scalars().all()
+
+
+@router.get("/{trip_id}/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    trip_id: int,
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
+):
+    """Poll generation job status. On success `result` references the generated routes/checklist."""
+    result = await db.execute(select(GenerationJob).filter(
+        GenerationJob.id == job_id,
+        GenerationJob.trip_id == trip_id
+    ))
+    job = result.scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
@@ -1,88 +1,73 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import TypeAdapter
 from app.database import get_db
-from app.models import User, Trip, TripParticipant, PlacePreference
+from app.models import PlacePreference, RouteExclusionReason
 from app.schemas.preference import (
     PreferenceCreate,
     PreferenceUpdate,
     PreferenceResponse,
     DuplicateWarning,
+    DuplicateMatch,
+    PreferenceBatchCreate,
+    PreferenceBatchItemResult,
+    PreferenceBatchResponse,
 )
-from app.utils.deps import get_current_user
+from app.services.coverage import refresh_preference_coverage, add_preferences_coverage
+from app.services.trip_events import publish_trip_event
+from app.services.response_cache import cached_trip_response
+from app.services.duplicates import find_similar_preferences, fold_place, match_score, FoldedPlace
+from app.utils.deps import get_trip_access, get_trip_read_access, TripAccess
 from app.config import settings
 
 router = APIRouter()
 
 
-def get_trip_or_404(trip_id: int, db: Session) -> Trip:
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
-    if not trip:
-        raise HTTPException(status_code=404, detail="Поездка не найдена")
-    return trip
-
-
-def check_user_is_participant(trip_id: int, user_id: int, db: Session):
-    participant = db.query(TripParticipant).filter(
-        TripParticipant.trip_id == trip_id,
-        TripParticipant.user_id == user_id
-    ).first()
-    
-    if not participant:
-        raise HTTPException(status_code=403, detail="Вы не являетесь участником этой поездки")
-
-
-def check_duplicate_preference(
+async def check_duplicate_preference(
     trip_id: int, 
     country: str, 
     city: str, 
     location: str | None,
     exclude_id: int | None = None,
-    db: Session = None
+    db: AsyncSession = None
 ) -> DuplicateWarning:
-    """Check if a similar preference already exists."""
-    query = db.query(PlacePreference).filter(
-        PlacePreference.trip_id == trip_id,
-        PlacePreference.country.ilike(country),
-        PlacePreference.city.ilike(city),
-    )
-    
-    if location:
-        query = query.filter(PlacePreference.location.ilike(location))
-    
-    if exclude_id:
-        query = query.filter(PlacePreference.id != exclude_id)
+    """Check if a similar preference already exists (ranked near-duplicates, see app.services.duplicates)."""
+    similar = await find_similar_preferences(trip_id, country, city, location, db, exclude_id=exclude_id)
     
-    existing = query.first()
-    
-    if existing:
+    if similar:
         return DuplicateWarning(
             is_duplicate=True,
-            existing_preference_id=existing.id,
-            message=f"Похожее место уже добавлено пользователем. Возможно, стоит повысить приоритет существующего?"
+            existing_preference_id=similar[0].preference.id,
+            message=f"Похожее место уже добавлено пользователем. Возможно, стоит повысить приоритет существующего?",
+            matches=[
+                DuplicateMatch(
+                    preference_id=m.preference.id,
+                    country=m.preference.country,
+                    city=m.preference.city,
+                    location=m.preference.location,
+                    score=round(m.score, 3),
+                )
+                for m in similar
+            ],
         )
     
     return DuplicateWarning(is_duplicate=False)
 
 
-@router.get("/{trip_id}/preferences", response_model=List[PreferenceResponse])
-def get_preferences(
-    trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Get all preferences for a trip. All participants can view."""
-    get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    
-    preferences = db.query(PlacePreference).options(
+async def list_preferences(trip_id: int, db: AsyncSession) -> List[PreferenceResponse]:
+    """Trip preferences, highest priority and newest first."""
+    result = await db.execute(select(PlacePreference).options(
         joinedload(PlacePreference.user)
     ).filter(
         PlacePreference.trip_id == trip_id
     ).order_by(
         PlacePreference.priority.desc(),
         PlacePreference.created_at.desc()
-    ).all()
+    ))
+    preferences = result.scalars().all()
     
     return [
         PreferenceResponse(
@@ -102,21 +87,31 @@ def get_preferences(
     ]
 
 
+_preferences_adapter = TypeAdapter(List[PreferenceResponse])
+
+
+@router.get("/{trip_id}/preferences", response_model=List[PreferenceResponse])
+async def get_preferences(
+    trip_id: int,
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_read_access)
+):
+    """Get all preferences for a trip. All participants can view."""
+    return await cached_trip_response(access, "preferences", _preferences_adapter, lambda: list_preferences(trip_id, db))
+
+
 @router.post("/{trip_id}/preferences", response_model=PreferenceResponse, status_code=status.HTTP_201_CREATED)
-def create_preference(
+async def create_preference(
     trip_id: int,
     pref_data: PreferenceCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
 ):
     """Add a new preference to a trip."""
-    trip = get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    
     # Check preference limit
-    pref_count = db.query(PlacePreference).filter(
+    pref_count = await db.scalar(select(func.count(PlacePreference.id)).filter(
         PlacePreference.trip_id == trip_id
-    ).count()
+    ))
     
     if pref_count >= settings.max_preferences_per_trip:
         raise HTTPException(
@@ -127,7 +122,7 @@ def create_preference(
     # Create preference
     preference = PlacePreference(
         trip_id=trip_id,
-        user_id=current_user.id,
+        user_id=access.user.id,
         country=pref_data.country,
         city=pref_data.city,
         location=pref_data.location,
@@ -137,14 +132,19 @@ def create_preference(
     )
     
     db.add(preference)
-    db.commit()
-    db.refresh(preference)
+    await db.flush()
+    await refresh_preference_coverage(preference, db)
+    await publish_trip_event(trip_id, "preference_created", {
+        "preference_id": preference.id, "user_id": access.user.id,
+    }, db)
+    await db.commit()
+    await db.refresh(preference)
     
     return PreferenceResponse(
         id=preference.id,
         trip_id=preference.trip_id,
         user_id=preference.user_id,
-        username=current_user.username,
+        username=access.user.username,
         country=preference.country,
         city=preference.city,
         location=preference.location,
@@ -155,18 +155,110 @@ def create_preference(
     )
 
 
+@router.post("/{trip_id}/preferences:batch", response_model=PreferenceBatchResponse)
+async def create_preferences_batch(
+    trip_id: int,
+    batch: PreferenceBatchCreate,
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
+):
+    """Add many preferences at once (e.g. import a wishlist). Results are reported per item.
+
+    Duplicates of trip preferences or of earlier items are skipped, items over the
+    per-trip limit are rejected, the rest is inserted with one multi-row INSERT.
+    """
+    # One read serves both the limit and duplicate detection (at most max_preferences_per_trip rows)
+    existing = (await db.execute(select(
+        PlacePreference.id, PlacePreference.country_norm, PlacePreference.city_norm, PlacePreference.location_norm
+    ).filter(
+        PlacePreference.trip_id == trip_id
+    ).order_by(
+        PlacePreference.id
+    ))).all()
+    free_slots = settings.max_preferences_per_trip - len(existing)
+    existing_places = [(p.id, FoldedPlace(p.country_norm, p.city_norm, p.location_norm)) for p in existing]
+    folded = [fold_place(item.country, item.city, item.location) for item in batch.items]
+    
+    results = []
+    accepted = []  # indexes of items to insert
+    repeats = {}  # index of a duplicate item -> index of the accepted item it repeats
+    # Same rule as check-duplicate; the best-scoring existing preference is reported
+    for index, place in enumerate(folded):
+        scored = [(score, pref_id) for pref_id, other in existing_places
+                  if (score := match_score(place, other)) is not None]
+        existing_id = max(scored, key=lambda s: (s[0], -s[1]))[1] if scored else None
+        earlier = next((i for i in accepted if match_score(place, folded[i]) is not None), None)
+        if existing_id is not None:
+            results.append(PreferenceBatchItemResult(
+                index=index,
+                status="duplicate",
+                existing_preference_id=existing_id,
+                message="Похожее место уже добавлено в поездку",
+            ))
+        elif earlier is not None:
+            repeats[index] = earlier
+            results.append(PreferenceBatchItemResult(
+                index=index,
+                status="duplicate",
+                message="Это место уже есть выше в списке",
+            ))
+        elif len(accepted) >= free_slots:
+            results.append(PreferenceBatchItemResult(
+                index=index,
+                status="rejected",
+                message=f"Максимум {settings.max_preferences_per_trip} пожеланий на поездку",
+            ))
+        else:
+            accepted.append(index)
+            results.append(PreferenceBatchItemResult(index=index, status="created"))
+    
+    created = []
+    if accepted:
+        created = (await db.scalars(
+            insert(PlacePreference).returning(PlacePreference, sort_by_parameter_order=True),
+            [
+                {"trip_id": trip_id, "user_id": access.user.id, **batch.items[i].model_dump()}
+                for i in accepted
+            ],
+        )).all()
+        await add_preferences_coverage(created, trip_id, db)
+        await publish_trip_event(trip_id, "preferences_created", {
+            "preference_ids": [p.id for p in created], "user_id": access.user.id,
+        }, db)
+        await db.commit()
+    
+    created_by_index = dict(zip(accepted, created))
+    for result in results:
+        if result.index in created_by_index:
+            preference = created_by_index[result.index]
+            result.preference = PreferenceResponse(
+                id=preference.id,
+                trip_id=preference.trip_id,
+                user_id=preference.user_id,
+                username=access.user.username,
+                country=preference.country,
+                city=preference.city,
+                location=preference.location,
+                place_type=preference.place_type,
+                priority=preference.priority,
+                comment=preference.comment,
+                created_at=preference.created_at,
+            )
+        elif result.index in repeats:
+            result.existing_preference_id = created_by_index[repeats[result.index]].id
+    
+    return PreferenceBatchResponse(created=len(created), results=results)
+
+
 @router.post("/{trip_id}/preferences/check-duplicate", response_model=DuplicateWarning)
-def check_preference_duplicate(
+async def check_preference_duplicate(
     trip_id: int,
     pref_data: PreferenceCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
 ):
     """Check if a similar preference already exists (soft-merge warning)."""
-    get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    
-    return check_duplicate_preference(
+    return await check_duplicate_preference(
         trip_id=trip_id,
         country=pref_data.country,
         city=pref_data.city,
@@ -176,39 +268,47 @@ def check_preference_duplicate(
 
 
 @router.patch("/{trip_id}/preferences/{pref_id}", response_model=PreferenceResponse)
-def update_preference(
+async def update_preference(
     trip_id: int,
     pref_id: int,
     pref_data: PreferenceUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
 ):
     """Update a preference. Only the owner can update."""
-    get_trip_or_404(trip_id, db)
-    
-    preference = db.query(PlacePreference).filter(
+    result = await db.execute(select(PlacePreference).filter(
         PlacePreference.id == pref_id,
         PlacePreference.trip_id == trip_id
-    ).first()
+    ))
+    preference = result.scalars().first()
     
     if not preference:
         raise HTTPException(status_code=404, detail="Пожелание не найдено")
     
-    if preference.user_id != current_user.id:
+    if preference.user_id != access.user.id:
         raise HTTPException(status_code=403, detail="Вы можете редактировать только свои пожелания")
     
     update_data = pref_data.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(preference, field, value)
     
-    db.commit()
-    db.refresh(preference)
+    # Stored "why not included" explanations describe the old place
+    await db.execute(delete(RouteExclusionReason).filter(
+        RouteExclusionReason.preference_id == pref_id
+    ).execution_options(synchronize_session=False))
+    
+    if "location" in update_data or "city" in update_data:
+        await refresh_preference_coverage(preference, db)
+    
+    await publish_trip_event(trip_id, "preference_updated", {"preference_id": pref_id, "user_id": access.user.id}, db)
+    await db.commit()
+    await db.refresh(preference)
     
     return PreferenceResponse(
         id=preference.id,
         trip_id=preference.trip_id,
         user_id=preference.user_id,
-        username=current_user.username,
+        username=access.user.username,
         country=preference.country,
         city=preference.city,
         location=preference.location,
@@ -220,25 +320,25 @@ def update_preference(
 
 
 @router.delete("/{trip_id}/preferences/{pref_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_preference(
+async def delete_preference(
     trip_id: int,
     pref_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
 ):
     """Delete a preference. Only the owner can delete."""
-    get_trip_or_404(trip_id, db)
-    
-    preference = db.query(PlacePreference).filter(
+    result = await db.execute(select(PlacePreference).filter(
         PlacePreference.id == pref_id,
         PlacePreference.trip_id == trip_id
-    ).first()
+    ))
+    preference = result.scalars().first()
     
     if not preference:
         raise HTTPException(status_code=404, detail="Пожелание не найдено")
     
-    if preference.user_id != current_user.id:
+    if preference.user_id != access.user.id:
         raise HTTPException(status_code=403, detail="Вы можете удалять только свои пожелания")
     
-    db.delete(preference)
-    db.commit()
+    await db.delete(preference)
+    await publish_trip_event(trip_id, "preference_deleted", {"preference_id": pref_id, "user_id": access.user.id}, db)
+    await db.commit()
@@ -1,11 +1,15 @@
+import json
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from pydantic import BaseModel
-from app.database import get_db
-from app.models import User, Trip, TripParticipant, PlacePreference, Reaction
-from app.utils.deps import get_current_user
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, TypeAdapter
+from app.database import get_db, engine
+from app.models import User, TripParticipant, PlacePreference, Reaction
+from app.services.trip_events import publish_trip_event
+from app.services.response_cache import cached_trip_response
+from app.utils.deps import get_current_user, get_trip_read_access, TripAccess, Principal
 
 router = APIRouter()
 
@@ -29,21 +33,22 @@ class PreferenceReactionsResponse(BaseModel):
     reactions: List[ReactionResponse]
 
 
-def check_user_is_participant(trip_id: int, user_id: int, db: Session):
-    participant = db.query(TripParticipant).filter(
+async def check_user_is_participant(trip_id: int, user_id: int, db: AsyncSession):
+    result = await db.execute(select(TripParticipant).filter(
         TripParticipant.trip_id == trip_id,
         TripParticipant.user_id == user_id
-    ).first()
+    ))
+    participant = result.scalars().first()
     if not participant:
         raise HTTPException(status_code=403, detail="Вы не являетесь участником этой поездки")
 
 
 @router.post("/{preference_id}/reactions", status_code=status.HTTP_201_CREATED)
-def add_reaction(
+async def add_reaction(
     preference_id: int,
     reaction_data: ReactionCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Add or update reaction to a preference."""
     # Validate emoji
@@ -51,22 +56,25 @@ def add_reaction(
         raise HTTPException(status_code=400, detail=f"Недопустимый emoji. Доступные: {', '.join(AVAILABLE_EMOJIS)}")
     
     # Get preference and check access
-    preference = db.query(PlacePreference).filter(PlacePreference.id == preference_id).first()
+    preference = await db.get(PlacePreference, preference_id)
     if not preference:
         raise HTTPException(status_code=404, detail="Пожелание не найдено")
     
-    check_user_is_participant(preference.trip_id, current_user.id, db)
+    await check_user_is_participant(preference.trip_id, current_user.id, db)
     
     # Check if user already has a reaction
-    existing = db.query(Reaction).filter(
+    result = await db.execute(select(Reaction).filter(
         Reaction.preference_id == preference_id,
         Reaction.user_id == current_user.id
-    ).first()
+    ))
+    existing = result.scalars().first()
     
+    event_data = {"preference_id": preference_id, "user_id": current_user.id, "emoji": reaction_data.emoji}
     if existing:
         # Update existing reaction
         existing.emoji = reaction_data.emoji
-        db.commit()
+        await publish_trip_event(preference.trip_id, "reaction_changed", event_data, db)
+        await db.commit()
         return {"message": "Реакция обновлена"}
     
     # Create new reaction
@@ -76,87 +84,97 @@ def add_reaction(
         emoji=reaction_data.emoji
     )
     db.add(reaction)
-    db.commit()
+    await publish_trip_event(preference.trip_id, "reaction_changed", event_data, db)
+    await db.commit()
     
     return {"message": "Реакция добавлена"}
 
 
 @router.delete("/{preference_id}/reactions", status_code=status.HTTP_204_NO_CONTENT)
-def remove_reaction(
+async def remove_reaction(
     preference_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Remove user's reaction from a preference."""
-    preference = db.query(PlacePreference).filter(PlacePreference.id == preference_id).first()
+    preference = await db.get(PlacePreference, preference_id)
     if not preference:
         raise HTTPException(status_code=404, detail="Пожелание не найдено")
     
-    check_user_is_participant(preference.trip_id, current_user.id, db)
+    await check_user_is_participant(preference.trip_id, current_user.id, db)
     
-    reaction = db.query(Reaction).filter(
+    result = await db.execute(select(Reaction).filter(
         Reaction.preference_id == preference_id,
         Reaction.user_id == current_user.id
-    ).first()
+    ))
+    reaction = result.scalars().first()
     
     if reaction:
-        db.delete(reaction)
-        db.commit()
+        await db.delete(reaction)
+        await publish_trip_event(preference.trip_id, "reaction_changed", {
+            "preference_id": preference_id, "user_id": current_user.id, "emoji": None,
+        }, db)
+        await db.commit()
+
+
+def _usernames_agg():
+    """Usernames of a reaction group in reaction order: array_agg (Postgres) or a JSON array (SQLite)."""
+    if engine.dialect.name == "postgresql":
+        return func.array_agg(aggregate_order_by(User.username, Reaction.id))
+    return func.json_group_array(User.username)
+
+
+async def list_trip_reactions(trip_id: int, user_id: int, db: AsyncSession) -> List[PreferenceReactionsResponse]:
+    """Reactions of every trip preference, `user_reacted` from the point of view of `user_id`.
+
+    Grouped by preference and emoji in one query; rows are read as a stream, already in response order.
+    """
+    rows = await db.stream(select(
+        PlacePreference.id,
+        Reaction.emoji,
+        func.count(Reaction.id),
+        _usernames_agg(),
+        func.count(Reaction.id).filter(Reaction.user_id == user_id) > 0,
+    ).outerjoin(
+        Reaction, Reaction.preference_id == PlacePreference.id
+    ).outerjoin(
+        User, User.id == Reaction.user_id
+    ).filter(
+        PlacePreference.trip_id == trip_id
+    ).group_by(
+        PlacePreference.id, Reaction.emoji
+    ).order_by(
+        PlacePreference.id, func.min(Reaction.id)  # emojis in order of the first reaction
+    ))
+    
+    response = []
+    async for pref_id, emoji, count, users, user_reacted in rows:
+        if not response or response[-1].preference_id != pref_id:
+            response.append(PreferenceReactionsResponse(preference_id=pref_id, reactions=[]))
+        if emoji is None:  # preference without reactions
+            continue
+        response[-1].reactions.append(ReactionResponse(
+            emoji=emoji,
+            count=count,
+            users=json.loads(users) if isinstance(users, str) else list(users),
+            user_reacted=bool(user_reacted),
+        ))
+    
+    return response
+
+
+_reactions_adapter = TypeAdapter(List[PreferenceReactionsResponse])
 
 
 @router.get("/trips/{trip_id}/reactions", response_model=List[PreferenceReactionsResponse])
-def get_trip_reactions(
+async def get_trip_reactions(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_read_access)
 ):
     """Get all reactions for all preferences in a trip."""
-    check_user_is_participant(trip_id, current_user.id, db)
-    
-    # Get all preference IDs for this trip
-    preferences = db.query(PlacePreference.id).filter(PlacePreference.trip_id == trip_id).all()
-    pref_ids = [p.id for p in preferences]
-    
-    if not pref_ids:
-        return []
-    
-    # Get all reactions for these preferences
-    reactions = db.query(Reaction).join(User).filter(
-        Reaction.preference_id.in_(pref_ids)
-    ).all()
-    
-    # Group reactions by preference_id and emoji
-    result = {}
-    for pref_id in pref_ids:
-        result[pref_id] = {}
-    
-    for r in reactions:
-        if r.emoji not in result[r.preference_id]:
-            result[r.preference_id][r.emoji] = {
-                'count': 0,
-                'users': [],
-                'user_reacted': False
-            }
-        result[r.preference_id][r.emoji]['count'] += 1
-        result[r.preference_id][r.emoji]['users'].append(r.user.username)
-        if r.user_id == current_user.id:
-            result[r.preference_id][r.emoji]['user_reacted'] = True
-    
-    # Format response
-    response = []
-    for pref_id, emojis in result.items():
-        reactions_list = [
-            ReactionResponse(
-                emoji=emoji,
-                count=data['count'],
-                users=data['users'],
-                user_reacted=data['user_reacted']
-            )
-            for emoji, data in emojis.items()
-        ]
-        response.append(PreferenceReactionsResponse(
-            preference_id=pref_id,
-            reactions=reactions_list
-        ))
-    
-    return response
+    return await cached_trip_response(
+        access, "reactions", _reactions_adapter,
+        lambda: list_trip_reactions(trip_id, access.user.id, db),
+        per_viewer=True,  # user_reacted
+    )
@@ -1,123 +1,72 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from app.database import get_db
-from app.models import User, Trip, TripParticipant, PlacePreference, RouteOption, Vote, GenerationStatus, ParticipantRole
-from app.schemas.route import RouteOptionResponse, GenerateRoutesResponse
-from app.services.llm_service import generate_routes, explain_why_not_included
-from app.utils.deps import get_current_user
+from datetime import datetime
+from typing import AsyncIterator, List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import TypeAdapter
+from app.database import get_db, SessionLocal, dialect_insert
+from app.models import (
+    Trip, PlacePreference, RouteOption, RoutePreferenceCoverage, RouteExclusionReason,
+    GenerationStatus, JobKind, GenerationJob,
+)
+from app.schemas.route import RouteOptionResponse, WhyNotIncludedBatchRequest, WhyNotIncludedBatchResponse
+from app.schemas.job import JobResponse
+from app.services.llm_service import explain_why_not_included, explain_why_not_included_batch
+from app.services.llm_limiter import is_rate_limited, rate_limit_detail
+from app.services.generation import stream_route_generation
+from app.services.jobs import enqueue_job, start_inline_job, relay_job_events, make_worker_id
+from app.services.trip_events import publish_trip_event
+from app.services.response_cache import cached_trip_response
+from app.utils.deps import get_trip_access, get_trip_read_access, TripAccess
 from app.config import settings
-import asyncio
 import json
 
 router = APIRouter()
 
 
-def get_trip_or_404(trip_id: int, db: Session) -> Trip:
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
-    if not trip:
-        raise HTTPException(status_code=404, detail="Поездка не найдена")
-    return trip
+async def _get_route_or_404(trip_id: int, route_id: int, db: AsyncSession) -> RouteOption:
+    result = await db.execute(select(RouteOption).filter(
+        RouteOption.id == route_id,
+        RouteOption.trip_id == trip_id,
+    ))
+    route = result.scalars().first()
+    if not route:
+        raise HTTPException(status_code=404, detail="Маршрут не найден")
+    return route
 
 
-def check_user_is_participant(trip_id: int, user_id: int, db: Session) -> TripParticipant:
-    participant = db.query(TripParticipant).filter(
-        TripParticipant.trip_id == trip_id,
-        TripParticipant.user_id == user_id
-    ).first()
-    if not participant:
-        raise HTTPException(status_code=403, detail="Вы не являетесь участником этой поездки")
-    return participant
-
-
-def _normalize_for_match(s: str) -> str:
-    if not s:
-        return ""
-    for c in "*#_`[]().,-—–":
-        s = s.replace(c, " ")
-    return " ".join(s.split()).strip().lower()
-
-
-def _is_place_mentioned_in_route(route_text: str, location: str | None, city: str | None) -> bool:
-    if not route_text:
-        return False
-    text = _normalize_for_match(route_text)
-    loc = (location or "").strip()
-    cit = (city or "").strip()
-    # exact substring (location or city)
-    if loc:
-        nloc = _normalize_for_match(loc)
-        if nloc and nloc in text:
-            return True
-    if cit:
-        ncit = _normalize_for_match(cit)
-        if ncit and ncit in text:
-            return True
-    # all significant words present (handles "Санкт-Петербург" vs "Санкт Петербург" in route)
-    if loc:
-        words = [w for w in _normalize_for_match(loc).split() if len(w) >= 2]
-        if words and all(w in text for w in words):
-            return True
-    if cit:
-        words = [w for w in _normalize_for_match(cit).split() if len(w) >= 2]
-        if words and all(w in text for w in words):
-            return True
-    return False
+async def _not_in_route_ids(route: RouteOption, db: AsyncSession) -> List[int]:
+    """IDs of trip preferences the route does not mention (precomputed coverage, see app.services.coverage)."""
+    return list((await db.execute(select(
+        RoutePreferenceCoverage.preference_id
+    ).filter(
+        RoutePreferenceCoverage.route_option_id == route.id,
+        RoutePreferenceCoverage.mentioned.is_(False),
+    ).order_by(
+        RoutePreferenceCoverage.preference_id
+    ))).scalars().all())
 
 
 @router.get("/{trip_id}/routes/{route_id}/preferences-not-in-route")
-def get_preferences_not_in_route(
+async def get_preferences_not_in_route(
     trip_id: int,
     route_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_read_access),
 ):
     """Return preference IDs that are not mentioned in this route's text (for 'why not included' list)."""
-    get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    route = db.query(RouteOption).filter(
-        RouteOption.id == route_id,
-        RouteOption.trip_id == trip_id,
-    ).first()
-    if not route:
-        raise HTTPException(status_code=404, detail="Маршрут не найден")
-    route_text_parts = [route.description or "", route.reasoning or ""]
-    if getattr(route, "route_data", None) and isinstance(route.route_data, dict):
-        route_text_parts.append(json.dumps(route.route_data, ensure_ascii=False))
-    route_text = " ".join(route_text_parts)
-    prefs = db.query(PlacePreference).filter(PlacePreference.trip_id == trip_id).all()
-    not_in_route = [
-        p.id
-        for p in prefs
-        if not _is_place_mentioned_in_route(route_text, p.location, p.city)
-    ]
-    return {"preference_ids": not_in_route}
+    route = await _get_route_or_404(trip_id, route_id, db)
+    return {"preference_ids": await _not_in_route_ids(route, db)}
 
 
-@router.get("/{trip_id}/routes", response_model=List[RouteOptionResponse])
-def get_routes(
-    trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Get all generated route options for a trip."""
-    get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    
-    # Get routes with vote counts
-    routes = db.query(
-        RouteOption,
-        func.count(Vote.id).label('vote_count')
-    ).outerjoin(
-        Vote, Vote.route_option_id == RouteOption.id
-    ).filter(
+async def list_routes(trip_id: int, db: AsyncSession) -> List[RouteOptionResponse]:
+    """Generated route options of a trip by option number."""
+    routes = (await db.execute(select(RouteOption).filter(
         RouteOption.trip_id == trip_id
-    ).group_by(
-        RouteOption.id
     ).order_by(
         RouteOption.option_number
-    ).all()
+    ))).scalars().all()
     
     return [
         RouteOptionResponse(
@@ -128,35 +77,74 @@ def get_routes(
             description=route.description,
             reasoning=route.reasoning,
             created_at=route.created_at,
-            vote_count=vote_count,
+            vote_count=route.vote_count,
+            route_data=route.route_data,
         )
-        for route, vote_count in routes
+        for route in routes
     ]
 
 
+_routes_adapter = TypeAdapter(List[RouteOptionResponse])
+
+
+@router.get("/{trip_id}/routes", response_model=List[RouteOptionResponse])
+async def get_routes(
+    trip_id: int,
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_read_access)
+):
+    """Get all generated route options for a trip."""
+    return await cached_trip_response(access, "routes", _routes_adapter, lambda: list_routes(trip_id, db))
+
+
+async def _stored_reasons(route_id: int, preference_ids: List[int], db: AsyncSession) -> dict[int, str]:
+    if not preference_ids:
+        return {}
+    rows = (await db.execute(select(RouteExclusionReason.preference_id, RouteExclusionReason.reason).filter(
+        RouteExclusionReason.route_option_id == route_id,
+        RouteExclusionReason.preference_id.in_(preference_ids),
+    ))).all()
+    return {pref_id: reason for pref_id, reason in rows}
+
+
+async def _store_reasons(route_id: int, reasons: dict[int, str], db: AsyncSession) -> None:
+    if not reasons:
+        return
+    now = datetime.utcnow()
+    # Reasons stored concurrently by another request are kept; the rest of the batch is still saved
+    await db.execute(dialect_insert(RouteExclusionReason).values([
+        {"route_option_id": route_id, "preference_id": pref_id, "reason": reason, "created_at": now}
+        for pref_id, reason in reasons.items()
+    ]).on_conflict_do_nothing(index_elements=["route_option_id", "preference_id"]))
+    await db.commit()
+
+
+def _why_not_included_error(e: Exception) -> HTTPException:
+    if is_rate_limited(e):
+        return HTTPException(status_code=429, detail=rate_limit_detail(e))
+    return HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{trip_id}/routes/{route_id}/why-not-included")
 async def get_why_not_included(
     trip_id: int,
     route_id: int,
     preference_id: int = Query(..., description="ID пожелания (места)"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access),
 ):
     """Get a short AI explanation of why a place (preference) was not included in this route."""
-    get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    route = db.query(RouteOption).filter(
-        RouteOption.id == route_id,
-        RouteOption.trip_id == trip_id,
-    ).first()
-    if not route:
-        raise HTTPException(status_code=404, detail="Маршрут не найден")
-    pref = db.query(PlacePreference).filter(
+    route = await _get_route_or_404(trip_id, route_id, db)
+    result = await db.execute(select(PlacePreference).filter(
         PlacePreference.id == preference_id,
         PlacePreference.trip_id == trip_id,
-    ).first()
+    ))
+    pref = result.scalars().first()
     if not pref:
         raise HTTPException(status_code=404, detail="Пожелание не найдено")
+    stored = await _stored_reasons(route.id, [pref.id], db)
+    if pref.id in stored:
+        return {"reason": stored[pref.id]}
     place_name = (pref.location or "").strip() or f"{pref.city}"
     try:
         reason = await explain_why_not_included(
@@ -168,24 +156,65 @@ async def get_why_not_included(
             priority=pref.priority or 3,
             comment=pref.comment,
         )
-        return {"reason": reason}
     except Exception as e:
-        err = str(e).lower()
-        if "429" in err or "лимит" in err:
-            raise HTTPException(status_code=429, detail=str(e))
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _why_not_included_error(e)
+    await _store_reasons(route.id, {pref.id: reason}, db)
+    return {"reason": reason}
 
 
-@router.post("/{trip_id}/generate-routes", response_model=GenerateRoutesResponse)
-async def generate_trip_routes(
+@router.post("/{trip_id}/routes/{route_id}/why-not-included", response_model=WhyNotIncludedBatchResponse)
+async def get_why_not_included_batch(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    route_id: int,
+    request: WhyNotIncludedBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access),
 ):
-    """Generate route options using LLM. Requires at least 1 preference."""
-    trip = get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    
+    """Explanations for many preferences at once (default: all not mentioned in the route).
+
+    Already stored reasons are returned as is; the rest are generated in one LLM call and stored.
+    """
+    route = await _get_route_or_404(trip_id, route_id, db)
+    if request.preference_ids is None:
+        wanted = await _not_in_route_ids(route, db)
+    else:
+        wanted = request.preference_ids
+    prefs = (await db.execute(select(PlacePreference).filter(
+        PlacePreference.trip_id == trip_id,
+        PlacePreference.id.in_(wanted),
+    ).order_by(PlacePreference.id))).scalars().all() if wanted else []
+
+    reasons = await _stored_reasons(route.id, [p.id for p in prefs], db)
+    missing = [p for p in prefs if p.id not in reasons]
+    if missing:
+        try:
+            generated = await explain_why_not_included_batch(
+                route_title=route.title,
+                route_description=route.description or "",
+                places=[
+                    {
+                        "id": p.id,
+                        "place_name": (p.location or "").strip() or f"{p.city}",
+                        "country": p.country or "",
+                        "city": p.city or "",
+                        "priority": p.priority or 3,
+                        "comment": p.comment,
+                    }
+                    for p in missing
+                ],
+            )
+        except Exception as e:
+            raise _why_not_included_error(e)
+        await _store_reasons(route.id, generated, db)
+        reasons.update(generated)
+
+    return WhyNotIncludedBatchResponse(
+        reasons={p.id: reasons.get(p.id, "Не удалось сформировать объяснение.") for p in prefs}
+    )
+
+
+async def _start_route_generation(trip: Trip, db: AsyncSession) -> Trip:
+    """Validate that routes can be generated and mark the trip IN_PROGRESS (not committed yet)."""
     # Check generation limit
     if trip.generation_count >= settings.max_generation_count:
         raise HTTPException(
@@ -200,93 +229,67 @@ async def generate_trip_routes(
             detail="Генерация маршрутов уже выполняется"
         )
     
-    # Get preferences with user data
-    preferences = db.query(PlacePreference).options(
-        joinedload(PlacePreference.user)
-    ).filter(
-        PlacePreference.trip_id == trip_id
-    ).all()
+    has_preferences = (await db.execute(select(PlacePreference.id).filter(
+        PlacePreference.trip_id == trip.id
+    ).limit(1))).first()
     
-    if not preferences:
+    if not has_preferences:
         raise HTTPException(
             status_code=400,
             detail="Добавьте хотя бы одно пожелание для генерации маршрутов"
         )
     
-    # Update trip status
     trip.generation_status = GenerationStatus.IN_PROGRESS
-    db.commit()
-    
-    try:
-        # Generate routes using LLM
-        route_data = await generate_routes(trip, preferences)
-        
-        # Delete old routes and votes
-        db.query(RouteOption).filter(RouteOption.trip_id == trip_id).delete()
-        
-        # Save new routes
-        new_routes = []
-        for i, data in enumerate(route_data, 1):
-            route = RouteOption(
-                trip_id=trip_id,
-                option_number=i,
-                title=data["title"],
-                description=data["description"],
-                reasoning=data.get("reasoning"),
-            )
-            db.add(route)
-            new_routes.append(route)
-        
-        # Update trip status
-        trip.generation_status = GenerationStatus.COMPLETED
-        trip.generation_count += 1
-        db.commit()
-        
-        # Refresh to get IDs
-        for route in new_routes:
-            db.refresh(route)
-        
-        return GenerateRoutesResponse(
-            status="success",
-            message=f"Сгенерировано {len(new_routes)} вариантов маршрута",
-            routes=[
-                RouteOptionResponse(
-                    id=r.id,
-                    trip_id=r.trip_id,
-                    option_number=r.option_number,
-                    title=r.title,
-                    description=r.description,
-                    reasoning=r.reasoning,
-                    created_at=r.created_at,
-                    vote_count=0,
-                )
-                for r in new_routes
-            ]
-        )
-        
-    except Exception as e:
-        trip.generation_status = GenerationStatus.FAILED
-        db.commit()
-        
-        # Handle DeepSeek API errors
-        error_str = str(e)
-        if "insufficient_quota" in error_str or "429" in error_str:
-            raise HTTPException(
-                status_code=429,
-                detail="Превышен лимит использования DeepSeek API. Пожалуйста, проверьте баланс и настройки API ключа."
-            )
-        elif "rate_limit" in error_str.lower() or "rate limit" in error_str.lower():
-            raise HTTPException(
-                status_code=429,
-                detail="Превышен лимит запросов к DeepSeek API. Пожалуйста, подождите немного и попробуйте снова."
-            )
-        elif "invalid_api_key" in error_str.lower() or "authentication" in error_str.lower():
-            raise HTTPException(
-                status_code=500,
-                detail="Ошибка аутентификации DeepSeek API. Пожалуйста, проверьте настройки API ключа."
-            )
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Ошибка генерации маршрутов: {str(e)}"
-            )
+    await publish_trip_event(trip.id, "generation_status", {"status": trip.generation_status}, db)
+    return trip
+
+
+@router.post("/{trip_id}/generate-routes", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def generate_trip_routes(
+    trip_id: int,
+    force: bool = Query(False, description="Не брать результат из кэша, всегда вызывать LLM"),
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
+):
+    """Queue route generation using LLM. Requires at least 1 preference. Poll the returned job for status."""
+    await _start_route_generation(access.trip, db)
+    # Trip status and job are committed together
+    return await enqueue_job(JobKind.GENERATE_ROUTES, trip_id, access.user.id, db, params={"force": force})
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _route_generation_events(trip_id: int, job_id: int, worker_id: str, force: bool) -> AsyncIterator[str]:
+    # Own session: the request-scoped one is closed before the response body is streamed
+    async with SessionLocal() as db:
+        job = await db.get(GenerationJob, job_id)
+        yield _sse("job", {"job_id": job.id})
+        events = stream_route_generation(trip_id, db, force=force)
+        async for event, data in relay_job_events(job, worker_id, events, db):
+            yield _sse(event, data)
+
+
+@router.post("/{trip_id}/generate-routes/stream")
+async def generate_trip_routes_stream(
+    trip_id: int,
+    force: bool = Query(False, description="Не брать результат из кэша, всегда вызывать LLM"),
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
+):
+    """Generate routes and stream them as Server-Sent Events while the LLM writes them.
+
+    Events: `job` (job id), `route` (one per option, as soon as its block is complete),
+    `done` (saved route ids) or `error` (status_code, detail).
+    """
+    await _start_route_generation(access.trip, db)
+    worker_id = make_worker_id("stream")
+    job = await start_inline_job(
+        JobKind.GENERATE_ROUTES, trip_id, access.user.id, worker_id, db, params={"force": force}
+    )
+    return StreamingResponse(
+        _route_generation_events(trip_id, job.id, worker_id, force),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
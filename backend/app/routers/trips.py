@@ -1,9 +1,10 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, Integer, case
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func, Integer, case
 from app.database import get_db
-from app.models import User, Trip, TripParticipant, ParticipantRole
+from app.models import Trip, TripParticipant, ParticipantRole
 from app.schemas.trip import (
     TripCreate,
     TripUpdate,
@@ -13,45 +14,62 @@ from app.schemas.trip import (
     ParticipantResponse,
     JoinTripRequest,
 )
-from app.utils.deps import get_current_user
+from app.utils.deps import (
+    get_current_user,
+    Principal,
+    get_trip_access,
+    get_trip_read_access,
+    get_trip_organizer_access,
+    TripAccess,
+    forget_trip,
+    forget_trip_member,
+)
+from app.services.trip_events import publish_trip_event
 from app.config import settings
 
 router = APIRouter()
 
 
-def get_trip_or_404(trip_id: int, db: Session) -> Trip:
-    """Get trip by ID or raise 404."""
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
-    if not trip:
-        raise HTTPException(status_code=404, detail="Поездка не найдена")
-    return trip
-
-
-def check_user_is_participant(trip: Trip, user: User, db: Session) -> TripParticipant:
-    """Check if user is a participant of the trip."""
-    participant = db.query(TripParticipant).filter(
-        TripParticipant.trip_id == trip.id,
-        TripParticipant.user_id == user.id
-    ).first()
-    
-    if not participant:
-        raise HTTPException(status_code=403, detail="Вы не являетесь участником этой поездки")
+async def list_participants(trip_id: int, db: AsyncSession) -> List[ParticipantResponse]:
+    """Trip participants in join order."""
+    result = await db.execute(select(TripParticipant).options(
+        joinedload(TripParticipant.user)
+    ).filter(TripParticipant.trip_id == trip_id).order_by(TripParticipant.id))
     
-    return participant
+    return [
+        ParticipantResponse(
+            id=p.id,
+            user_id=p.user_id,
+            username=p.user.username,
+            role=p.role,
+            joined_at=p.joined_at,
+        )
+        for p in result.scalars().all()
+    ]
 
 
-def check_user_is_organizer(trip: Trip, user: User, db: Session):
-    """Check if user is the organizer of the trip."""
-    participant = check_user_is_participant(trip, user, db)
-    if participant.role != ParticipantRole.ORGANIZER:
-        raise HTTPException(status_code=403, detail="Только организатор может выполнить это действие")
+def trip_detail(trip: Trip, participants: List[ParticipantResponse]) -> TripDetailResponse:
+    return TripDetailResponse(
+        id=trip.id,
+        title=trip.title,
+        description=trip.description,
+        start_date=trip.start_date,
+        end_date=trip.end_date,
+        invite_code=trip.invite_code,
+        generation_status=trip.generation_status,
+        generation_count=trip.generation_count,
+        created_by_id=trip.created_by_id,
+        created_at=trip.created_at,
+        participants=participants,
+        max_generation_count=settings.max_generation_count,
+    )
 
 
 @router.post("", response_model=TripResponse, status_code=status.HTTP_201_CREATED)
-def create_trip(
+async def create_trip(
     trip_data: TripCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Create a new trip. The creator becomes the organizer."""
     # Create trip
@@ -63,7 +81,7 @@ def create_trip(
         created_by_id=current_user.id,
     )
     db.add(trip)
-    db.flush()  # Get trip.id
+    await db.flush()  # Get trip.id
     
     # Add creator as organizer
     participant = TripParticipant(
@@ -72,27 +90,27 @@ def create_trip(
         role=ParticipantRole.ORGANIZER,
     )
     db.add(participant)
-    db.commit()
-    db.refresh(trip)
+    await db.commit()
+    await db.refresh(trip)
     
     return trip
 
 
 @router.get("", response_model=List[TripListResponse])
-def get_my_trips(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_my_trips(
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get all trips where the current user is a participant."""
     # Get trips where user is participant
     user_trips = (
-        db.query(TripParticipant.trip_id, TripParticipant.role)
+        select(TripParticipant.trip_id, TripParticipant.role)
         .filter(TripParticipant.user_id == current_user.id)
         .subquery()
     )
     
-    trips_with_counts = (
-        db.query(
+    trips_with_counts = (await db.execute(
+        select(
             Trip,
             func.count(TripParticipant.id).label('participant_count'),
             user_trips.c.role
@@ -101,8 +119,7 @@ def get_my_trips(
         .join(TripParticipant, Trip.id == TripParticipant.trip_id)
         .group_by(Trip.id, user_trips.c.role)
         .order_by(Trip.start_date.desc())
-        .all()
-    )
+    )).all()
     
     result = []
     for trip, participant_count, role in trips_with_counts:
@@ -121,109 +138,82 @@ def get_my_trips(
 
 
 @router.get("/{trip_id}", response_model=TripDetailResponse)
-def get_trip(
+async def get_trip(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_read_access)
 ):
     """Get trip details. Only participants can view."""
-    trip = db.query(Trip).options(
-        joinedload(Trip.participants).joinedload(TripParticipant.user)
-    ).filter(Trip.id == trip_id).first()
-    
-    if not trip:
-        raise HTTPException(status_code=404, detail="Поездка не найдена")
-    
-    check_user_is_participant(trip, current_user, db)
-    
-    # Build participants response
-    participants = []
-    for p in trip.participants:
-        participants.append(ParticipantResponse(
-            id=p.id,
-            user_id=p.user_id,
-            username=p.user.username,
-            role=p.role,
-            joined_at=p.joined_at,
-        ))
-    
-    return TripDetailResponse(
-        id=trip.id,
-        title=trip.title,
-        description=trip.description,
-        start_date=trip.start_date,
-        end_date=trip.end_date,
-        invite_code=trip.invite_code,
-        generation_status=trip.generation_status,
-        generation_count=trip.generation_count,
-        created_by_id=trip.created_by_id,
-        created_at=trip.created_at,
-        participants=participants,
-        max_generation_count=settings.max_generation_count,
-    )
+    return trip_detail(access.trip, await list_participants(trip_id, db))
 
 
 @router.patch("/{trip_id}", response_model=TripResponse)
-def update_trip(
+async def update_trip(
     trip_id: int,
     trip_data: TripUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_organizer_access)
 ):
     """Update trip. Only the organizer can update."""
-    trip = get_trip_or_404(trip_id, db)
-    check_user_is_organizer(trip, current_user, db)
+    trip = access.trip
     
     update_data = trip_data.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(trip, field, value)
     
-    db.commit()
-    db.refresh(trip)
+    await publish_trip_event(trip_id, "trip_updated", {"fields": sorted(update_data)}, db)
+    await db.commit()
+    await db.refresh(trip)
     return trip
 
 
 @router.delete("/{trip_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_trip(
+async def delete_trip(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_organizer_access)
 ):
-    """Delete trip. Only the organizer can delete."""
-    trip = get_trip_or_404(trip_id, db)
-    check_user_is_organizer(trip, current_user, db)
-    
-    db.delete(trip)
-    db.commit()
+    """Delete trip. Only the organizer can delete.
+
+    One DELETE: participants, preferences, routes, votes, reactions etc. go by ON DELETE CASCADE.
+    """
+    await db.execute(delete(Trip).filter(
+        Trip.id == trip_id
+    ).execution_options(synchronize_session=False))
+    await publish_trip_event(trip_id, "trip_deleted", {}, db)
+    await db.commit()
+    forget_trip(trip_id)
 
 
 # --- Invite / Join / Leave ---
 
 @router.post("/join", response_model=TripResponse)
-def join_trip(
+async def join_trip(
     request: JoinTripRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Join a trip using invite code."""
-    trip = db.query(Trip).filter(Trip.invite_code == request.invite_code).first()
+    result = await db.execute(select(Trip).filter(Trip.invite_code == request.invite_code))
+    trip = result.scalars().first()
     
     if not trip:
         raise HTTPException(status_code=404, detail="Недействительный код приглашения")
     
     # Check if already a participant
-    existing = db.query(TripParticipant).filter(
+    result = await db.execute(select(TripParticipant).filter(
         TripParticipant.trip_id == trip.id,
         TripParticipant.user_id == current_user.id
-    ).first()
+    ))
+    existing = result.scalars().first()
     
     if existing:
         raise HTTPException(status_code=400, detail="Вы уже являетесь участником этой поездки")
     
     # Check participant limit
-    participant_count = db.query(TripParticipant).filter(
+    participant_count = await db.scalar(select(func.count(TripParticipant.id)).filter(
         TripParticipant.trip_id == trip.id
-    ).count()
+    ))
     
     if participant_count >= settings.max_participants_per_trip:
         raise HTTPException(status_code=400, detail="Достигнуто максимальное количество участников")
@@ -235,53 +225,43 @@ def join_trip(
         role=ParticipantRole.PARTICIPANT,
     )
     db.add(participant)
-    db.commit()
-    db.refresh(trip)
+    await publish_trip_event(trip.id, "participant_joined", {
+        "user_id": current_user.id, "username": current_user.username,
+    }, db)
+    await db.commit()
+    forget_trip_member(trip.id, current_user.id)
+    await db.refresh(trip)
     
     return trip
 
 
 @router.post("/{trip_id}/leave", status_code=status.HTTP_204_NO_CONTENT)
-def leave_trip(
+async def leave_trip(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
 ):
     """Leave a trip. Organizer cannot leave."""
-    trip = get_trip_or_404(trip_id, db)
-    participant = check_user_is_participant(trip, current_user, db)
-    
-    if participant.role == ParticipantRole.ORGANIZER:
+    if access.is_organizer:
         raise HTTPException(
             status_code=400, 
             detail="Организатор не может покинуть поездку. Удалите поездку."
         )
     
-    db.delete(participant)
-    db.commit()
+    await db.execute(delete(TripParticipant).filter(
+        TripParticipant.trip_id == trip_id,
+        TripParticipant.user_id == access.user.id
+    ))
+    await publish_trip_event(trip_id, "participant_left", {"user_id": access.user.id}, db)
+    await db.commit()
+    forget_trip_member(trip_id, access.user.id)
 
 
 @router.get("/{trip_id}/participants", response_model=List[ParticipantResponse])
-def get_participants(
+async def get_participants(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_read_access)
 ):
     """Get all participants of a trip."""
-    trip = get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip, current_user, db)
-    
-    participants = db.query(TripParticipant).options(
-        joinedload(TripParticipant.user)
-    ).filter(TripParticipant.trip_id == trip_id).all()
-    
-    return [
-        ParticipantResponse(
-            id=p.id,
-            user_id=p.user_id,
-            username=p.user.username,
-            role=p.role,
-            joined_at=p.joined_at,
-        )
-        for p in participants
-    ]
+    return await list_participants(trip_id, db)
@@ -1,11 +1,15 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from pydantic import BaseModel
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, TypeAdapter
 from app.database import get_db
-from app.models import User, Trip, TripParticipant, RouteOption, Vote, GenerationStatus, ParticipantRole
-from app.utils.deps import get_current_user
+from app.models import RouteOption, Vote, GenerationStatus
+from app.services.votes import change_vote_count, replace_ballot
+from app.services.trip_events import publish_trip_event
+from app.services.response_cache import cached_trip_response
+from app.utils.deps import get_trip_access, get_trip_read_access, TripAccess
 
 router = APIRouter()
 
@@ -24,6 +28,10 @@ class MyVotesResponse(BaseModel):
     route_option_ids: List[int]
 
 
+class BallotRequest(BaseModel):
+    route_option_ids: List[int]  # all options the user approves; [] withdraws every vote
+
+
 class VotingResultItem(BaseModel):
     route_option_id: int
     title: str
@@ -36,52 +44,76 @@ class VotingResultsResponse(BaseModel):
     winner_id: int | None = None
 
 
-def get_trip_or_404(trip_id: int, db: Session) -> Trip:
-    trip = db.query(Trip).filter(Trip.id == trip_id).first()
-    if not trip:
-        raise HTTPException(status_code=404, detail="Поездка не найдена")
-    return trip
+class BallotResponse(BaseModel):
+    route_option_ids: List[int]
+    results: List[VotingResultItem]
+    winner_id: int | None = None
 
 
-def check_user_is_participant(trip_id: int, user_id: int, db: Session):
-    participant = db.query(TripParticipant).filter(
-        TripParticipant.trip_id == trip_id,
-        TripParticipant.user_id == user_id
-    ).first()
-    if not participant:
-        raise HTTPException(status_code=403, detail="Вы не являетесь участником этой поездки")
-    return participant
+async def voting_results(trip_id: int, db: AsyncSession) -> List[VotingResultItem]:
+    """Route options of the trip by vote count, most voted first."""
+    results = (await db.execute(select(
+        RouteOption.id,
+        RouteOption.title,
+        RouteOption.vote_count
+    ).filter(
+        RouteOption.trip_id == trip_id
+    ).order_by(
+        RouteOption.vote_count.desc(),
+        RouteOption.option_number
+    ))).all()
+    
+    return [
+        VotingResultItem(
+            route_option_id=r[0],
+            title=r[1],
+            vote_count=r[2]
+        )
+        for r in results
+    ]
+
+
+def pick_winner_id(results: List[VotingResultItem]) -> int | None:
+    return results[0].route_option_id if results and results[0].vote_count > 0 else None
+
+
+async def my_vote_ids(trip_id: int, user_id: int, db: AsyncSession) -> List[int]:
+    """Route options the user voted for."""
+    votes = (await db.execute(select(Vote.route_option_id).filter(
+        Vote.trip_id == trip_id,
+        Vote.user_id == user_id
+    ))).all()
+    return [v[0] for v in votes]
 
 
 @router.post("/{trip_id}/votes", response_model=VoteResponse, status_code=status.HTTP_201_CREATED)
-def vote_for_route(
+async def vote_for_route(
     trip_id: int,
     vote_data: VoteRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
 ):
     """Vote for a route option. Users can vote for multiple options."""
-    trip = get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    
     # Check if routes exist
-    if trip.generation_status != GenerationStatus.COMPLETED:
+    if access.trip.generation_status != GenerationStatus.COMPLETED:
         raise HTTPException(status_code=400, detail="Маршруты ещё не сгенерированы")
     
     # Verify route belongs to this trip
-    route = db.query(RouteOption).filter(
+    result = await db.execute(select(RouteOption).filter(
         RouteOption.id == vote_data.route_option_id,
         RouteOption.trip_id == trip_id
-    ).first()
+    ))
+    route = result.scalars().first()
     
     if not route:
         raise HTTPException(status_code=404, detail="Вариант маршрута не найден")
     
     # Check if already voted for this option
-    existing = db.query(Vote).filter(
-        Vote.user_id == current_user.id,
+    result = await db.execute(select(Vote).filter(
+        Vote.user_id == access.user.id,
         Vote.route_option_id == vote_data.route_option_id
-    ).first()
+    ))
+    existing = result.scalars().first()
     
     if existing:
         raise HTTPException(status_code=400, detail="Вы уже голосовали за этот вариант")
@@ -89,12 +121,19 @@ def vote_for_route(
     # Create vote
     vote = Vote(
         trip_id=trip_id,
-        user_id=current_user.id,
+        user_id=access.user.id,
         route_option_id=vote_data.route_option_id
     )
     db.add(vote)
-    db.commit()
-    db.refresh(vote)
+    await change_vote_count([route.id], 1, db)
+    await publish_trip_event(trip_id, "votes_changed", {"user_id": access.user.id}, db)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Same vote committed concurrently (double click)
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Вы уже голосовали за этот вариант")
+    await db.refresh(vote)
     
     return VoteResponse(
         id=vote.id,
@@ -104,83 +143,88 @@ def vote_for_route(
 
 
 @router.delete("/{trip_id}/votes/{route_id}", status_code=status.HTTP_204_NO_CONTENT)
-def remove_vote(
+async def remove_vote(
     trip_id: int,
     route_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
 ):
-    """Remove a vote from a route option."""
-    get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    
-    vote = db.query(Vote).filter(
-        Vote.user_id == current_user.id,
+    """Remove a vote from a route option.
+
+    The counter is decremented only for a row this DELETE removed, so concurrent
+    requests for the same vote cannot both count it.
+    """
+    removed = (await db.execute(delete(Vote).filter(
+        Vote.trip_id == trip_id,
+        Vote.user_id == access.user.id,
         Vote.route_option_id == route_id
-    ).first()
+    ).returning(Vote.route_option_id).execution_options(synchronize_session=False))).scalars().all()
     
-    if not vote:
+    if not removed:
         raise HTTPException(status_code=404, detail="Голос не найден")
     
-    db.delete(vote)
-    db.commit()
+    await change_vote_count(list(removed), -1, db)
+    await publish_trip_event(trip_id, "votes_changed", {"user_id": access.user.id}, db)
+    await db.commit()
 
 
 @router.get("/{trip_id}/my-votes", response_model=MyVotesResponse)
-def get_my_votes(
+async def get_my_votes(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_read_access)
 ):
     """Get current user's votes for this trip."""
-    get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
-    
-    votes = db.query(Vote.route_option_id).filter(
-        Vote.trip_id == trip_id,
-        Vote.user_id == current_user.id
-    ).all()
-    
-    return MyVotesResponse(route_option_ids=[v[0] for v in votes])
+    return MyVotesResponse(route_option_ids=await my_vote_ids(trip_id, access.user.id, db))
 
 
-@router.get("/{trip_id}/voting-results", response_model=VotingResultsResponse)
-def get_voting_results(
+@router.put("/{trip_id}/my-votes", response_model=BallotResponse)
+async def replace_my_votes(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    ballot: BallotRequest,
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_access)
 ):
-    """Get voting results for all route options."""
-    trip = get_trip_or_404(trip_id, db)
-    check_user_is_participant(trip_id, current_user.id, db)
+    """Replace all of the current user's votes with the given options in one transaction.
+
+    Idempotent: repeating the same ballot changes nothing. Returns the new results.
+    """
+    if access.trip.generation_status != GenerationStatus.COMPLETED:
+        raise HTTPException(status_code=400, detail="Маршруты ещё не сгенерированы")
     
-    results = db.query(
-        RouteOption.id,
-        RouteOption.title,
-        func.count(Vote.id).label('vote_count')
-    ).outerjoin(
-        Vote, Vote.route_option_id == RouteOption.id
-    ).filter(
-        RouteOption.trip_id == trip_id
-    ).group_by(
-        RouteOption.id
-    ).order_by(
-        func.count(Vote.id).desc()
-    ).all()
+    await replace_ballot(trip_id, access.user.id, ballot.route_option_ids, db)
+    result_items = await voting_results(trip_id, db)
     
-    result_items = [
-        VotingResultItem(
-            route_option_id=r[0],
-            title=r[1],
-            vote_count=r[2]
-        )
-        for r in results
-    ]
+    if set(ballot.route_option_ids) - {r.route_option_id for r in result_items}:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Вариант маршрута не найден")
     
-    winner_id = result_items[0].route_option_id if result_items and result_items[0].vote_count > 0 else None
+    await publish_trip_event(trip_id, "votes_changed", {"user_id": access.user.id}, db)
+    await db.commit()
     
-    return VotingResultsResponse(
+    return BallotResponse(
+        route_option_ids=sorted(set(ballot.route_option_ids)),
         results=result_items,
-        is_finished=False,  # Can add finish logic later
-        winner_id=winner_id
+        winner_id=pick_winner_id(result_items)
     )
+
+
+_voting_results_adapter = TypeAdapter(VotingResultsResponse)
+
+
+@router.get("/{trip_id}/voting-results", response_model=VotingResultsResponse)
+async def get_voting_results(
+    trip_id: int,
+    db: AsyncSession = Depends(get_db),
+    access: TripAccess = Depends(get_trip_read_access)
+):
+    """Get voting results for all route options."""
+    async def build() -> VotingResultsResponse:
+        result_items = await voting_results(trip_id, db)
+        return VotingResultsResponse(
+            results=result_items,
+            is_finished=False,  # Can add finish logic later
+            winner_id=pick_winner_id(result_items)
+        )
+
+    return await cached_trip_response(access, "voting_results", _voting_results_adapter, build)
@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+from app.models.job import JobKind, JobStatus
+
+
+class JobResponse(BaseModel):
+    id: int
+    kind: JobKind
+    status: JobStatus
+    trip_id: int
+    attempts: int
+    result: Optional[dict] = None  # { "route_ids": [...] } / { "checklist_id": ... } on success
+    error: Optional[str] = None
+    error_code: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -1,6 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
+from app.config import settings
 from app.models.preference import PlaceType
 
 
@@ -37,7 +38,33 @@ class PreferenceResponse(PreferenceBase):
         from_attributes = True
 
 
+class DuplicateMatch(BaseModel):
+    preference_id: int
+    country: str
+    city: str
+    location: Optional[str] = None
+    score: float  # 0..1, 1 = same name
+
+
 class DuplicateWarning(BaseModel):
     is_duplicate: bool
-    existing_preference_id: Optional[int] = None
+    existing_preference_id: Optional[int] = None  # best match
     message: Optional[str] = None
+    matches: List[DuplicateMatch] = []  # best first
+
+
+class PreferenceBatchCreate(BaseModel):
+    items: List[PreferenceCreate] = Field(..., min_length=1, max_length=settings.max_preferences_per_trip)
+
+
+class PreferenceBatchItemResult(BaseModel):
+    index: int  # position in the request
+    status: Literal["created", "duplicate", "rejected"]
+    preference: Optional[PreferenceResponse] = None  # created
+    existing_preference_id: Optional[int] = None  # duplicate: already in the trip or earlier in the batch
+    message: Optional[str] = None
+
+
+class PreferenceBatchResponse(BaseModel):
+    created: int
+    results: List[PreferenceBatchItemResult]
@@ -1,6 +1,6 @@
 from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel
+from typing import Optional, List, Dict, Literal
+from pydantic import BaseModel, Field, field_validator
 
 
 class RouteOptionBase(BaseModel):
@@ -15,6 +15,7 @@ class RouteOptionResponse(RouteOptionBase):
     option_number: int
     created_at: datetime
     vote_count: int = 0
+    route_data: Optional[dict] = None  # structured itinerary: { "days": [ ... ] } (see StructuredRoute)
 
     class Config:
         from_attributes = True
@@ -24,3 +25,54 @@ class GenerateRoutesResponse(BaseModel):
     status: str
     message: str
     routes: List[RouteOptionResponse] = []
+
+
+class WhyNotIncludedBatchRequest(BaseModel):
+    preference_ids: Optional[List[int]] = None  # None = all preferences not mentioned in the route
+
+
+class WhyNotIncludedBatchResponse(BaseModel):
+    reasons: Dict[int, str]  # preference_id -> short explanation
+
+
+# --- Structured route output (JSON mode of route generation) ---
+
+SLOT_ALIASES = {
+    "утро": "morning",
+    "день": "afternoon",
+    "вечер": "evening",
+    "noon": "afternoon",
+    "day": "afternoon",
+}
+
+
+class RoutePlace(BaseModel):
+    name: str = Field(..., min_length=1, max_length=255)
+    city: Optional[str] = None
+    preference_id: Optional[int] = None  # id of the participant preference this place fulfils
+
+
+class RouteSlot(BaseModel):
+    time: Literal["morning", "afternoon", "evening"]
+    description: str
+    places: List[RoutePlace] = []
+
+    @field_validator("time", mode="before")
+    @classmethod
+    def normalize_time(cls, v):
+        if isinstance(v, str):
+            v = v.strip().lower()
+            return SLOT_ALIASES.get(v, v)
+        return v
+
+
+class RouteDay(BaseModel):
+    day: int = Field(..., ge=1)
+    title: Optional[str] = None
+    slots: List[RouteSlot] = Field(..., min_length=1)
+
+
+class StructuredRoute(BaseModel):
+    title: str = Field(..., min_length=1, max_length=255)
+    days: List[RouteDay] = Field(..., min_length=1)
+    reasoning: str = ""
@@ -0,0 +1,115 @@
+"""Which trip preferences each route mentions, precomputed into route_preference_coverage.
+
+Rows are written when routes are generated and refreshed per preference on
+create/update (delete cascades), so "not in route" lookups are a single indexed read.
+"""
+import json
+from typing import Iterable, List
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import PlacePreference, RouteOption, RoutePreferenceCoverage
+
+
+def _normalize_for_match(s: str) -> str:
+    if not s:
+        return ""
+    for c in "*#_`[]().,-—–":
+        s = s.replace(c, " ")
+    return " ".join(s.split()).strip().lower()
+
+
+def route_match_text(route: RouteOption) -> str:
+    """Normalized text of a route (description, reasoning, structured data) to search places in."""
+    route_text_parts = [route.description or "", route.reasoning or ""]
+    if getattr(route, "route_data", None) and isinstance(route.route_data, dict):
+        route_text_parts.append(json.dumps(route.route_data, ensure_ascii=False))
+    return _normalize_for_match(" ".join(route_text_parts))
+
+
+def find_place_in_route(text: str, location: str | None, city: str | None) -> str | None:
+    """Return the normalized phrase by which the place is found in normalized route text, or None."""
+    if not text:
+        return None
+    loc = (location or "").strip()
+    cit = (city or "").strip()
+    # exact substring (location or city)
+    if loc:
+        nloc = _normalize_for_match(loc)
+        if nloc and nloc in text:
+            return nloc
+    if cit:
+        ncit = _normalize_for_match(cit)
+        if ncit and ncit in text:
+            return ncit
+    # all significant words present (handles "Санкт-Петербург" vs "Санкт Петербург" in route)
+    if loc:
+        words = [w for w in _normalize_for_match(loc).split() if len(w) >= 2]
+        if words and all(w in text for w in words):
+            return " ".join(words)
+    if cit:
+        words = [w for w in _normalize_for_match(cit).split() if len(w) >= 2]
+        if words and all(w in text for w in words):
+            return " ".join(words)
+    return None
+
+
+def route_preference_places(route: RouteOption) -> dict[int, str]:
+    """Preference id -> place name for places the structured route (route_data) links to preferences."""
+    linked = {}
+    days = route.route_data.get("days") if isinstance(route.route_data, dict) else None
+    for day in days or []:
+        for slot in day.get("slots") or []:
+            for place in slot.get("places") or []:
+                pref_id = place.get("preference_id")
+                if isinstance(pref_id, int) and pref_id not in linked:
+                    linked[pref_id] = place.get("name") or ""
+    return linked
+
+
+def coverage_values(routes: Iterable[RouteOption], prefs: List[PlacePreference]) -> List[dict]:
+    """Column values of route_preference_coverage rows for every (route, preference) pair.
+
+    Only reads id/description/reasoning/route_data of routes and id/location/city of preferences,
+    so plain result rows work too (migrations).
+    """
+    values = []
+    for route in routes:
+        text = route_match_text(route)
+        linked = route_preference_places(route)
+        for pref in prefs:
+            if pref.id in linked:
+                span = _normalize_for_match(linked[pref.id]) or str(pref.id)
+            else:
+                span = find_place_in_route(text, pref.location, pref.city)
+            values.append({
+                "route_option_id": route.id,
+                "preference_id": pref.id,
+                "mentioned": span is not None,
+                "match_span": span[:255] if span else None,
+            })
+    return values
+
+
+def _coverage_rows(routes: Iterable[RouteOption], prefs: List[PlacePreference]) -> List[RoutePreferenceCoverage]:
+    return [RoutePreferenceCoverage(**values) for values in coverage_values(routes, prefs)]
+
+
+async def build_route_coverage(routes: List[RouteOption], trip_id: int, db: AsyncSession) -> None:
+    """Compute coverage of all trip preferences for freshly saved routes (ids must be assigned)."""
+    prefs = (await db.execute(select(PlacePreference).filter(PlacePreference.trip_id == trip_id))).scalars().all()
+    db.add_all(_coverage_rows(routes, prefs))
+
+
+async def add_preferences_coverage(prefs: List[PlacePreference], trip_id: int, db: AsyncSession) -> None:
+    """Coverage of newly created preferences against every route of the trip."""
+    routes = (await db.execute(select(RouteOption).filter(RouteOption.trip_id == trip_id))).scalars().all()
+    db.add_all(_coverage_rows(routes, prefs))
+
+
+async def refresh_preference_coverage(pref: PlacePreference, db: AsyncSession) -> None:
+    """Recompute one preference against every route of its trip (after create/update)."""
+    await db.execute(delete(RoutePreferenceCoverage).filter(
+        RoutePreferenceCoverage.preference_id == pref.id
+    ).execution_options(synchronize_session=False))
+    routes = (await db.execute(select(RouteOption).filter(RouteOption.trip_id == pref.trip_id))).scalars().all()
+    db.add_all(_coverage_rows(routes, [pref]))
@@ -0,0 +1,167 @@
+"""Near-duplicate detection of place preferences within a trip.
+
+Names are compared in their folded form (the *_norm columns, see fold_text) by
+trigram similarity. On Postgres the scoring runs in SQL with pg_trgm and the
+trigram operators are served by the GIN (trip_id, *_norm) indexes; elsewhere
+(SQLite in dev/tests) the trip's rows are scored here with the same formula.
+
+A match needs the same country. With a location the city and the location must
+both be similar and the location score ranks; without one the city score does.
+"""
+from typing import NamedTuple
+from sqlalchemy import select, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import engine
+from app.models import PlacePreference
+from app.utils.text import fold_text
+
+
+class FoldedPlace(NamedTuple):
+    country: str
+    city: str
+    location: str
+
+
+class SimilarPreference(NamedTuple):
+    preference: PlacePreference
+    score: float
+
+
+def fold_place(country: str | None, city: str | None, location: str | None) -> FoldedPlace:
+    return FoldedPlace(fold_text(country), fold_text(city), fold_text(location))
+
+
+# --- Trigram scoring (pure Python, mirrors pg_trgm) ---
+
+def _trigrams(s: str) -> set[str]:
+    """pg_trgm trigrams: each word padded with two spaces in front and one behind."""
+    grams = set()
+    for word in s.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a: str, b: str) -> float:
+    """pg_trgm similarity(a, b): shared trigrams / all trigrams."""
+    ta, tb = _trigrams(a), _trigrams(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def word_similarity(a: str, b: str) -> float:
+    """pg_trgm word_similarity(a, b): how well `a` matches the best run of words in `b`.
+
+    Approximation: pg_trgm also considers extents that cut words, we use whole words.
+    """
+    ta = _trigrams(a)
+    words = b.split()
+    if not ta or not words:
+        return 0.0
+    best = 0
+    for start in range(len(words)):
+        for end in range(start + 1, len(words) + 1):
+            best = max(best, len(ta & _trigrams(" ".join(words[start:end]))))
+    return best / len(ta)
+
+
+def name_score(a: str, b: str) -> float:
+    """Similarity of two folded names; one contained in the other ("ermitazh" / "gosudarstvennyi ermitazh") scores high."""
+    return max(similarity(a, b), word_similarity(a, b), word_similarity(b, a))
+
+
+def match_score(query: FoldedPlace, candidate: FoldedPlace) -> float | None:
+    """Score of `candidate` as a duplicate of `query`, or None if it is not one."""
+    threshold = settings.duplicate_similarity_threshold
+    if query.country != candidate.country:
+        return None
+    city = name_score(query.city, candidate.city)
+    if city < threshold:
+        return None
+    if not query.location:
+        return city
+    location = name_score(query.location, candidate.location)
+    return location if location >= threshold else None
+
+
+# --- Queries ---
+
+def _sql_name_score(column, value: str):
+    return func.greatest(
+        func.similarity(column, value),
+        func.word_similarity(value, column),
+        func.word_similarity(column, value),
+    )
+
+
+def _sql_name_filter(column, value: str):
+    # Trigram operators (indexable) as a prefilter; thresholds are set from the same setting
+    return column.op("%")(value) | column.op("%>")(value) | column.op("<%")(value)
+
+
+async def _find_similar_postgres(
+    trip_id: int, query: FoldedPlace, db: AsyncSession, exclude_id: int | None, limit: int
+) -> list[SimilarPreference]:
+    threshold = settings.duplicate_similarity_threshold
+    await db.execute(
+        select(
+            func.set_config("pg_trgm.similarity_threshold", str(threshold), True),
+            func.set_config("pg_trgm.word_similarity_threshold", str(threshold), True),
+        )
+    )
+    city_score = _sql_name_score(PlacePreference.city_norm, query.city)
+    conditions = [
+        PlacePreference.trip_id == trip_id,
+        PlacePreference.country_norm == query.country,
+        _sql_name_filter(PlacePreference.city_norm, query.city),
+        city_score >= threshold,
+    ]
+    score = city_score
+    if query.location:
+        score = _sql_name_score(PlacePreference.location_norm, query.location)
+        conditions += [_sql_name_filter(PlacePreference.location_norm, query.location), score >= threshold]
+    if exclude_id:
+        conditions.append(PlacePreference.id != exclude_id)
+
+    rows = (await db.execute(
+        select(PlacePreference, score.label("score"))
+        .filter(and_(*conditions))
+        .order_by(score.desc(), PlacePreference.id)
+        .limit(limit)
+    )).all()
+    return [SimilarPreference(preference, float(score)) for preference, score in rows]
+
+
+async def _find_similar_python(
+    trip_id: int, query: FoldedPlace, db: AsyncSession, exclude_id: int | None, limit: int
+) -> list[SimilarPreference]:
+    conditions = [PlacePreference.trip_id == trip_id, PlacePreference.country_norm == query.country]
+    if exclude_id:
+        conditions.append(PlacePreference.id != exclude_id)
+    preferences = (await db.execute(select(PlacePreference).filter(*conditions))).scalars().all()
+
+    matches = []
+    for preference in preferences:
+        score = match_score(query, FoldedPlace(preference.country_norm, preference.city_norm, preference.location_norm))
+        if score is not None:
+            matches.append(SimilarPreference(preference, score))
+    matches.sort(key=lambda m: (-m.score, m.preference.id))
+    return matches[:limit]
+
+
+async def find_similar_preferences(
+    trip_id: int,
+    country: str,
+    city: str,
+    location: str | None,
+    db: AsyncSession,
+    exclude_id: int | None = None,
+    limit: int = 5,
+) -> list[SimilarPreference]:
+    """Trip preferences that look like the given place, best match first."""
+    query = fold_place(country, city, location)
+    if engine.dialect.name == "postgresql":
+        return await _find_similar_postgres(trip_id, query, db, exclude_id, limit)
+    return await _find_similar_python(trip_id, query, db, exclude_id, limit)
@@ -0,0 +1,306 @@
+"""Route and checklist generation. Runs inside background job workers (see app.services.jobs)."""
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+import openai
+from fastapi import HTTPException
+from sqlalchemy.orm import joinedload
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models import Trip, PlacePreference, RouteOption, RouteGenerationCache, TripChecklist, GenerationStatus
+from app.services.llm_service import (
+    generate_routes,
+    stream_routes,
+    generate_packing_list,
+    routes_request,
+    request_cache_key,
+    LLMRouteOutputError,
+)
+from app.services.coverage import build_route_coverage
+from app.services.llm_limiter import LLMRateLimitExceeded, is_rate_limited, rate_limit_detail
+from app.services.trip_events import publish_trip_event
+from app.utils.cache import get_cache_stats
+
+route_cache_stats = get_cache_stats("route_generation")
+
+
+def route_generation_error(e: Exception) -> HTTPException:
+    """Map a DeepSeek API error from route generation to the HTTP error shown to the client."""
+    if isinstance(e, LLMRateLimitExceeded):
+        return HTTPException(status_code=429, detail=str(e))
+    if isinstance(e, LLMRouteOutputError):
+        return HTTPException(status_code=502, detail=str(e))
+    if is_rate_limited(e):
+        if getattr(e, "code", None) == "insufficient_quota":
+            return HTTPException(
+                status_code=429,
+                detail="Превышен лимит использования DeepSeek API. Пожалуйста, проверьте баланс и настройки API ключа."
+            )
+        return HTTPException(
+            status_code=429,
+            detail="Превышен лимит запросов к DeepSeek API. Пожалуйста, подождите немного и попробуйте снова."
+        )
+    if isinstance(e, openai.AuthenticationError):
+        return HTTPException(
+            status_code=500,
+            detail="Ошибка аутентификации DeepSeek API. Пожалуйста, проверьте настройки API ключа."
+        )
+    return HTTPException(
+        status_code=500,
+        detail=f"Ошибка генерации маршрутов: {str(e)}"
+    )
+
+
+async def _load_generation_input(trip_id: int, db: AsyncSession) -> tuple[Trip, list[PlacePreference]]:
+    trip = await db.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Поездка не найдена")
+
+    # Get preferences with user data
+    result = await db.execute(select(PlacePreference).options(
+        joinedload(PlacePreference.user)
+    ).filter(
+        PlacePreference.trip_id == trip_id
+    ).order_by(
+        PlacePreference.id  # stable prompt -> stable cache key
+    ))
+    preferences = list(result.scalars().all())
+    return trip, preferences
+
+
+def _require_preferences(preferences: list[PlacePreference]) -> None:
+    if not preferences:
+        raise HTTPException(
+            status_code=400,
+            detail="Добавьте хотя бы одно пожелание для генерации маршрутов"
+        )
+
+
+async def get_cached_routes(key: str, db: AsyncSession) -> list[dict] | None:
+    """Cached routes for a request key, or None if absent or older than route_cache_ttl_days."""
+    entry = await db.get(RouteGenerationCache, key)
+    now = datetime.utcnow()
+    if entry and entry.created_at and entry.created_at >= now - timedelta(days=settings.route_cache_ttl_days):
+        entry.hit_count += 1
+        entry.last_hit_at = now
+        route_cache_stats.hit()
+        return entry.routes
+    route_cache_stats.miss()
+    return None
+
+
+async def store_cached_routes(key: str, request: dict, route_data: list[dict], db: AsyncSession) -> None:
+    """Add or replace a cache entry (committed together with the generated routes)."""
+    await db.merge(RouteGenerationCache(
+        key=key,
+        model=request["model"],
+        routes=route_data,
+        created_at=datetime.utcnow(),
+        hit_count=0,
+    ))
+
+
+async def save_generated_routes(
+    trip: Trip, route_data: list[dict], db: AsyncSession
+) -> list[RouteOption]:
+    """Replace trip routes (and their votes) with new ones and mark generation completed.
+
+    Results served from the cache count towards max_generation_count too: they replace
+    the routes and reset the votes just like a new generation.
+    """
+    # Delete old routes and votes
+    await db.execute(delete(RouteOption).filter(RouteOption.trip_id == trip.id))
+
+    # Save new routes
+    new_routes = []
+    for i, data in enumerate(route_data, 1):
+        route = RouteOption(
+            trip_id=trip.id,
+            option_number=i,
+            title=data["title"],
+            description=data["description"],
+            reasoning=data.get("reasoning"),
+            route_data=data.get("route_data"),
+        )
+        db.add(route)
+        new_routes.append(route)
+
+    # Precompute which preferences each route mentions
+    await db.flush()
+    await build_route_coverage(new_routes, trip.id, db)
+
+    # Update trip status
+    trip.generation_status = GenerationStatus.COMPLETED
+    trip.generation_count += 1
+    await publish_trip_event(trip.id, "generation_status", {
+        "status": trip.generation_status, "route_ids": [r.id for r in new_routes],
+    }, db)
+    await db.commit()
+    return new_routes
+
+
+async def _fail_route_generation(trip: Trip, e: Exception, db: AsyncSession) -> HTTPException:
+    await db.rollback()
+    trip.generation_status = GenerationStatus.FAILED
+    await publish_trip_event(trip.id, "generation_status", {"status": trip.generation_status}, db)
+    await db.commit()
+    if isinstance(e, HTTPException):
+        return e
+    return route_generation_error(e)
+
+
+async def _release_connection(db: AsyncSession) -> None:
+    """Commit what was read so far, returning the connection to the pool before a long LLM call.
+
+    The session stays usable (expire_on_commit=False) and takes a new connection for the writes.
+    """
+    await db.commit()
+
+
+def _routes_result(routes: list[RouteOption], cached: bool) -> dict:
+    return {
+        "message": f"Сгенерировано {len(routes)} вариантов маршрута",
+        "route_ids": [r.id for r in routes],
+        "cached": cached,
+    }
+
+
+async def run_route_generation(trip_id: int, db: AsyncSession, force: bool = False) -> dict:
+    """Generate routes for a trip whose status is already IN_PROGRESS. Replaces old routes and votes.
+
+    An identical earlier request is served from the route cache unless `force` is set.
+    """
+    trip, preferences = await _load_generation_input(trip_id, db)
+    try:
+        _require_preferences(preferences)
+        request = routes_request(trip, preferences)
+        key = request_cache_key(request)
+        route_data = None if force else await get_cached_routes(key, db)
+        cached = route_data is not None
+        if not cached:
+            # Generate routes using LLM
+            await _release_connection(db)
+            route_data, fallback = await generate_routes(trip, preferences, request)
+            if not fallback:
+                # Routes recovered from a malformed response are used once, not served again
+                await store_cached_routes(key, request, route_data, db)
+        new_routes = await save_generated_routes(trip, route_data, db)
+    except Exception as e:
+        raise await _fail_route_generation(trip, e, db)
+    return _routes_result(new_routes, cached)
+
+
+async def stream_route_generation(
+    trip_id: int, db: AsyncSession, force: bool = False
+) -> AsyncIterator[tuple[str, dict]]:
+    """Streaming run_route_generation. Yields ("route", option) as each option forms, then ("done", result).
+
+    Routes are saved only once the whole response is received.
+    """
+    trip, preferences = await _load_generation_input(trip_id, db)
+    try:
+        _require_preferences(preferences)
+        request = routes_request(trip, preferences)
+        key = request_cache_key(request)
+        cached_routes = None if force else await get_cached_routes(key, db)
+        route_data = []
+        if cached_routes is not None:
+            for route in cached_routes:
+                route_data.append(route)
+                yield "route", {"option_number": len(route_data), **route}
+        else:
+            await _release_connection(db)
+            fallback = False
+            async for route, fallback in stream_routes(trip, preferences, request):
+                route_data.append(route)
+                yield "route", {"option_number": len(route_data), **route}
+            if not fallback:
+                await store_cached_routes(key, request, route_data, db)
+        cached = cached_routes is not None
+        new_routes = await save_generated_routes(trip, route_data, db)
+    except Exception as e:
+        raise await _fail_route_generation(trip, e, db)
+    yield "done", _routes_result(new_routes, cached)
+
+
+async def get_winner_route(trip_id: int, db: AsyncSession):
+    """Route with most votes (winner). Raises 400 if routes are not generated or nobody voted yet."""
+    # Row order: id, title, description, votes (access by index for compatibility)
+    winner_row = (await db.execute(
+        select(RouteOption.id, RouteOption.title, RouteOption.description, RouteOption.vote_count)
+        .filter(RouteOption.trip_id == trip_id)
+        .order_by(RouteOption.vote_count.desc(), RouteOption.option_number)
+        .limit(1)
+    )).first()
+    if not winner_row or not winner_row[1]:
+        raise HTTPException(
+            status_code=400,
+            detail="Сначала сгенерируйте маршруты. Чек-лист строится по маршруту, набравшему больше всего голосов.",
+        )
+    if (winner_row[3] or 0) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="Сначала проголосуйте за маршрут. Чек-лист строится по варианту, набравшему большинство голосов.",
+        )
+    return winner_row
+
+
+async def get_route_places(trip_id: int, db: AsyncSession) -> str | None:
+    """Countries/cities from trip preferences (маршрут строился по этим пожеланиям)."""
+    prefs = (await db.execute(
+        select(PlacePreference.country, PlacePreference.city)
+        .filter(PlacePreference.trip_id == trip_id)
+        .distinct()
+    )).all()
+    places_parts = []
+    by_country: dict[str, list[str]] = {}
+    for country, city in prefs:
+        country = (country or "").strip()
+        city = (city or "").strip()
+        if not country:
+            continue
+        by_country.setdefault(country, [])
+        if city and city not in by_country[country]:
+            by_country[country].append(city)
+    for country, cities in sorted(by_country.items()):
+        if cities:
+            places_parts.append(f"{country} ({', '.join(sorted(cities))})")
+        else:
+            places_parts.append(country)
+    return "; ".join(places_parts) if places_parts else None
+
+
+async def run_checklist_generation(trip_id: int, user_id: int | None, db: AsyncSession) -> dict:
+    """Generate packing checklist from the winning route and store it (regenerate overwrites)."""
+    trip = await db.get(Trip, trip_id)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Поездка не найдена")
+
+    _, winner_title, winner_description, _ = await get_winner_route(trip_id, db)
+    places_from_route = await get_route_places(trip_id, db)
+    await _release_connection(db)
+
+    try:
+        content = await generate_packing_list(
+            trip=trip,
+            winner_route_title=winner_title,
+            winner_route_description=winner_description or "",
+            places_from_route=places_from_route,
+        )
+    except Exception as e:
+        if is_rate_limited(e):
+            raise HTTPException(status_code=429, detail=rate_limit_detail(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Upsert: remove old checklist for this trip, add new
+    await db.execute(delete(TripChecklist).filter(TripChecklist.trip_id == trip_id))
+    checklist = TripChecklist(
+        trip_id=trip_id,
+        created_by_id=user_id,
+        content=content,
+    )
+    db.add(checklist)
+    await db.flush()
+    await publish_trip_event(trip_id, "checklist_updated", {"checklist_id": checklist.id}, db)
+    await db.commit()
+    return {"checklist_id": checklist.id}
@@ -0,0 +1,35 @@
+"""Cross-worker invalidation of per-worker caches.
+
+A message on the `cache_invalidation` channel is a JSON object
+{"topic": ..., "key": ...}; the handler registered for the topic drops that key
+from its cache. Messages are sent by database triggers (see migrations), so
+they arrive only when the change commits, whatever wrote it. On every
+(re)connect of the listener all handlers are called with key None, meaning
+"forget everything", since messages may have been missed. Without Postgres
+(SQLite, one process) caches rely on local invalidation and their TTL.
+"""
+from typing import Any, Callable
+from app.services.notifications import listen
+
+CHANNEL = "cache_invalidation"
+
+_handlers: dict[str, Callable[[Any], None]] = {}
+
+
+def register_invalidation_handler(topic: str, handler: Callable[[Any], None]) -> None:
+    """`handler(key)` drops `key` from a cache; `handler(None)` clears it."""
+    _handlers[topic] = handler
+
+
+def _on_message(message: dict) -> None:
+    handler = _handlers.get(message["topic"])
+    if handler is not None:
+        handler(message.get("key"))
+
+
+def _forget_all() -> None:
+    for handler in _handlers.values():
+        handler(None)
+
+
+listen(CHANNEL, _on_message, _forget_all)
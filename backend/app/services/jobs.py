@@ -0,0 +1,280 @@
+"""Durable Postgres-backed job queue for LLM generation.
+
+API handlers enqueue a GenerationJob and return 202 immediately. Worker coroutines
+(started in the API process or via `python -m app.worker`) claim queued jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, hold a lease while running and renew it with a
+heartbeat. Jobs whose lease expired (worker crashed or restarted) are reclaimed;
+after `job_max_attempts` they fail and the trip is released from IN_PROGRESS.
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable
+from fastapi import HTTPException
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import SessionLocal
+from app.models import GenerationJob, JobKind, JobStatus, Trip, GenerationStatus
+from app.services.generation import run_route_generation, run_checklist_generation
+from app.services.trip_events import publish_trip_event
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+
+async def _handle_generate_routes(job: GenerationJob, db: AsyncSession) -> dict:
+    force = bool((job.params or {}).get("force"))
+    return await run_route_generation(job.trip_id, db, force=force)
+
+
+async def _handle_generate_checklist(job: GenerationJob, db: AsyncSession) -> dict:
+    return await run_checklist_generation(job.trip_id, job.user_id, db)
+
+
+JOB_HANDLERS: dict[JobKind, Callable[[GenerationJob, AsyncSession], Awaitable[dict]]] = {
+    JobKind.GENERATE_ROUTES: _handle_generate_routes,
+    JobKind.GENERATE_CHECKLIST: _handle_generate_checklist,
+}
+
+
+# --- Queue operations ---
+
+async def enqueue_job(
+    kind: JobKind, trip_id: int, user_id: int | None, db: AsyncSession, params: dict | None = None
+) -> GenerationJob:
+    """Add a job to the queue. Commits the current transaction."""
+    job = GenerationJob(kind=kind, trip_id=trip_id, user_id=user_id, status=JobStatus.QUEUED, params=params)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def start_inline_job(
+    kind: JobKind, trip_id: int, user_id: int | None, worker_id: str, db: AsyncSession, params: dict | None = None
+) -> GenerationJob:
+    """Create a job that the calling request runs itself (e.g. a streamed generation).
+
+    It is leased like a claimed job, so if the request dies a queue worker takes it over
+    after the lease expires. Commits the current transaction.
+    """
+    now = datetime.utcnow()
+    job = GenerationJob(
+        kind=kind,
+        trip_id=trip_id,
+        user_id=user_id,
+        params=params,
+        status=JobStatus.RUNNING,
+        attempts=1,
+        worker_id=worker_id,
+        created_at=now,
+        started_at=now,
+        lease_expires_at=now + timedelta(seconds=settings.job_lease_seconds),
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def get_active_job(kind: JobKind, trip_id: int, db: AsyncSession) -> GenerationJob | None:
+    """Queued or running job of this kind for the trip, if any."""
+    result = await db.execute(select(GenerationJob).filter(
+        GenerationJob.trip_id == trip_id,
+        GenerationJob.kind == kind,
+        GenerationJob.status.in_(ACTIVE_STATUSES),
+    ).order_by(GenerationJob.created_at.desc()).limit(1))
+    return result.scalars().first()
+
+
+async def claim_next_job(worker_id: str, db: AsyncSession) -> GenerationJob | None:
+    """Atomically take the oldest queued job (or a running one with an expired lease)."""
+    now = datetime.utcnow()
+    result = await db.execute(select(GenerationJob).filter(
+        or_(
+            GenerationJob.status == JobStatus.QUEUED,
+            and_(
+                GenerationJob.status == JobStatus.RUNNING,
+                GenerationJob.lease_expires_at < now,
+                GenerationJob.attempts < settings.job_max_attempts,
+            ),
+        )
+    ).order_by(
+        GenerationJob.created_at
+    ).limit(1).with_for_update(skip_locked=True))
+    job = result.scalars().first()
+
+    if job is None:
+        await db.rollback()
+        return None
+
+    job.status = JobStatus.RUNNING
+    job.attempts += 1
+    job.worker_id = worker_id
+    job.started_at = now
+    job.lease_expires_at = now + timedelta(seconds=settings.job_lease_seconds)
+    await db.commit()
+    return job
+
+
+async def renew_lease(job_id: int, worker_id: str) -> None:
+    """Extend the lease of a running job (own session: the job session is busy in the handler)."""
+    async with SessionLocal() as db:
+        await db.execute(update(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.worker_id == worker_id,
+            GenerationJob.status == JobStatus.RUNNING,
+        ).values(
+            lease_expires_at=datetime.utcnow() + timedelta(seconds=settings.job_lease_seconds),
+        ).execution_options(synchronize_session=False))
+        await db.commit()
+
+
+async def _finish_job(
+    job: GenerationJob, db: AsyncSession, result: dict | None = None, error: HTTPException | None = None
+):
+    await db.rollback()  # drop whatever the handler left uncommitted
+    job.status = JobStatus.FAILED if error else JobStatus.SUCCEEDED
+    job.result = result
+    job.error = str(error.detail) if error else None
+    job.error_code = error.status_code if error else None
+    job.finished_at = datetime.utcnow()
+    job.lease_expires_at = None
+    await db.commit()
+
+
+async def recover_expired_jobs(db: AsyncSession) -> int:
+    """Fail running jobs whose lease expired with no attempts left and release their trips.
+
+    Returns the number of trips reset from IN_PROGRESS to FAILED.
+    """
+    now = datetime.utcnow()
+    dead = (await db.execute(select(GenerationJob).filter(
+        GenerationJob.status == JobStatus.RUNNING,
+        GenerationJob.lease_expires_at < now,
+        GenerationJob.attempts >= settings.job_max_attempts,
+    ).with_for_update(skip_locked=True))).scalars().all()
+    for job in dead:
+        job.status = JobStatus.FAILED
+        job.error = "Генерация прервана: обработчик не ответил вовремя"
+        job.error_code = 500
+        job.finished_at = now
+        job.lease_expires_at = None
+    await db.flush()
+
+    # Trips stuck IN_PROGRESS without a live route job (e.g. worker died before this queue existed)
+    live_route_jobs = select(GenerationJob.trip_id).filter(
+        GenerationJob.kind == JobKind.GENERATE_ROUTES,
+        GenerationJob.status.in_(ACTIVE_STATUSES),
+    )
+    released = (await db.execute(update(Trip).filter(
+        Trip.generation_status == GenerationStatus.IN_PROGRESS,
+        Trip.id.notin_(live_route_jobs),
+    ).values(
+        generation_status=GenerationStatus.FAILED,
+    ).returning(Trip.id).execution_options(synchronize_session=False))).scalars().all()
+    for trip_id in released:
+        await publish_trip_event(trip_id, "generation_status", {"status": GenerationStatus.FAILED}, db)
+    await db.commit()
+    return len(released)
+
+
+# --- Worker ---
+
+def make_worker_id(index: int | str) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+async def _heartbeat(job_id: int, worker_id: str):
+    interval = max(settings.job_lease_seconds / 3, 1)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await renew_lease(job_id, worker_id)
+        except Exception:
+            logger.exception("Failed to renew lease for job %s", job_id)
+
+
+async def execute_job(job: GenerationJob, worker_id: str, db: AsyncSession) -> None:
+    """Run the handler for a claimed job and store its outcome."""
+    handler = JOB_HANDLERS[job.kind]
+    job_id = job.id  # job attributes are expired after a handler rollback
+    heartbeat = asyncio.create_task(_heartbeat(job_id, worker_id))
+    try:
+        result = await handler(job, db)
+    except HTTPException as e:
+        await _finish_job(job, db, error=e)
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        await _finish_job(job, db, error=HTTPException(status_code=500, detail=str(e)))
+    else:
+        await _finish_job(job, db, result=result)
+    finally:
+        heartbeat.cancel()
+
+
+async def relay_job_events(
+    job: GenerationJob,
+    worker_id: str,
+    events: AsyncIterator[tuple[str, dict]],
+    db: AsyncSession,
+) -> AsyncIterator[tuple[str, dict]]:
+    """execute_job for streaming handlers: relays their events and stores the outcome.
+
+    The final ("done", result) event becomes the job result; a failure is stored and
+    relayed as ("error", {status_code, detail}). If the consumer goes away mid-stream the
+    job keeps its lease and is retried by a queue worker once it expires.
+    """
+    job_id = job.id
+    heartbeat = asyncio.create_task(_heartbeat(job_id, worker_id))
+    result = None
+    try:
+        async for event, data in events:
+            if event == "done":
+                result = data
+            yield event, data
+    except Exception as e:
+        if not isinstance(e, HTTPException):
+            logger.exception("Job %s failed", job_id)
+            e = HTTPException(status_code=500, detail=str(e))
+        await _finish_job(job, db, error=e)
+        yield "error", {"status_code": e.status_code, "detail": e.detail}
+    else:
+        await _finish_job(job, db, result=result)
+    finally:
+        heartbeat.cancel()
+
+
+async def run_worker(worker_id: str, stop: asyncio.Event) -> None:
+    """Claim and execute jobs until `stop` is set."""
+    last_recovery = 0.0
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        job = None
+        async with SessionLocal() as db:
+            try:
+                if loop.time() - last_recovery >= settings.job_recovery_interval:
+                    await recover_expired_jobs(db)
+                    last_recovery = loop.time()
+                job = await claim_next_job(worker_id, db)
+                if job is not None:
+                    await execute_job(job, worker_id, db)
+            except Exception:
+                logger.exception("Job worker %s error", worker_id)
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=settings.job_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def start_workers(count: int, stop: asyncio.Event) -> list[asyncio.Task]:
+    """Start `count` worker coroutines on the running event loop."""
+    return [
+        asyncio.create_task(run_worker(make_worker_id(i), stop))
+        for i in range(count)
+    ]
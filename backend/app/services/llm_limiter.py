@@ -0,0 +1,454 @@
+"""Rate limiting of LLM provider calls, coordinated across worker processes.
+
+Each provider key (base URL + API key) has two token buckets stored in
+llm_rate_buckets — requests/min and LLM tokens/min — and a cap on in-flight calls
+(rows of llm_call_slots, leased so a crashed worker does not hold them forever).
+
+Calls do not go to the database one by one. A worker draws a share of the buckets
+(`llm_local_budget_share` of the per-minute limits) into a local budget and admits
+calls from it, and keeps a concurrency slot for `llm_slot_idle_seconds` after a
+call so the next call reuses it. Only when the local budget or slots run out does
+a call lock the shared bucket row to draw more. A call that cannot be admitted
+waits up to `llm_limit_max_wait` seconds, then fails with LLMRateLimitExceeded
+(HTTP 429).
+
+Within a process waiting calls take turns round-robin by trip, so one trip
+generating many requests does not starve the others.
+"""
+import asyncio
+import hashlib
+import os
+import socket
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Hashable
+import openai
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.database import SessionLocal
+from app.models import LLMRateBucket, LLMCallSlot
+
+
+class LLMRateLimitExceeded(Exception):
+    """No capacity freed up within llm_limit_max_wait."""
+
+    def __init__(self):
+        super().__init__("Превышен лимит запросов к AI (429). Сервис перегружен, попробуйте через минуту.")
+
+
+def is_rate_limited(e: BaseException) -> bool:
+    """The call was refused for rate or quota reasons: by our limiter or by the provider (HTTP 429)."""
+    return isinstance(e, LLMRateLimitExceeded) or (isinstance(e, openai.APIStatusError) and e.status_code == 429)
+
+
+def rate_limit_detail(e: BaseException) -> str:
+    """Message for the client of a call refused per is_rate_limited."""
+    if isinstance(e, LLMRateLimitExceeded):
+        return str(e)
+    return "Превышен лимит запросов к AI. Попробуйте позже."
+
+
+class LLMCallTicket:
+    """Handle of an admitted call. Report actual usage so the token bucket is corrected."""
+
+    def __init__(self, slot_id: int | None, estimated_tokens: int):
+        self.slot_id = slot_id
+        self.estimated_tokens = estimated_tokens
+        self.used_tokens: int | None = None
+
+    def record_usage(self, usage) -> None:
+        total = getattr(usage, "total_tokens", None)
+        if isinstance(total, int):
+            self.used_tokens = total
+
+
+def bucket_key() -> str:
+    fingerprint = hashlib.sha256(settings.deepseek_api_key.encode("utf-8")).hexdigest()[:16]
+    return f"{settings.deepseek_base_url}|{fingerprint}"
+
+
+def estimate_tokens(request: dict) -> int:
+    """Rough upper bound of tokens a chat request consumes: prompt (~3 chars per token) + max_tokens."""
+    prompt_chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+    return prompt_chars // 3 + int(request.get("max_tokens") or 0)
+
+
+def _limits_enabled() -> bool:
+    return bool(settings.llm_requests_per_minute or settings.llm_tokens_per_minute or settings.llm_max_concurrency)
+
+
+# --- Shared buckets (database) ---
+
+def _refill(bucket: LLMRateBucket, now: datetime) -> None:
+    elapsed = max((now - bucket.updated_at).total_seconds(), 0.0)
+    if settings.llm_requests_per_minute:
+        rpm = settings.llm_requests_per_minute
+        bucket.request_tokens = min(rpm, bucket.request_tokens + elapsed * rpm / 60)
+    if settings.llm_tokens_per_minute:
+        tpm = settings.llm_tokens_per_minute
+        bucket.token_tokens = min(tpm, bucket.token_tokens + elapsed * tpm / 60)
+    bucket.updated_at = now
+
+
+class _LocalBudget:
+    """Requests and tokens this worker drew from the shared bucket and may spend without the database.
+
+    Usage beyond the drawn amount (a request larger than the estimate allowed) leaves the
+    token balance negative; the debt is charged to the shared bucket on the next draw.
+    Unspent budget is dropped after a minute so it cannot be saved up for a burst.
+    """
+
+    LIFETIME = 60.0  # seconds
+
+    def __init__(self):
+        self.requests = 0.0
+        self.tokens = 0.0
+        self._expires_at = 0.0
+
+    def _expire(self) -> None:
+        if time.monotonic() >= self._expires_at:
+            self.requests = min(self.requests, 0.0)
+            self.tokens = min(self.tokens, 0.0)
+
+    def _shortfall(self, tokens: int) -> tuple[float, float]:
+        """(requests, tokens) missing locally for a call of `tokens`."""
+        self._expire()
+        requests = max(1 - self.requests, 0.0) if settings.llm_requests_per_minute else 0.0
+        # A request larger than the whole bucket is admitted once the bucket is full
+        needed = min(tokens, settings.llm_tokens_per_minute)
+        missing_tokens = max(needed - self.tokens, 0.0) if settings.llm_tokens_per_minute else 0.0
+        return requests, missing_tokens
+
+    def covers(self, tokens: int) -> bool:
+        return self._shortfall(tokens) == (0.0, 0.0)
+
+    def settle_debt(self, bucket: LLMRateBucket) -> None:
+        if self.tokens < 0 and settings.llm_tokens_per_minute:
+            bucket.token_tokens += self.tokens
+            self.tokens = 0.0
+
+    def wait_for(self, bucket: LLMRateBucket, tokens: int) -> float:
+        """Seconds until the (refilled) shared bucket can cover the shortfall; 0 if it can now."""
+        requests, missing_tokens = self._shortfall(tokens)
+        wait = 0.0
+        if requests and bucket.request_tokens < requests:
+            wait = (requests - bucket.request_tokens) * 60 / settings.llm_requests_per_minute
+        if missing_tokens and bucket.token_tokens < missing_tokens:
+            wait = max(wait, (missing_tokens - bucket.token_tokens) * 60 / settings.llm_tokens_per_minute)
+        return wait
+
+    def draw(self, bucket: LLMRateBucket, tokens: int) -> None:
+        """Move the shortfall, but at least `llm_local_budget_share` of the limits, from the bucket."""
+        requests, missing_tokens = self._shortfall(tokens)
+        share = settings.llm_local_budget_share
+        if settings.llm_requests_per_minute:
+            drawn = min(bucket.request_tokens, max(requests, share * settings.llm_requests_per_minute))
+            bucket.request_tokens -= drawn
+            self.requests += drawn
+        if settings.llm_tokens_per_minute:
+            drawn = min(bucket.token_tokens, max(missing_tokens, share * settings.llm_tokens_per_minute))
+            bucket.token_tokens -= drawn
+            self.tokens += drawn
+        self._expires_at = time.monotonic() + self.LIFETIME
+
+    def take(self, tokens: int) -> None:
+        if settings.llm_requests_per_minute:
+            self.requests -= 1
+        if settings.llm_tokens_per_minute:
+            self.tokens -= tokens
+
+    def refund(self, tokens: int) -> None:
+        """Estimated tokens the call did not use (negative: used more than estimated)."""
+        if settings.llm_tokens_per_minute:
+            self.tokens += tokens
+
+    def exhaust(self) -> None:
+        self.requests = min(self.requests, 0.0)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _IdleSlots:
+    """Concurrency slots (llm_call_slots rows) this worker keeps between calls.
+
+    A released slot is handed to the next call of the worker; one that stays unused for
+    `llm_slot_idle_seconds` is deleted so other workers can take it.
+    """
+
+    def __init__(self):
+        self._slots: dict[int, tuple[float, datetime]] = {}  # slot id -> (idle since, lease expiry)
+        self._tasks: set[asyncio.Task] = set()
+        self._waiters: list[asyncio.Future] = []
+        self.owned = 0  # slots of this worker, idle or in use
+
+    def take(self) -> tuple[int, datetime] | None:
+        if not self._slots:
+            return None
+        slot_id = next(iter(self._slots))
+        _, expires_at = self._slots.pop(slot_id)
+        return slot_id, expires_at
+
+    def put(self, slot_id: int, expires_at: datetime) -> None:
+        since = time.monotonic()
+        self._slots[slot_id] = (since, expires_at)
+        for fut in self._waiters:
+            if not fut.done():
+                fut.set_result(None)
+        self._waiters.clear()
+        task = asyncio.create_task(self._delete_if_idle(slot_id, since))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def wait_for_release(self, timeout: float) -> None:
+        """Sleep `timeout` seconds, waking early if a call of this worker gives back its slot."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except TimeoutError:
+            pass
+        finally:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+
+    async def _delete_if_idle(self, slot_id: int, since: float) -> None:
+        await asyncio.sleep(settings.llm_slot_idle_seconds)
+        if self._slots.get(slot_id, (None,))[0] == since:
+            del self._slots[slot_id]
+            self.owned -= 1
+            await _delete_slots([slot_id])
+
+    async def release_all(self) -> None:
+        slot_ids = list(self._slots)
+        self._slots.clear()
+        self.owned -= len(slot_ids)
+        for task in self._tasks:
+            task.cancel()
+        await _delete_slots(slot_ids)
+
+
+async def _delete_slots(slot_ids: list[int]) -> None:
+    if not slot_ids:
+        return
+    async with SessionLocal() as db:
+        await db.execute(delete(LLMCallSlot).filter(
+            LLMCallSlot.id.in_(slot_ids)
+        ).execution_options(synchronize_session=False))
+        await db.commit()
+
+
+async def _renew_slot(slot_id: int, expires_at: datetime) -> bool:
+    """Extend the lease of a kept slot. False if the row is gone (expired and cleaned up by another worker)."""
+    async with SessionLocal() as db:
+        result = await db.execute(update(LLMCallSlot).filter(
+            LLMCallSlot.id == slot_id
+        ).values(expires_at=expires_at).execution_options(synchronize_session=False))
+        await db.commit()
+        return result.rowcount == 1
+
+
+_LEASE_MARGIN = 30.0  # seconds a slot lease outlasts the expected call
+_budget = _LocalBudget()
+_idle_slots = _IdleSlots()
+
+
+async def _draw(
+    key: str, tokens: int, need_budget: bool, need_slot: bool, trip_id: int | None, lease_seconds: float
+) -> tuple[int | None, float]:
+    """Draw budget and/or a new slot from the shared state in one transaction.
+
+    Returns (slot id or None, 0) on success or (None, seconds to wait before retrying).
+    """
+    async with SessionLocal() as db:
+        now = datetime.utcnow()
+        result = await db.execute(select(LLMRateBucket).filter(LLMRateBucket.key == key).with_for_update())
+        bucket = result.scalars().first()
+        if bucket is None:
+            db.add(LLMRateBucket(
+                key=key,
+                request_tokens=float(settings.llm_requests_per_minute),
+                token_tokens=float(settings.llm_tokens_per_minute),
+                updated_at=now,
+            ))
+            try:
+                await db.commit()
+            except IntegrityError:  # created concurrently by another worker
+                await db.rollback()
+            return None, 0.0
+        _refill(bucket, now)
+        _budget.settle_debt(bucket)
+
+        wait = 0.0
+        if need_slot:
+            await db.execute(delete(LLMCallSlot).filter(
+                LLMCallSlot.bucket_key == key,
+                LLMCallSlot.expires_at < now,
+            ).execution_options(synchronize_session=False))
+            in_flight = await db.scalar(select(func.count(LLMCallSlot.id)).filter(LLMCallSlot.bucket_key == key))
+            if in_flight >= settings.llm_max_concurrency:
+                wait = settings.llm_limit_poll_interval
+        if need_budget:
+            wait = max(wait, _budget.wait_for(bucket, tokens))
+        if wait:
+            await db.commit()
+            return None, wait
+
+        if need_budget:
+            _budget.draw(bucket, tokens)
+        slot = None
+        if need_slot:
+            slot = LLMCallSlot(
+                bucket_key=key,
+                trip_id=trip_id,
+                worker_id=_worker_id,
+                tokens=tokens,
+                acquired_at=now,
+                expires_at=now + timedelta(seconds=lease_seconds),
+            )
+            db.add(slot)
+        await db.commit()
+        return (slot.id if slot else None), 0.0
+
+
+async def _admit(
+    key: str, tokens: int, trip_id: int | None, lease_seconds: float
+) -> tuple[bool, int | None, datetime | None, float]:
+    """One admission attempt: (True, slot id, its lease expiry, 0) or (False, None, None, seconds to wait)."""
+    slot = None
+    if settings.llm_max_concurrency:
+        slot = _idle_slots.take()
+        if slot is not None:
+            slot_id, expires_at = slot
+            now = datetime.utcnow()
+            # Renew only if the remaining lease may not cover the call (the lease has a margin of _LEASE_MARGIN)
+            if expires_at < now + timedelta(seconds=lease_seconds - _LEASE_MARGIN):
+                renewed_until = now + timedelta(seconds=lease_seconds)
+                if await _renew_slot(slot_id, renewed_until):
+                    slot = slot_id, renewed_until
+                else:
+                    slot = None
+                    _idle_slots.owned -= 1
+    need_slot = bool(settings.llm_max_concurrency) and slot is None
+    if need_slot and _idle_slots.owned >= settings.llm_max_concurrency:
+        # All slots are in use by this worker: wait for one of its calls to finish
+        return False, None, None, settings.llm_limit_poll_interval
+    need_budget = not _budget.covers(tokens)
+
+    if need_slot or need_budget:
+        slot_id, wait = await _draw(key, tokens, need_budget, need_slot, trip_id, lease_seconds)
+        if slot_id is not None:
+            _idle_slots.owned += 1
+        if wait or (need_slot and slot_id is None) or not _budget.covers(tokens):
+            if slot is not None:
+                _idle_slots.put(*slot)
+            elif slot_id is not None:
+                _idle_slots.put(slot_id, datetime.utcnow() + timedelta(seconds=lease_seconds))
+            return False, None, None, wait
+        if need_slot:
+            slot = slot_id, datetime.utcnow() + timedelta(seconds=lease_seconds)
+
+    _budget.take(tokens)
+    if slot is None:
+        return True, None, None, 0.0
+    return True, slot[0], slot[1], 0.0
+
+
+async def _exhaust_shared(key: str) -> None:
+    """The provider answered 429 despite the limits: empty the buckets to back off all workers."""
+    _budget.exhaust()
+    async with SessionLocal() as db:
+        result = await db.execute(select(LLMRateBucket).filter(LLMRateBucket.key == key).with_for_update())
+        bucket = result.scalars().first()
+        if bucket is not None:
+            _refill(bucket, datetime.utcnow())
+            bucket.request_tokens = min(bucket.request_tokens, 0.0)
+            bucket.token_tokens = min(bucket.token_tokens, 0.0)
+        await db.commit()
+
+
+async def release_idle_slots() -> None:
+    """Give back the concurrency slots kept between calls (on shutdown)."""
+    await _idle_slots.release_all()
+
+
+# --- Fair waiting within the process ---
+
+class _FairTurns:
+    """Round-robin turns across groups (trips): the head waiter of the next group goes first."""
+
+    def __init__(self):
+        self._queues: dict[Hashable, deque[asyncio.Future]] = {}  # insertion order = rotation order
+
+    @asynccontextmanager
+    async def turn(self, group: Hashable) -> AsyncIterator[None]:
+        fut = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(group, deque()).append(fut)
+        self._wake()
+        try:
+            await fut
+            yield
+        finally:
+            self._remove(group, fut)
+            self._wake()
+
+    def _remove(self, group: Hashable, fut: asyncio.Future) -> None:
+        queue = self._queues[group]
+        had_turn = queue[0] is fut
+        queue.remove(fut)
+        if had_turn or not queue:
+            # The group goes to the back of the rotation
+            del self._queues[group]
+            if queue:
+                self._queues[group] = queue
+
+    def _wake(self) -> None:
+        for queue in self._queues.values():
+            if not queue[0].done():
+                queue[0].set_result(None)
+            return
+
+
+_turns = _FairTurns()
+_worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@asynccontextmanager
+async def llm_rate_limit(request: dict, trip_id: int | None = None, timeout: float = 60.0) -> AsyncIterator[LLMCallTicket]:
+    """Admit one LLM call (`request`: chat completion arguments) under the shared limits.
+
+    Holds a concurrency slot for the duration of the block (`timeout`: expected call
+    duration, used for the slot lease). Raises LLMRateLimitExceeded if not admitted in time.
+    """
+    tokens = estimate_tokens(request)
+    if not _limits_enabled():
+        yield LLMCallTicket(None, tokens)
+        return
+
+    key = bucket_key()
+    lease = timeout + settings.llm_connect_timeout + _LEASE_MARGIN
+    try:
+        async with asyncio.timeout(settings.llm_limit_max_wait):
+            async with _turns.turn(trip_id):
+                while True:
+                    admitted, slot_id, slot_expires_at, wait = await _admit(key, tokens, trip_id, lease)
+                    if admitted:
+                        break
+                    if wait:
+                        await _idle_slots.wait_for_release(max(wait, settings.llm_limit_poll_interval))
+    except TimeoutError:
+        raise LLMRateLimitExceeded()
+
+    ticket = LLMCallTicket(slot_id, tokens)
+    try:
+        yield ticket
+    except Exception as e:
+        if is_rate_limited(e):
+            await _exhaust_shared(key)
+        raise
+    finally:
+        if ticket.used_tokens is not None:
+            _budget.refund(ticket.estimated_tokens - ticket.used_tokens)
+        if slot_id is not None:
+            _idle_slots.put(slot_id, slot_expires_at)
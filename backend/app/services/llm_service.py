@@ -1,20 +1,99 @@
+import hashlib
 import json
 from pathlib import Path
-from typing import List
-from openai import OpenAI
+from typing import AsyncIterator, List
+import httpx
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+from pydantic import ValidationError
 from app.config import settings
 from app.models import Trip, PlacePreference
+from app.schemas.route import StructuredRoute
+from app.services.llm_limiter import llm_rate_limit, LLMRateLimitExceeded, is_rate_limited, release_idle_slots
+from app.services.llm_singleflight import single_flight
 
 
-def load_system_prompt() -> str:
-    """Load the system prompt from file."""
-    prompt_path = Path(__file__).parent.parent / "prompts" / "trip_planner.md"
+# --- Shared LLM client ---
+
+_client: AsyncOpenAI | None = None
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """Return the process-wide async LLM client. Created lazily; reuses pooled keep-alive connections."""
+    global _client
+    if not settings.deepseek_api_key:
+        raise ValueError("DeepSeek API key is not configured")
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=settings.deepseek_api_key,
+            base_url=settings.deepseek_base_url,
+            max_retries=settings.llm_max_retries,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.llm_max_connections,
+                    max_keepalive_connections=settings.llm_max_keepalive_connections,
+                    keepalive_expiry=settings.llm_keepalive_expiry,
+                ),
+                timeout=llm_timeout(settings.llm_routes_timeout),
+            ),
+        )
+    return _client
+
+
+async def close_llm_client() -> None:
+    """Close the shared client and its connection pool, give back kept limiter slots (on application shutdown)."""
+    global _client
+    await release_idle_slots()
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def llm_timeout(read_seconds: float) -> httpx.Timeout:
+    """Per-call timeout: given read/write/pool timeout, shared connect timeout."""
+    return httpx.Timeout(read_seconds, connect=settings.llm_connect_timeout)
+
+
+async def _chat_completion(request: dict, read_timeout: float, trip_id: int | None = None) -> ChatCompletion:
+    """Non-streaming chat completion admitted by the shared rate limiter (see app.services.llm_limiter).
+
+    Identical requests already in flight are not sent again: they share that call's response.
+    """
+    async def call() -> ChatCompletion:
+        client = get_llm_client()
+        async with llm_rate_limit(request, trip_id=trip_id, timeout=read_timeout) as ticket:
+            response = await client.chat.completions.create(**request, timeout=llm_timeout(read_timeout))
+            ticket.record_usage(response.usage)
+        return response
+
+    return await single_flight(
+        request_cache_key(request),
+        call,
+        dumps=lambda response: response.model_dump_json(),
+        loads=ChatCompletion.model_validate_json,
+        timeout=settings.llm_limit_max_wait + settings.llm_connect_timeout + read_timeout,
+    )
+
+
+ROUTE_PROMPT_FILES = {
+    "markdown": "trip_planner.md",
+    "json": "trip_planner_json.md",
+}
+
+
+def load_system_prompt(output_format: str = "markdown") -> str:
+    """Load the system prompt for the given route output format from file."""
+    prompt_path = Path(__file__).parent.parent / "prompts" / ROUTE_PROMPT_FILES[output_format]
     with open(prompt_path, "r", encoding="utf-8") as f:
         return f.read()
 
 
-def build_user_prompt(trip: Trip, preferences: List[PlacePreference]) -> str:
-    """Build the user prompt with trip data and preferences."""
+def build_user_prompt(trip: Trip, preferences: List[PlacePreference], with_ids: bool = False) -> str:
+    """Build the user prompt with trip data and preferences.
+
+    With `with_ids` each preference is prefixed by "[id N]" so structured output can reference it.
+    """
     lines = [
         f"## Trip Information",
         f"- Title: {trip.title}",
@@ -36,8 +115,9 @@ def build_user_prompt(trip: Trip, preferences: List[PlacePreference]) -> str:
     for pref in preferences:
         location_str = f", {pref.location}" if pref.location else ""
         comment_str = f' - "{pref.comment}"' if pref.comment else ""
+        id_str = f"[id {pref.id}] " if with_ids else ""
         lines.append(
-            f"- {pref.city}, {pref.country}{location_str} "
+            f"- {id_str}{pref.city}, {pref.country}{location_str} "
             f"[{pref.place_type.value}] "
             f"Priority: {pref.priority}/5 "
             f"(by {pref.user.username}){comment_str}"
@@ -46,23 +126,52 @@ def build_user_prompt(trip: Trip, preferences: List[PlacePreference]) -> str:
     return "\n".join(lines)
 
 
-def parse_llm_response(content: str) -> List[dict]:
-    """Parse LLM response into route options."""
-    # The LLM will respond with structured text. We'll parse it into route options.
-    # For simplicity, we'll ask LLM to respond in a specific format and parse it.
-    
-    routes = []
-    current_route = None
-    current_section = None
-    
-    for line in content.split("\n"):
+class RouteStreamParser:
+    """Incremental parser of the LLM route response.
+
+    Feed text chunks as they arrive; each route option ("### Вариант ...") is returned
+    as soon as its block is complete, i.e. when the next header starts or on close().
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._current: dict | None = None
+        self._section: str | None = None
+        self.count = 0  # routes emitted so far
+
+    def feed(self, text: str) -> List[dict]:
+        """Consume a chunk of text. Returns routes completed by this chunk."""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        completed = []
+        for line in lines:
+            route = self._feed_line(line)
+            if route:
+                completed.append(route)
+        return completed
+
+    def close(self) -> List[dict]:
+        """Flush the last (unterminated) line and route."""
+        completed = []
+        if self._buffer:
+            route = self._feed_line(self._buffer)
+            self._buffer = ""
+            if route:
+                completed.append(route)
+        if self._current:
+            completed.append(self._finish(self._current))
+            self._current = None
+        return completed
+
+    def _feed_line(self, line: str) -> dict | None:
         line = line.strip()
+        finished = None
         
         # Detect new route option
         if line.startswith("### Вариант") or line.startswith("### Option"):
-            if current_route:
-                routes.append(current_route)
-            current_route = {
+            if self._current:
+                finished = self._finish(self._current)
+            self._current = {
                 "title": "",
                 "description": "",
                 "reasoning": "",
@@ -70,95 +179,297 @@ def parse_llm_response(content: str) -> List[dict]:
             # Extract title from the same line if present
             parts = line.split(":", 1)
             if len(parts) > 1:
-                current_route["title"] = parts[1].strip()
-            current_section = "title"
+                self._current["title"] = parts[1].strip()
+            self._section = "title"
         
-        elif current_route:
+        elif self._current:
             # Detect sections
             if "Маршрут:" in line or "Itinerary:" in line or "День" in line or "Day " in line:
-                current_section = "description"
+                self._section = "description"
             elif "Обоснование:" in line or "Reasoning:" in line or "Почему" in line:
-                current_section = "reasoning"
+                self._section = "reasoning"
             
             # Add content to current section
-            if current_section == "description":
-                current_route["description"] += line + "\n"
-            elif current_section == "reasoning":
-                current_route["reasoning"] += line + "\n"
-            elif current_section == "title" and not current_route["title"] and line:
-                current_route["title"] = line
-    
-    # Don't forget the last route
-    if current_route:
-        routes.append(current_route)
-    
-    # Clean up
-    for route in routes:
+            if self._section == "description":
+                self._current["description"] += line + "\n"
+            elif self._section == "reasoning":
+                self._current["reasoning"] += line + "\n"
+            elif self._section == "title" and not self._current["title"] and line:
+                self._current["title"] = line
+        
+        return finished
+
+    def _finish(self, route: dict) -> dict:
+        self.count += 1
         route["description"] = route["description"].strip()
         route["reasoning"] = route["reasoning"].strip()
         if not route["title"]:
-            route["title"] = f"Вариант {routes.index(route) + 1}"
-    
-    return routes
+            route["title"] = f"Вариант {self.count}"
+        return route
 
 
-async def generate_routes(trip: Trip, preferences: List[PlacePreference]) -> List[dict]:
-    """Generate route options using DeepSeek API."""
-    if not settings.deepseek_api_key:
-        raise ValueError("DeepSeek API key is not configured")
+SLOT_LABELS = {"morning": "Утро", "afternoon": "День", "evening": "Вечер"}
+
+
+def render_route_description(route: StructuredRoute) -> str:
+    """Markdown itinerary for a structured route, in the same shape as the markdown output mode."""
+    lines = ["**Маршрут:**", ""]
+    for day in route.days:
+        header = f"**День {day.day}: {day.title}**" if day.title else f"**День {day.day}:**"
+        lines.append(header)
+        for slot in day.slots:
+            lines.append(f"- {SLOT_LABELS[slot.time]}: {slot.description.strip()}")
+        lines.append("")
+    return "\n".join(lines).strip()
+
+
+def structured_route_to_dict(route: StructuredRoute, preference_ids: set[int]) -> dict:
+    """Route option dict (title, description, reasoning, route_data) from a validated structured route.
+
+    Preference ids the model made up (not in `preference_ids`) are dropped.
+    """
+    for day in route.days:
+        for slot in day.slots:
+            for place in slot.places:
+                if place.preference_id not in preference_ids:
+                    place.preference_id = None
+    return {
+        "title": route.title.strip(),
+        "description": render_route_description(route),
+        "reasoning": route.reasoning.strip(),
+        "route_data": {"days": [day.model_dump() for day in route.days]},
+    }
+
+
+class StructuredRouteStreamParser:
+    """Incremental parser of JSON route output: {"routes": [ {route}, ... ]}.
+
+    Scans the text once, tracking string/bracket state; each route object is validated
+    (StructuredRoute) and returned as soon as its closing brace arrives. Invalid route
+    objects are skipped and counted in `errors`. Same feed()/close()/count interface
+    as RouteStreamParser.
+    """
+
+    def __init__(self, preference_ids: set[int]):
+        self._preference_ids = preference_ids
+        self._depth = 0
+        self._array_depth: int | None = None  # depth inside the routes array
+        self._in_string = False
+        self._escape = False
+        self._object: list[str] | None = None  # characters of the route object being read
+        self.count = 0  # routes emitted so far
+        self.errors = 0
+        self.truncated = False  # the text ended inside a route object
+
+    def feed(self, text: str) -> List[dict]:
+        """Consume a chunk of text. Returns routes completed by this chunk."""
+        completed = []
+        for ch in text:
+            if self._object is not None:
+                self._object.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{" or ch == "[":
+                if ch == "{" and self._object is None and self._depth == self._array_depth:
+                    self._object = [ch]
+                self._depth += 1
+                if ch == "[" and self._array_depth is None:
+                    self._array_depth = self._depth
+            elif ch == "}" or ch == "]":
+                self._depth -= 1
+                if self._object is not None and self._depth == self._array_depth:
+                    route = self._finish("".join(self._object))
+                    self._object = None
+                    if route:
+                        completed.append(route)
+        return completed
+
+    def close(self) -> List[dict]:
+        """An unterminated route object at the end is incomplete: it is dropped and `truncated` is set."""
+        if self._object is not None:
+            self.errors += 1
+            self.truncated = True
+            self._object = None
+        return []
+
+    def _finish(self, text: str) -> dict | None:
+        try:
+            route = StructuredRoute.model_validate_json(text)
+        except ValidationError:
+            self.errors += 1
+            return None
+        self.count += 1
+        return structured_route_to_dict(route, self._preference_ids)
+
+
+def route_parser(preferences: List[PlacePreference]) -> RouteStreamParser | StructuredRouteStreamParser:
+    """Parser for the configured route output format."""
+    if settings.llm_routes_output_format == "json":
+        return StructuredRouteStreamParser({p.id for p in preferences})
+    return RouteStreamParser()
+
+
+def parse_llm_response(content: str) -> List[dict]:
+    """Parse LLM response into route options."""
+    # The LLM responds with structured markdown ("### Вариант N: ...", route, reasoning).
+    parser = RouteStreamParser()
+    return parser.feed(content) + parser.close()
+
+
+class LLMRouteOutputError(Exception):
+    """The route response cannot be used: cut off by max_tokens or not in the requested format."""
+
+
+def _check_route_output(finish_reason: str | None, parser: RouteStreamParser | StructuredRouteStreamParser) -> None:
+    if finish_reason == "length" or getattr(parser, "truncated", False):
+        # Saving the routes completed so far would silently drop the last ones
+        raise LLMRouteOutputError(
+            "Ответ AI оборвался на лимите длины (LLM_ROUTES_MAX_TOKENS). Попробуйте сгенерировать маршруты ещё раз."
+        )
+
+
+def _fallback_routes(content: str, parser: RouteStreamParser | StructuredRouteStreamParser) -> List[dict]:
+    """Routes from a response the configured parser found none in."""
+    if isinstance(parser, StructuredRouteStreamParser):
+        if content.lstrip().startswith(("{", "[")):
+            # JSON, but not a valid route list: the markdown parser would store raw JSON as the description
+            raise LLMRouteOutputError("AI вернул маршруты в неверном формате. Попробуйте сгенерировать ещё раз.")
+        # The model ignored the JSON format and answered in markdown
+        routes = parse_llm_response(content)
+    else:
+        routes = []
+    return routes or [_fallback_route(content)]
+
+
+def _fallback_route(content: str) -> dict:
+    """Single route holding the raw response, used when parsing found no options."""
+    return {
+        "title": "Предложенный маршрут",
+        "description": content,
+        "reasoning": "Маршрут сгенерирован на основе ваших пожеланий.",
+    }
+
+
+def _routes_api_error(e: Exception) -> Exception:
+    """Re-raise with more context for DeepSeek API errors; rate limit and auth errors keep their type."""
+    if is_rate_limited(e) or isinstance(e, openai.AuthenticationError):
+        return e
+    return Exception(f"DeepSeek API error: {str(e)}")
+
+
+def routes_request(trip: Trip, preferences: List[PlacePreference]) -> dict:
+    """Chat completion arguments for route generation (everything that determines the answer)."""
+    output_format = settings.llm_routes_output_format
+    structured = output_format == "json"
+    request = {
+        "model": settings.deepseek_model,
+        "messages": [
+            {"role": "system", "content": load_system_prompt(output_format)},
+            {"role": "user", "content": build_user_prompt(trip, preferences, with_ids=structured)},
+        ],
+        "temperature": 0.7,
+        "max_tokens": settings.llm_routes_max_tokens,
+    }
+    if structured:
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+
+def request_cache_key(request: dict) -> str:
+    """Content address of an LLM request: sha256 of its canonical JSON."""
+    canonical = json.dumps(request, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+async def generate_routes(
+    trip: Trip, preferences: List[PlacePreference], request: dict | None = None
+) -> tuple[List[dict], bool]:
+    """Generate route options using DeepSeek API. `request` is a prebuilt routes_request().
+
+    Returns (routes, fallback); fallback is True when the response was not in the requested
+    format and the routes were recovered from it by _fallback_routes.
+    """
+    try:
+        response = await _chat_completion(
+            request or routes_request(trip, preferences),
+            settings.llm_routes_timeout,
+            trip_id=trip.id,
+        )
+    except LLMRateLimitExceeded:
+        raise
+    except Exception as e:
+        raise _routes_api_error(e)
     
-    client = OpenAI(
-        api_key=settings.deepseek_api_key,
-        base_url=settings.deepseek_base_url
-    )
+    choice = response.choices[0]
+    content = choice.message.content or ""
+    parser = route_parser(preferences)
+    routes = parser.feed(content) + parser.close()
+    _check_route_output(choice.finish_reason, parser)
     
-    system_prompt = load_system_prompt()
-    user_prompt = build_user_prompt(trip, preferences)
+    if routes:
+        return routes, False
+    # Fallback if parsing failed (model ignored the requested format)
+    return _fallback_routes(content, parser), True
+
+
+async def stream_routes(
+    trip: Trip, preferences: List[PlacePreference], request: dict | None = None
+) -> AsyncIterator[tuple[dict, bool]]:
+    """Streaming variant of generate_routes: yields (route, fallback) for each option as soon as it is complete."""
+    client = get_llm_client()
+    request = request or routes_request(trip, preferences)
+    parser = route_parser(preferences)
+    content = ""
+    finish_reason = None
     
     try:
-        response = client.chat.completions.create(
-            model=settings.deepseek_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=3000,
-        )
+        # The concurrency slot is held until the whole response is streamed
+        async with llm_rate_limit(request, trip_id=trip.id, timeout=settings.llm_routes_timeout):
+            stream = await client.chat.completions.create(
+                **request,
+                stream=True,
+                timeout=llm_timeout(settings.llm_routes_timeout),
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content or ""
+                content += delta
+                for route in parser.feed(delta):
+                    yield route, False
+    except LLMRateLimitExceeded:
+        raise
     except Exception as e:
-        # Re-raise with more context for DeepSeek API errors
-        error_msg = str(e)
-        if "insufficient_quota" in error_msg or "429" in error_msg:
-            raise Exception(f"Error code: 429 - {str(e)}")
-        elif "rate_limit" in error_msg.lower():
-            raise Exception(f"Error code: 429 - Rate limit exceeded: {str(e)}")
-        elif "invalid_api_key" in error_msg.lower() or "authentication" in error_msg.lower():
-            raise Exception(f"Error code: 401 - Invalid API key: {str(e)}")
-        else:
-            raise Exception(f"DeepSeek API error: {str(e)}")
-    
-    content = response.choices[0].message.content
-    routes = parse_llm_response(content)
+        raise _routes_api_error(e)
     
-    # Fallback if parsing failed
-    if not routes:
-        routes = [{
-            "title": "Предложенный маршрут",
-            "description": content,
-            "reasoning": "Маршрут сгенерирован на основе ваших пожеланий.",
-        }]
+    for route in parser.close():
+        yield route, False
+    # Routes already sent are not saved: the caller stores them only after the stream ends
+    _check_route_output(finish_reason, parser)
     
-    return routes
+    # Fallback if parsing failed (model ignored the requested format)
+    if parser.count == 0:
+        for route in _fallback_routes(content, parser):
+            yield route, True
 
 
 def load_place_suggestions_prompt(
-    country: str, city: str, exclude_names: List[str] | None = None
+    country: str, city: str, exclude_names: List[str] | None = None, count: str = "5–8"
 ) -> str:
-    """Load place suggestions prompt from file and substitute country/city and optional exclude list."""
+    """Load place suggestions prompt from file and substitute country/city, count and optional exclude list."""
     prompt_path = Path(__file__).parent.parent / "prompts" / "place_suggestions.md"
     with open(prompt_path, "r", encoding="utf-8") as f:
         template = f.read()
-    template = template.replace("{{country}}", country).replace("{{city}}", city)
+    template = template.replace("{{country}}", country).replace("{{city}}", city).replace("{{count}}", count)
     if exclude_names:
         names = [n.strip() for n in exclude_names if n and isinstance(n, str)]
         if names:
@@ -172,35 +483,30 @@ def load_place_suggestions_prompt(
 
 
 async def suggest_places(
-    country: str, city: str, exclude_names: List[str] | None = None
+    country: str,
+    city: str,
+    exclude_names: List[str] | None = None,
+    count: str = "5–8",
+    max_results: int = 10,
 ) -> List[dict]:
-    """Suggest popular places for a city. Returns list of {name, place_type}."""
-    if not settings.deepseek_api_key:
-        raise ValueError("DeepSeek API key is not configured")
+    """Suggest popular places for a city. Returns up to `max_results` of {name, place_type, reason}."""
     country = (country or "").strip()
     city = (city or "").strip()
     if not country or not city:
         raise ValueError("country and city are required")
 
-    client = OpenAI(
-        api_key=settings.deepseek_api_key,
-        base_url=settings.deepseek_base_url,
-    )
-    user_prompt = load_place_suggestions_prompt(country, city, exclude_names)
+    user_prompt = load_place_suggestions_prompt(country, city, exclude_names, count)
 
     try:
-        response = client.chat.completions.create(
-            model=settings.deepseek_model,
-            messages=[{"role": "user", "content": user_prompt}],
-            temperature=0.5,
-            max_tokens=800,
-        )
+        response = await _chat_completion({
+            "model": settings.deepseek_model,
+            "messages": [{"role": "user", "content": user_prompt}],
+            "temperature": 0.5,
+            "max_tokens": 80 * max_results,
+        }, settings.llm_suggestions_timeout)
     except Exception as e:
-        error_msg = str(e)
-        if "429" in error_msg or "rate_limit" in error_msg.lower():
-            raise Exception(f"Rate limit: {e}")
-        if "invalid_api_key" in error_msg.lower() or "authentication" in error_msg.lower():
-            raise Exception(f"Invalid API key: {e}")
+        if is_rate_limited(e) or isinstance(e, openai.AuthenticationError):
+            raise
         raise Exception(f"API error: {e}")
 
     content = (response.choices[0].message.content or "").strip()
@@ -233,7 +539,7 @@ async def suggest_places(
             "place_type": pt,
             "reason": reason or None,
         })
-    return result[:10]
+    return result[:max_results]
 
 
 # --- Packing checklist ---
@@ -306,31 +612,24 @@ async def generate_packing_list(
     places_from_route: str | None = None,
 ) -> dict:
     """Generate packing checklist content using LLM. Returns dict for TripChecklist.content."""
-    if not settings.deepseek_api_key:
-        raise ValueError("DeepSeek API key is not configured")
-    client = OpenAI(
-        api_key=settings.deepseek_api_key,
-        base_url=settings.deepseek_base_url,
-    )
     system_prompt = load_packing_prompt()
     user_prompt = build_packing_user_prompt(
         trip, winner_route_title, winner_route_description, places_from_route
     )
     try:
-        response = client.chat.completions.create(
-            model=settings.deepseek_model,
-            messages=[
+        response = await _chat_completion({
+            "model": settings.deepseek_model,
+            "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            temperature=0.5,
-            max_tokens=1500,
-        )
+            "temperature": 0.5,
+            "max_tokens": 1500,
+        }, settings.llm_packing_timeout, trip_id=trip.id)
     except Exception as e:
-        err = str(e).lower()
-        if "429" in err or "rate_limit" in err:
-            raise Exception("Превышен лимит запросов. Попробуйте позже.")
-        if "api key" in err or "invalid" in err:
+        if is_rate_limited(e):
+            raise
+        if isinstance(e, openai.AuthenticationError):
             raise Exception("Ошибка API. Проверьте настройки.")
         raise Exception(f"Ошибка генерации: {e}")
     text = (response.choices[0].message.content or "").strip()
@@ -349,12 +648,6 @@ async def explain_why_not_included(
     comment: str | None,
 ) -> str:
     """Ask LLM why a place was not included in a given route. Returns one short phrase."""
-    if not settings.deepseek_api_key:
-        raise ValueError("DeepSeek API key is not configured")
-    client = OpenAI(
-        api_key=settings.deepseek_api_key,
-        base_url=settings.deepseek_base_url,
-    )
     place_label = place_name.strip() or f"{city}, {country}"
     user_prompt = (
         f"Маршрут: «{route_title}»\n\n"
@@ -364,16 +657,77 @@ async def explain_why_not_included(
         + "\n\nПочему это место не вошло в данный маршрут? Ответь одной короткой фразой на русском (до 15 слов), без вступления."
     )
     try:
-        response = client.chat.completions.create(
-            model=settings.deepseek_model,
-            messages=[{"role": "user", "content": user_prompt}],
-            temperature=0.3,
-            max_tokens=150,
-        )
+        response = await _chat_completion({
+            "model": settings.deepseek_model,
+            "messages": [{"role": "user", "content": user_prompt}],
+            "temperature": 0.3,
+            "max_tokens": 150,
+        }, settings.llm_explain_timeout)
     except Exception as e:
-        err = str(e).lower()
-        if "429" in err or "rate_limit" in err:
-            raise Exception("Превышен лимит запросов. Попробуйте позже.")
+        if is_rate_limited(e):
+            raise
         raise Exception(f"Ошибка: {e}")
     text = (response.choices[0].message.content or "").strip()
     return text[:300] if text else "Не удалось сформировать объяснение."
+
+
+async def explain_why_not_included_batch(
+    route_title: str,
+    route_description: str,
+    places: List[dict],
+) -> dict[int, str]:
+    """Explain in one LLM call why each of several places was not included in a route.
+
+    `places` items: {id, place_name, country, city, priority, comment}.
+    Returns {id: short phrase}; ids the model skipped are absent.
+    """
+    if not places:
+        return {}
+    place_lines = []
+    for p in places:
+        place_label = (p.get("place_name") or "").strip() or f"{p['city']}, {p['country']}"
+        line = f"- id {p['id']}: {place_label} ({p['city']}, {p['country']}), приоритет {p['priority']}/5."
+        if p.get("comment"):
+            line += f' Комментарий участника: "{p["comment"]}".'
+        place_lines.append(line)
+    user_prompt = (
+        f"Маршрут: «{route_title}»\n\n"
+        f"Описание маршрута:\n{(route_description or '')[:1500]}\n\n"
+        "Места из пожеланий участников, которые не вошли в этот маршрут:\n"
+        + "\n".join(place_lines)
+        + "\n\nДля каждого места объясни, почему оно не вошло в данный маршрут: одна короткая фраза на русском "
+        "(до 15 слов), без вступления. Ответь ТОЛЬКО валидным JSON-объектом без markdown, "
+        'где ключ — id места, значение — фраза. Пример: {"12": "Слишком далеко от остальных точек маршрута"}'
+    )
+    try:
+        response = await _chat_completion({
+            "model": settings.deepseek_model,
+            "messages": [{"role": "user", "content": user_prompt}],
+            "temperature": 0.3,
+            "max_tokens": 60 * len(places) + 50,
+        }, settings.llm_explain_batch_timeout)
+    except Exception as e:
+        if is_rate_limited(e):
+            raise
+        raise Exception(f"Ошибка: {e}")
+    content = (response.choices[0].message.content or "").strip()
+    if content.startswith("```"):
+        content = content.split("\n", 1)[-1] if "\n" in content else content[3:]
+    if content.endswith("```"):
+        content = content.rsplit("```", 1)[0].strip()
+    try:
+        raw = json.loads(content)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(raw, dict):
+        return {}
+    wanted = {p["id"] for p in places}
+    result = {}
+    for key, reason in raw.items():
+        try:
+            pref_id = int(key)
+        except (TypeError, ValueError):
+            continue
+        if pref_id in wanted and isinstance(reason, str) and reason.strip():
+            result[pref_id] = reason.strip()[:300]
+    return result
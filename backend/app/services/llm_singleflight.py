@@ -0,0 +1,184 @@
+"""Single-flight coalescing of identical in-flight LLM requests.
+
+Callers with the same request key (sha256 of the chat request) share one upstream
+call. Within a process they await the same task. Across workers (Postgres only)
+the leader claims the key with a row in llm_shared_responses (INSERT … ON CONFLICT,
+committed at once, so no connection is held during the call), then writes the
+response into the row and sends NOTIFY on the `llm_shared_responses` channel. A
+worker that found the key claimed waits for the notification (app.services.notifications)
+and takes the response instead of calling again; without a notification (the
+listener runs in API processes only) it rechecks every `llm_single_flight_poll_interval`
+seconds with a short transaction. A claim expires after the expected call duration,
+so a crashed leader is replaced. Only calls in flight are shared — this is not a cache.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, TypeVar
+from sqlalchemy import select, update, delete, func
+from app.config import settings
+from app.database import engine, dialect_insert
+from app.models import LLMSharedResponse
+from app.services.notifications import listen
+from app.utils.cache import get_cache_stats
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CHANNEL = "llm_shared_responses"
+SHARED_RESPONSE_TTL = timedelta(hours=1)
+CLAIM_MARGIN = 30.0  # seconds a claim outlasts the expected call
+
+single_flight_stats = get_cache_stats("llm_single_flight")  # hit = call joined one in flight in this process
+handoff_stats = get_cache_stats("llm_single_flight_handoff")  # after waiting for another worker: hit = took its response
+
+_in_flight: dict[str, asyncio.Task] = {}
+_waiting: dict[str, set[asyncio.Future]] = {}  # key -> futures of calls waiting for another worker
+
+
+def _wake(key: str | None) -> None:
+    """Let waiters of `key` (None: all) check the shared row again."""
+    keys = list(_waiting) if key is None else [key]
+    for k in keys:
+        for fut in _waiting.get(k, ()):
+            if not fut.done():
+                fut.set_result(None)
+
+
+listen(CHANNEL, lambda message: _wake(message["key"]), lambda: _wake(None))
+
+
+async def _wait_for_notification(key: str) -> None:
+    fut = asyncio.get_running_loop().create_future()
+    _waiting.setdefault(key, set()).add(fut)
+    try:
+        await asyncio.wait_for(fut, settings.llm_single_flight_poll_interval)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        waiters = _waiting[key]
+        waiters.discard(fut)
+        if not waiters:
+            del _waiting[key]
+
+
+class _Claimed(Exception):
+    """The key is claimed by a call in flight in another worker."""
+
+
+async def _take_or_claim(key: str, started: datetime, claim_seconds: float) -> str | None:
+    """Response another worker published since `started`, or None once this worker holds the claim.
+
+    Raises _Claimed while another worker's call is in flight.
+    """
+    now = datetime.utcnow()
+    async with engine.begin() as conn:
+        row = (await conn.execute(
+            select(LLMSharedResponse.response, LLMSharedResponse.created_at).where(LLMSharedResponse.key == key)
+        )).first()
+        if row is not None and row.response is not None and row.created_at >= started:
+            return row.response
+        # Take over a finished call's row (not a cache) or an expired claim; a live claim stays
+        claim = {"response": None, "claimed_until": now + timedelta(seconds=claim_seconds), "created_at": now}
+        stmt = dialect_insert(LLMSharedResponse).values(key=key, **claim)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_=claim,
+            where=LLMSharedResponse.response.isnot(None) | (LLMSharedResponse.claimed_until < now),
+        ).returning(LLMSharedResponse.key)
+        if (await conn.execute(stmt)).first() is None:
+            raise _Claimed()
+    return None
+
+
+async def _publish(key: str, response: str | None) -> None:
+    """Write the response into the claimed row (None: drop the claim, the call failed) and notify waiters."""
+    now = datetime.utcnow()
+    async with engine.begin() as conn:
+        await conn.execute(delete(LLMSharedResponse).where(
+            LLMSharedResponse.key != key,
+            LLMSharedResponse.created_at < now - SHARED_RESPONSE_TTL,
+            LLMSharedResponse.response.isnot(None) | (LLMSharedResponse.claimed_until < now),
+        ))
+        if response is None:
+            await conn.execute(delete(LLMSharedResponse).where(
+                LLMSharedResponse.key == key,
+                LLMSharedResponse.response.is_(None),
+            ))
+        else:
+            await conn.execute(update(LLMSharedResponse).where(LLMSharedResponse.key == key).values(
+                response=response, claimed_until=None, created_at=now,
+            ))
+        await conn.execute(select(func.pg_notify(CHANNEL, json.dumps({"key": key}))))
+
+
+async def _lead(
+    key: str, call: Callable[[], Awaitable[T]], dumps: Callable[[T], str], loads: Callable[[str], T], timeout: float
+) -> T:
+    """Run the call for this process, coordinating with other workers through a claim row."""
+    if engine.dialect.name != "postgresql":
+        return await call()
+
+    started = datetime.utcnow()
+    waited = False
+    while True:
+        try:
+            shared = await _take_or_claim(key, started, timeout + CLAIM_MARGIN)
+            break
+        except _Claimed:
+            waited = True
+            await _wait_for_notification(key)
+    if shared is not None:
+        handoff_stats.hit()
+        return loads(shared)
+    if waited:
+        handoff_stats.miss()
+
+    try:
+        result = await call()
+    except BaseException:
+        try:
+            await _publish(key, None)
+        except Exception:
+            logger.exception("Failed to release LLM call claim %s", key)
+        raise
+    try:
+        await _publish(key, dumps(result))
+    except Exception:
+        logger.exception("Failed to publish shared LLM response %s", key)
+    return result
+
+
+def _forget(key: str, task: asyncio.Task) -> None:
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+    if not task.cancelled():
+        task.exception()  # retrieved here so a failure nobody awaits anymore is not logged as unhandled
+
+
+async def single_flight(
+    key: str,
+    call: Callable[[], Awaitable[T]],
+    dumps: Callable[[T], str],
+    loads: Callable[[str], T],
+    timeout: float,
+) -> T:
+    """Run `call` once for all concurrent callers with the same `key` and return its result to each.
+
+    `dumps`/`loads` serialize the result for waiters in other worker processes; `timeout`
+    is the longest the call is expected to take (its claim expires after that).
+    The shared call runs as its own task, so a caller that goes away does not cancel it for the rest.
+    """
+    if not settings.llm_single_flight:
+        return await call()
+    task = _in_flight.get(key)
+    if task is None:
+        single_flight_stats.miss()
+        task = asyncio.create_task(_lead(key, call, dumps, loads, timeout))
+        _in_flight[key] = task
+        task.add_done_callback(lambda t: _forget(key, t))
+    else:
+        single_flight_stats.hit()
+    return await asyncio.shield(task)
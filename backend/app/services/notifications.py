@@ -0,0 +1,64 @@
+"""Postgres LISTEN/NOTIFY fan-in for every worker process.
+
+Each API process keeps one connection that LISTENs on the channels registered
+with `listen`; a notification's JSON payload is passed to the channel callback.
+Notifications are sent inside the writing transaction (pg_notify or a trigger),
+so they are delivered only if it commits.
+
+While the connection is being (re)established notifications may be lost, so on
+every connect each channel's `on_connect` callback is called to resynchronize.
+Without Postgres nothing is listened for.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Callable
+from sqlalchemy import text
+from app.config import settings
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+_channels: dict[str, tuple[Callable[[Any], None], Callable[[], None]]] = {}
+
+
+def listen(channel: str, callback: Callable[[Any], None], on_connect: Callable[[], None]) -> None:
+    """Call `callback(message)` for every notification on `channel` (run_notification_listener)."""
+    _channels[channel] = (callback, on_connect)
+
+
+def _on_notification(connection, pid, channel: str, payload: str) -> None:
+    try:
+        _channels[channel][0](json.loads(payload))
+    except Exception:
+        logger.exception("Bad notification on %s: %r", channel, payload)
+
+
+async def run_notification_listener(stop: asyncio.Event) -> None:
+    """Deliver notifications of the registered channels until `stop` is set."""
+    if engine.dialect.name != "postgresql" or not _channels:
+        return
+    while not stop.is_set():
+        try:
+            async with engine.connect() as conn:
+                await conn.execution_options(isolation_level="AUTOCOMMIT")
+                driver = (await conn.get_raw_connection()).driver_connection  # asyncpg connection
+                for channel in _channels:
+                    await driver.add_listener(channel, _on_notification)
+                for _, on_connect in _channels.values():
+                    on_connect()
+                try:
+                    while not stop.is_set():
+                        try:
+                            await asyncio.wait_for(stop.wait(), timeout=settings.pg_listener_keepalive)
+                        except asyncio.TimeoutError:
+                            await conn.execute(text("SELECT 1"))  # notice a dropped connection
+                finally:
+                    for channel in _channels:
+                        await driver.remove_listener(channel, _on_notification)
+        except Exception:
+            logger.exception("Notification listener failed, reconnecting")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=settings.pg_listener_keepalive)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,63 @@
+"""bcrypt hashing off the event loop and the shared threadpool.
+
+Hashes run in a small ProcessPoolExecutor (`password_hash_workers` processes per
+API worker). At most `password_hash_max_pending` hashes may be queued or running;
+beyond that a request fails immediately with PasswordHasherBusy (HTTP 503)
+instead of waiting behind a login storm.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional, TypeVar
+from app.config import settings
+from app.utils.security import hash_password, verify_and_update_password
+
+T = TypeVar("T")
+
+_executor: ProcessPoolExecutor | None = None
+_pending = 0  # touched only from the event loop thread
+
+
+class PasswordHasherBusy(Exception):
+    """Too many password hashes in flight."""
+
+    def __init__(self):
+        super().__init__("Сервер перегружен входами, попробуйте через несколько секунд.")
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: forking a process with a running event loop and threads is unsafe
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def _run(func: Callable[..., T], *args) -> T:
+    global _pending
+    if _pending >= settings.password_hash_max_pending:
+        raise PasswordHasherBusy()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """(matches, new hash if the stored one should be upgraded)."""
+    return await _run(verify_and_update_password, password, hashed_password)
+
+
+def shutdown_password_hasher() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
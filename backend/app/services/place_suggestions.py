@@ -0,0 +1,43 @@
+"""Cross-trip cache of AI place suggestions per (country, city).
+
+The LLM is asked once per city for a superset of places, without any trip-specific
+exclude list; each request then filters out places already in the trip locally.
+"""
+from typing import List
+from app.config import settings
+from app.services.llm_service import suggest_places
+from app.utils.cache import TTLLRUCache
+from app.utils.text import fold_text
+
+# How many places to request for the shared per-city list, and how many to return
+SUPERSET_COUNT = "15–20"
+SUPERSET_MAX_RESULTS = 20
+RESULT_LIMIT = 10
+
+_city_places = TTLLRUCache(
+    "place_suggestions",
+    maxsize=settings.suggestions_cache_size,
+    ttl=settings.suggestions_cache_ttl_hours * 3600,
+)
+
+
+def city_key(country: str, city: str) -> tuple[str, str]:
+    """Cache key: ("Россия", " москва ") and ("Rossiya", "Moskva") share one entry."""
+    return fold_text(country), fold_text(city)
+
+
+async def suggest_city_places(
+    country: str, city: str, exclude_names: List[str] | None = None
+) -> List[dict]:
+    """Suggestions for a city without places from `exclude_names`. Calls the LLM only on cache miss."""
+    key = city_key(country, city)
+    places = _city_places.get(key)
+    if places is None:
+        places = await suggest_places(
+            country=country, city=city, count=SUPERSET_COUNT, max_results=SUPERSET_MAX_RESULTS
+        )
+        if places:  # don't cache an unparsable answer
+            _city_places.set(key, places)
+
+    excluded = {fold_text(n) for n in exclude_names or []}
+    return [p for p in places if fold_text(p["name"]) not in excluded][:RESULT_LIMIT]
@@ -0,0 +1,42 @@
+"""Serialized responses of trip read endpoints (per worker).
+
+An entry is keyed by (trip id, trip version, endpoint, viewer) — the viewer only for
+responses that differ per user, like user_reacted. The version comes from the access
+check and is bumped by every write in the trip (app.services.trip_events), so an entry
+can never be served after a write; dropping the trip's entries when its events are
+delivered (in every worker) only frees the space early.
+"""
+from typing import Any, Awaitable, Callable, Hashable
+from fastapi import Response
+from pydantic import TypeAdapter
+from app.config import settings
+from app.utils.cache import TTLLRUCache
+from app.utils.deps import TripAccess, trip_cache_headers
+
+_responses = TTLLRUCache(
+    "trip_response", maxsize=settings.trip_response_cache_size, ttl=settings.trip_response_cache_ttl
+)
+
+
+async def cached_trip_response(
+    access: TripAccess,
+    endpoint: str,
+    adapter: TypeAdapter,
+    build: Callable[[], Awaitable[Any]],
+    per_viewer: bool = False,
+) -> Response:
+    """JSON response of `build()` (dumped with `adapter`), from the cache when the trip has not changed."""
+    key: Hashable = (access.trip.id, access.trip.version, endpoint, access.user.id if per_viewer else None)
+    body = _responses.get(key)
+    if body is None:
+        body = adapter.dump_json(adapter.validate_python(await build(), from_attributes=True))
+        _responses.set(key, body)
+    return Response(content=body, media_type="application/json", headers=trip_cache_headers(access))
+
+
+def forget_trip_responses(trip_id: int | None) -> None:
+    """Drop the cached responses of a trip (None: of all trips)."""
+    if trip_id is None:
+        _responses.clear()
+    else:
+        _responses.pop_where(lambda key: key[0] == trip_id)
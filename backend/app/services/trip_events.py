@@ -0,0 +1,105 @@
+"""Live trip events for participants' open pages (SSE / WebSocket, see app.routers.events).
+
+Write endpoints call `publish_trip_event` before committing. It also increments
+trips.version in the same transaction, which is the ETag of the trip's GET
+endpoints (app.utils.deps.get_trip_read_access). On Postgres the event
+is sent with pg_notify on the `trip_events` channel inside that transaction, so it
+is delivered only if the write commits and reaches the subscribers of every
+worker (app.services.notifications). Without Postgres it is kept on the session
+and delivered in this process after commit.
+
+An event is {"type", "trip_id", "version", "data"}; `data` holds ids and small values only
+(NOTIFY payloads are limited to 8000 bytes), clients re-fetch what changed.
+A subscriber that falls behind, or misses events while the listener reconnects,
+gets a single {"type": "resync"} and should reload the trip. Delivery in a worker also
+drops the trip's cached responses there (app.services.response_cache), and on a
+membership change its cached memberships (app.utils.deps).
+"""
+import asyncio
+import json
+from contextlib import contextmanager
+from typing import Iterator
+from sqlalchemy import event, select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import engine
+from app.models.trip import Trip
+from app.services.notifications import listen
+from app.services.response_cache import forget_trip_responses
+from app.utils.deps import forget_trip
+
+CHANNEL = "trip_events"
+_PENDING = "pending_trip_events"  # session.info key (non-Postgres delivery after commit)
+MEMBERSHIP_EVENTS = {"participant_joined", "participant_left", "trip_deleted"}
+
+_subscribers: dict[int, set[asyncio.Queue]] = {}
+
+
+def _resync_event(trip_id: int) -> dict:
+    return {"type": "resync", "trip_id": trip_id, "version": None, "data": {}}
+
+
+def _deliver(trip_event: dict) -> None:
+    forget_trip_responses(trip_event["trip_id"])
+    if trip_event["type"] in MEMBERSHIP_EVENTS:
+        forget_trip(trip_event["trip_id"])
+    for queue in _subscribers.get(trip_event["trip_id"], ()):
+        try:
+            queue.put_nowait(trip_event)
+        except asyncio.QueueFull:
+            # Too far behind: replace the backlog with one resync
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(_resync_event(trip_event["trip_id"]))
+
+
+def _resync_all() -> None:
+    forget_trip_responses(None)
+    forget_trip(None)
+    for trip_id, queues in _subscribers.items():
+        for queue in queues:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(_resync_event(trip_id))
+
+
+listen(CHANNEL, _deliver, _resync_all)
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_pending(session: Session) -> None:
+    for trip_event in session.info.pop(_PENDING, []):
+        _deliver(trip_event)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+async def publish_trip_event(trip_id: int, event_type: str, data: dict, db: AsyncSession) -> None:
+    """Bump the trip version and send an event to the trip's subscribers when the current transaction commits."""
+    version = (await db.execute(update(Trip).filter(Trip.id == trip_id).values(
+        version=Trip.version + 1,
+        updated_at=Trip.updated_at,  # a vote or a reaction is not an edit of the trip itself
+    ).returning(Trip.version))).scalar_one_or_none()  # None: the trip was just deleted
+    payload = json.dumps({"type": event_type, "trip_id": trip_id, "version": version, "data": data}, default=str)
+    if engine.dialect.name == "postgresql":
+        await db.execute(select(func.pg_notify(CHANNEL, payload)))
+    else:
+        db.sync_session.info.setdefault(_PENDING, []).append(json.loads(payload))
+
+
+@contextmanager
+def subscribe(trip_id: int) -> Iterator[asyncio.Queue]:
+    """Queue receiving the trip's events while the block runs."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.trip_events_queue_size)
+    _subscribers.setdefault(trip_id, set()).add(queue)
+    try:
+        yield queue
+    finally:
+        queues = _subscribers[trip_id]
+        queues.discard(queue)
+        if not queues:
+            del _subscribers[trip_id]
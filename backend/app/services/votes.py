@@ -0,0 +1,75 @@
+"""Denormalized vote counters (route_options.vote_count).
+
+Every vote insert/delete changes the counter in the same transaction, so results and
+winner lookups read the column instead of aggregating votes. `reconcile_vote_counts`
+rebuilds the counters from the votes table (`python -m app.reconcile_votes`), e.g. after
+votes were removed outside the API.
+"""
+from datetime import datetime
+from sqlalchemy import select, update, delete, func, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import dialect_insert
+from app.models import RouteOption, Vote
+from app.services.trip_events import publish_trip_event
+
+
+async def change_vote_count(route_ids: list[int], delta: int, db: AsyncSession) -> None:
+    """Add `delta` to the vote counters of the routes (not committed)."""
+    if not route_ids or not delta:
+        return
+    await db.execute(update(RouteOption).filter(
+        RouteOption.id.in_(route_ids)
+    ).values(
+        vote_count=RouteOption.vote_count + delta
+    ).execution_options(synchronize_session=False))
+
+
+async def reconcile_vote_counts(db: AsyncSession, trip_id: int | None = None) -> int:
+    """Recount votes of all routes (or of one trip). Returns the number of corrected routes."""
+    counted = select(func.count(Vote.id)).filter(
+        Vote.route_option_id == RouteOption.id
+    ).scalar_subquery()
+    stmt = update(RouteOption).filter(RouteOption.vote_count != counted)
+    if trip_id is not None:
+        stmt = stmt.filter(RouteOption.trip_id == trip_id)
+    corrected_trip_ids = (await db.execute(
+        stmt.values(vote_count=counted).returning(RouteOption.trip_id).execution_options(synchronize_session=False)
+    )).scalars().all()
+    for corrected_trip_id in sorted(set(corrected_trip_ids)):
+        await publish_trip_event(corrected_trip_id, "votes_changed", {}, db)
+    await db.commit()
+    return len(corrected_trip_ids)
+
+
+async def replace_ballot(trip_id: int, user_id: int, route_ids: list[int], db: AsyncSession) -> None:
+    """Make `route_ids` the user's only votes in the trip and update the counters (not committed).
+
+    Votes already cast are kept, others are removed with one DELETE, missing ones are added
+    with INSERT ... ON CONFLICT DO NOTHING, so concurrent ballots of the same user cannot
+    fail on uq_user_route_vote or count a vote twice. Ids of routes outside the trip are
+    skipped; the caller rejects such a ballot.
+    """
+    wanted = sorted(set(route_ids))
+
+    removed_query = delete(Vote).filter(Vote.trip_id == trip_id, Vote.user_id == user_id)
+    if wanted:
+        removed_query = removed_query.filter(Vote.route_option_id.notin_(wanted))
+    removed = (await db.execute(
+        removed_query.returning(Vote.route_option_id).execution_options(synchronize_session=False)
+    )).scalars().all()
+
+    added = []
+    if wanted:
+        trip_routes = select(
+            literal(trip_id), literal(user_id), RouteOption.id, literal(datetime.utcnow())
+        ).filter(RouteOption.trip_id == trip_id, RouteOption.id.in_(wanted))
+        added = (await db.execute(
+            dialect_insert(Vote).from_select(
+                ["trip_id", "user_id", "route_option_id", "created_at"], trip_routes
+            ).on_conflict_do_nothing(
+                index_elements=["user_id", "route_option_id"]
+            ).returning(Vote.route_option_id)
+        )).scalars().all()
+
+    await change_vote_count(list(added), 1, db)
+    await change_vote_count(list(removed), -1, db)
@@ -0,0 +1,102 @@
+"""In-process caches and their hit/miss counters (per worker process)."""
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+
+class CacheStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = Lock()
+
+    def hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def evict(self) -> None:
+        with self._lock:
+            self.evictions += 1
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
+
+
+_registry: dict[str, CacheStats] = {}
+
+
+def get_cache_stats(name: str) -> CacheStats:
+    """Counters for the named cache (created on first use)."""
+    if name not in _registry:
+        _registry[name] = CacheStats(name)
+    return _registry[name]
+
+
+def all_cache_stats() -> dict[str, dict]:
+    return {name: stats.as_dict() for name, stats in sorted(_registry.items())}
+
+
+class TTLLRUCache:
+    """Size-bounded LRU cache with a per-entry TTL. Thread-safe; counts hits/misses under `name`."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl  # seconds
+        self.stats = get_cache_stats(name)
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.stats.hit()
+                    return value
+                del self._data[key]
+        self.stats.miss()
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.evict()
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Remove every entry whose key matches `predicate`."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,44 +1,126 @@
+import time
+from datetime import datetime
 from typing import Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
 from app.database import get_db
 from app.models.user import User
+from app.models.trip import Trip, TripParticipant, ParticipantRole
+from app.services.invalidation import register_invalidation_handler
+from app.utils.cache import TTLLRUCache
 from app.utils.security import decode_token
 
 # Bearer token security scheme
 security = HTTPBearer()
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """
-    Get current authenticated user from JWT token.
-    Raises 401 if token is invalid or user not found.
-    """
-    token = credentials.credentials
-    payload = decode_token(token)
+class Principal:
+    """The authenticated user as request handlers see it: a snapshot of the users row,
+    cached per worker and not attached to any session."""
+
+    def __init__(self, id: int, email: str, username: str, is_active: bool, created_at: datetime):
+        self.id = id
+        self.email = email
+        self.username = username
+        self.is_active = is_active
+        self.created_at = created_at
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(user.id, user.email, user.username, user.is_active, user.created_at)
+
+
+# Per worker. Token -> (user id, expiry timestamp, token type): a repeated token skips signature verification.
+_verified_tokens = TTLLRUCache(
+    "verified_token", maxsize=settings.verified_token_cache_size, ttl=settings.access_token_expire_minutes * 60
+)
+# User id -> Principal of an active user. Changes of users rows (deactivation) are pushed
+# by a trigger through app.services.invalidation; the TTL bounds staleness without Postgres.
+_principals = TTLLRUCache("principal", maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl)
+
+
+def forget_principal(user_id: int | None) -> None:
+    """Drop a cached user (None: all users)."""
+    if user_id is None:
+        _principals.clear()
+    else:
+        _principals.pop(user_id)
+
+
+register_invalidation_handler("principal", forget_principal)
+
+
+def _token_claims(token: str) -> tuple[int, float, str | None] | None:
+    """(user id, expiry timestamp, token type) of a valid, unexpired token, None otherwise."""
+    cached = _verified_tokens.get(token)
+    if cached is not None:
+        if cached[1] > time.time():
+            return cached
+        _verified_tokens.pop(token)
+        return None
     
+    payload = decode_token(token)
     if payload is None:
+        return None
+    claims = (int(payload.get("sub")), payload["exp"], payload.get("type"))
+    _verified_tokens.set(token, claims)
+    return claims
+
+
+def _token_user_id(token: str) -> int | None:
+    """User id from a valid, unexpired access token, None otherwise."""
+    claims = _token_claims(token)
+    if claims is None or claims[2] != "access":
+        return None
+    return claims[0]
+
+
+def _access_token_user_id(token: str) -> int:
+    """User id from a valid access token. Raises 401 otherwise."""
+    claims = _token_claims(token)
+    
+    if claims is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Недействительный или истёкший токен",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Check token type
-    if payload.get("type") != "access":
+    # Check token type (a refresh token is not accepted here)
+    if claims[2] != "access":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный тип токена",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user_id = int(payload.get("sub"))
-    user = db.query(User).filter(User.id == user_id).first()
-    
+    return claims[0]
+
+
+def access_token_expiry(token: str) -> float:
+    """Expiry timestamp of a valid access token (now if it is no longer valid)."""
+    claims = _token_claims(token)
+    return claims[1] if claims is not None else time.time()
+
+
+async def _principal(user_id: int, db: AsyncSession) -> Principal | None:
+    """Cached principal of an active user; a miss (or an inactive user) reads the users row."""
+    principal = _principals.get(user_id)
+    if principal is None:
+        user = await db.get(User, user_id)
+        if user is None:
+            return None
+        principal = Principal.from_user(user)
+        if principal.is_active:
+            _principals.set(user_id, principal)
+    return principal
+
+
+def _check_user(user: Principal | None) -> Principal:
+    """Raises 401 for a missing or deactivated user."""
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -56,10 +138,23 @@ def get_current_user(
     return user
 
 
-def get_current_user_optional(
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> Principal:
+    """
+    Get current authenticated user from JWT token.
+    Raises 401 if token is invalid or user not found.
+    Usually served from the token and principal caches without a query.
+    """
+    user_id = _access_token_user_id(credentials.credentials)
+    return _check_user(await _principal(user_id, db))
+
+
+async def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
-    db: Session = Depends(get_db)
-) -> Optional[User]:
+    db: AsyncSession = Depends(get_db)
+) -> Optional[Principal]:
     """
     Get current user if authenticated, None otherwise.
     Useful for endpoints that work both with and without auth.
@@ -67,13 +162,123 @@ def get_current_user_optional(
     if credentials is None:
         return None
     
-    token = credentials.credentials
-    payload = decode_token(token)
-    
-    if payload is None or payload.get("type") != "access":
+    user_id = _token_user_id(credentials.credentials)
+    if user_id is None:
         return None
     
-    user_id = int(payload.get("sub"))
-    user = db.query(User).filter(User.id == user_id, User.is_active == True).first()
-    
-    return user
+    user = await _principal(user_id, db)
+    return user if user is not None and user.is_active else None
+
+
+# --- Trip access ---
+
+# (trip_id, user_id) -> ParticipantRole, per worker. Only memberships are cached (not
+# their absence). Join/leave/delete events drop the trip's entries in every worker
+# (app.services.trip_events); the TTL bounds staleness if an event is missed.
+_memberships = TTLLRUCache(
+    "trip_membership", maxsize=settings.trip_access_cache_size, ttl=settings.trip_access_cache_ttl
+)
+
+
+def forget_trip_member(trip_id: int, user_id: int) -> None:
+    """Drop a cached membership (call after join/leave)."""
+    _memberships.pop((trip_id, user_id))
+
+
+def forget_trip(trip_id: int | None) -> None:
+    """Drop all cached memberships of a trip (call after deleting it; None: of all trips)."""
+    if trip_id is None:
+        _memberships.clear()
+    else:
+        _memberships.pop_where(lambda key: key[0] == trip_id)
+
+
+class TripAccess:
+    """Current user, the trip from the path and the user's role in it."""
+
+    def __init__(self, user: Principal, trip: Trip, role: ParticipantRole):
+        self.user = user
+        self.trip = trip
+        self.role = role
+
+    @property
+    def is_organizer(self) -> bool:
+        return self.role == ParticipantRole.ORGANIZER
+
+
+async def get_trip_access(
+    trip_id: int,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> TripAccess:
+    """
+    Resolve user, trip and membership for a trip-scoped endpoint.
+    Raises 401 (token/user), 404 (no trip) or 403 (not a participant).
+    With the user and membership cached this is one query: the trip row.
+    """
+    return await resolve_trip_access(trip_id, credentials.credentials, db)
+
+
+async def resolve_trip_access(trip_id: int, token: str, db: AsyncSession) -> TripAccess:
+    """get_trip_access for a token that does not come from the Authorization header (event streams)."""
+    user_id = _access_token_user_id(token)
+    user = _check_user(await _principal(user_id, db))
+    role = _memberships.get((trip_id, user_id))
+    if role is not None:
+        trip = await db.get(Trip, trip_id)
+        if trip is None:
+            raise HTTPException(status_code=404, detail="Поездка не найдена")
+        return TripAccess(user, trip, role)
+
+    row = (await db.execute(select(Trip, TripParticipant.role).outerjoin(TripParticipant, and_(
+        TripParticipant.trip_id == Trip.id,
+        TripParticipant.user_id == user_id,
+    )).filter(Trip.id == trip_id))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Поездка не найдена")
+    trip, role = row
+    if role is None:
+        raise HTTPException(status_code=403, detail="Вы не являетесь участником этой поездки")
+    _memberships.set((trip_id, user_id), role)
+    return TripAccess(user, trip, role)
+
+
+def trip_etag(access: TripAccess) -> str:
+    """Weak ETag of trip data as the user sees it (some responses differ per viewer, e.g. user_reacted)."""
+    return f'W/"{access.trip.id}-{access.trip.version}-{access.user.id}"'
+
+
+def trip_cache_headers(access: TripAccess) -> dict[str, str]:
+    return {"ETag": trip_etag(access), "Cache-Control": "private, no-cache"}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison (RFC 9110): W/ prefixes are ignored
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+async def get_trip_read_access(
+    request: Request,
+    response: Response,
+    access: TripAccess = Depends(get_trip_access)
+) -> TripAccess:
+    """get_trip_access for GET endpoints of trip data, with conditional requests.
+
+    The trip version is loaded by the access check anyway, so an If-None-Match with the
+    current ETag is answered 304 here, before the endpoint runs its queries.
+    """
+    headers = trip_cache_headers(access)
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return access
+
+
+async def get_trip_organizer_access(access: TripAccess = Depends(get_trip_access)) -> TripAccess:
+    """get_trip_access for organizer-only endpoints (403 for other participants)."""
+    if not access.is_organizer:
+        raise HTTPException(status_code=403, detail="Только организатор может выполнить это действие")
+    return access
@@ -4,8 +4,8 @@ from passlib.context import CryptContext
 from jose import jwt, JWTError
 from app.config import settings
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (hashes with a different cost are upgraded on login, see verify_and_update_password)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 
 
 def hash_password(password: str) -> str:
@@ -18,6 +18,11 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """Verify a password; if it matches and the hash is outdated (cost changed), also return a new hash."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def create_access_token(user_id: int) -> str:
     """Create a JWT access token."""
     expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
@@ -0,0 +1,23 @@
+"""Text normalization for matching user-entered place names."""
+import re
+import unicodedata
+
+# Russian -> Latin (simplified BGN-style), so "Москва" and "Moskva" fold to the same key
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya",
+})
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def fold_text(s: str | None) -> str:
+    """Case-, whitespace-, punctuation-, diacritics- and script-insensitive form of a name."""
+    if not s:
+        return ""
+    s = s.casefold().translate(_TRANSLIT)
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", s).split())
@@ -0,0 +1,35 @@
+"""Standalone generation worker: `python -m app.worker`.
+
+Runs `JOB_WORKERS` (or `--concurrency N`) coroutines that process the generation job
+queue, so LLM throughput can be scaled separately from the API processes.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+from app.config import settings
+from app.database import engine
+from app.services.jobs import start_workers
+from app.services.llm_service import close_llm_client
+
+
+async def main(concurrency: int) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    tasks = start_workers(concurrency, stop)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await close_llm_client()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TripTogether generation worker")
+    parser.add_argument("--concurrency", type=int, default=max(settings.job_workers, 1))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.concurrency))
@@ -0,0 +1,108 @@
+"""
+Общие фикстуры тестов: приложение на временной SQLite-базе, без Postgres и без вызовов LLM
+
+Переменные окружения задаются до импорта app, поэтому тесты не трогают базу из .env.
+Бенчмарки (test_query_plans, test_trip_delete, test_login_throughput) создают
+свои подключения и по-прежнему запускаются только с BENCH_* переменными.
+"""
+import asyncio
+import os
+import tempfile
+import uuid
+
+import pytest
+
+_DB_DIR = tempfile.mkdtemp(prefix="triptogether-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/test.db"
+os.environ["JWT_SECRET"] = "test-secret"
+os.environ["DEEPSEEK_API_KEY"] = "test"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["JOB_WORKERS"] = "0"
+os.environ["LLM_REQUESTS_PER_MINUTE"] = "0"
+os.environ["LLM_TOKENS_PER_MINUTE"] = "0"
+os.environ["LLM_MAX_CONCURRENCY"] = "0"
+
+
+async def _create_tables() -> None:
+    from app.database import Base, engine
+    import app.models  # noqa: F401  (registers the tables)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient of the whole application; one database for the session, tests create their own users and trips."""
+    from fastapi.testclient import TestClient
+
+    asyncio.run(_create_tables())
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def register(client):
+    """register() -> (user id, Authorization headers) of a new user."""
+    def register() -> tuple[int, dict]:
+        name = uuid.uuid4().hex[:12]
+        response = client.post("/api/auth/register", json={
+            "email": f"{name}@example.com", "username": name, "password": "secret123",
+        })
+        assert response.status_code == 201, response.text
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return client.get("/api/auth/me", headers=headers).json()["id"], headers
+
+    return register
+
+
+@pytest.fixture
+def trip(client, register):
+    """A trip with its organizer: (trip json, organizer headers)."""
+    _, headers = register()
+    response = client.post("/api/trips", json={
+        "title": "Поездка", "start_date": "2026-11-01", "end_date": "2026-11-05",
+    }, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json(), headers
+
+
+@pytest.fixture
+def join(client):
+    """join(trip, headers): the user joins the trip by its invite code."""
+    def join(trip: dict, headers: dict) -> None:
+        response = client.post("/api/trips/join", json={"invite_code": trip["invite_code"]}, headers=headers)
+        assert response.status_code == 200, response.text
+
+    return join
+
+
+async def _add_routes(trip_id: int, count: int) -> list[int]:
+    from sqlalchemy import update
+    from app.database import SessionLocal
+    from app.models import GenerationStatus, RouteOption, Trip
+
+    async with SessionLocal() as db:
+        routes = [
+            RouteOption(trip_id=trip_id, option_number=i, title=f"Вариант {i}", description=f"Маршрут {i}")
+            for i in range(1, count + 1)
+        ]
+        db.add_all(routes)
+        # As route generation does: the trip is ready for voting and its version changes
+        await db.execute(update(Trip).filter(Trip.id == trip_id).values(
+            generation_status=GenerationStatus.COMPLETED, version=Trip.version + 1,
+        ))
+        await db.commit()
+        return [route.id for route in routes]
+
+
+@pytest.fixture
+def add_routes():
+    """add_routes(trip_id, count=3) -> ids of route options written directly, without the LLM."""
+    def add_routes(trip_id: int, count: int = 3) -> list[int]:
+        return asyncio.run(_add_routes(trip_id, count))
+
+    return add_routes
@@ -0,0 +1,133 @@
+"""
+Кэш в памяти воркера (app.utils.cache.TTLLRUCache): ограничение размера с вытеснением
+давно не использованных записей, срок жизни записи и счётчики попаданий
+"""
+import threading
+import uuid
+
+import pytest
+
+from app.utils import cache as cache_module
+from app.utils.cache import TTLLRUCache, all_cache_stats, get_cache_stats
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def _cache(maxsize: int = 3, ttl: float = 10.0) -> TTLLRUCache:
+    return TTLLRUCache(f"test-{uuid.uuid4().hex}", maxsize=maxsize, ttl=ttl)
+
+
+def test_get_set_and_stats():
+    cache = _cache()
+
+    assert cache.get("a") is None
+    assert cache.get("a", "default") == "default"
+    cache.set("a", 1)
+    cache.set("a", 2)
+
+    assert cache.get("a") == 2
+    assert len(cache) == 1
+    assert cache.stats.as_dict() == {"hits": 1, "misses": 2, "evictions": 0, "hit_ratio": 0.3333}
+
+
+def test_falsy_values_are_cached():
+    cache = _cache()
+    cache.set("zero", 0)
+    cache.set("empty", [])
+
+    assert cache.get("zero", "miss") == 0
+    assert cache.get("empty", "miss") == []
+
+
+def test_least_recently_used_is_evicted():
+    cache = _cache(maxsize=3)
+    for key in "abc":
+        cache.set(key, key)
+    cache.get("a")  # "b" is now the least recently used
+
+    cache.set("d", "d")
+
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["a", "c", "d"]
+    assert cache.stats.evictions == 1
+
+
+def test_entries_expire(clock):
+    cache = _cache(ttl=10)
+    cache.set("a", 1)
+
+    clock.now += 9.9
+    assert cache.get("a") == 1
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_set_renews_ttl(clock):
+    cache = _cache(ttl=10)
+    cache.set("a", 1)
+    clock.now += 8
+    cache.set("a", 2)
+    clock.now += 8
+
+    assert cache.get("a") == 2
+
+
+def test_pop_pop_where_and_clear():
+    cache = _cache(maxsize=10)
+    for trip_id in (1, 2):
+        for user_id in (10, 20):
+            cache.set((trip_id, user_id), True)
+
+    cache.pop((1, 10))
+    cache.pop((9, 9))  # missing keys are ignored
+    assert len(cache) == 3
+
+    cache.pop_where(lambda key: key[0] == 2)
+    assert [key for key in cache._data] == [(1, 20)]
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_stats_are_shared_by_name():
+    name = f"test-{uuid.uuid4().hex}"
+    first = TTLLRUCache(name, maxsize=1, ttl=1)
+    second = TTLLRUCache(name, maxsize=1, ttl=1)
+
+    first.get("a")
+    second.get("a")
+
+    assert get_cache_stats(name).misses == 2
+    assert all_cache_stats()[name]["misses"] == 2
+
+
+def test_concurrent_use_keeps_size_bound():
+    cache = _cache(maxsize=50, ttl=60)
+
+    def work(offset: int) -> None:
+        for i in range(2000):
+            cache.set(offset + i % 100, i)
+            cache.get(offset + (i * 7) % 100)
+
+    threads = [threading.Thread(target=work, args=(n * 1000,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache) == 50
+    assert cache.stats.hits + cache.stats.misses == 4 * 2000
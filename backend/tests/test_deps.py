@@ -0,0 +1,38 @@
+"""
+Проверка токенов в зависимостях (app.utils.deps): access-токен принимается,
+refresh-токен и испорченный токен — 401 с разными сообщениями
+"""
+import pytest
+from fastapi import HTTPException
+
+from app.utils.deps import _access_token_user_id, _token_user_id
+from app.utils.security import create_access_token, create_refresh_token
+
+
+def test_access_token_accepted():
+    token = create_access_token(42)
+
+    assert _access_token_user_id(token) == 42
+    assert _access_token_user_id(token) == 42  # from the verified token cache
+    assert _token_user_id(token) == 42
+
+
+@pytest.mark.parametrize("repeat", [1, 2])
+def test_refresh_token_rejected_as_access_token(repeat):
+    token = create_refresh_token(42)
+
+    for _ in range(repeat):
+        with pytest.raises(HTTPException) as exc:
+            _access_token_user_id(token)
+        assert exc.value.status_code == 401
+        assert exc.value.detail == "Неверный тип токена"
+    assert _token_user_id(token) is None
+
+
+def test_invalid_token_rejected():
+    with pytest.raises(HTTPException) as exc:
+        _access_token_user_id(create_access_token(42) + "x")
+
+    assert exc.value.status_code == 401
+    assert exc.value.detail == "Недействительный или истёкший токен"
+    assert _token_user_id("not a token") is None
@@ -0,0 +1,109 @@
+"""
+Поиск похожих пожеланий (app.services.duplicates, app.utils.text): нормализация
+названий и триграммное сходство, совпадающее с pg_trgm
+"""
+import pytest
+
+from app.services import duplicates
+from app.services.duplicates import FoldedPlace, fold_place, match_score, name_score, similarity, word_similarity
+from app.utils.text import fold_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    (None, ""),
+    ("", ""),
+    ("  Москва  ", "moskva"),
+    ("МОСКВА", "moskva"),
+    ("Эрмитаж", "ermitazh"),
+    ("Ёлки", "elki"),
+    ("Санкт-Петербург", "sankt peterburg"),
+    ("Красная площадь", "krasnaya ploshchad"),
+    ("Café  Pushkin!", "cafe pushkin"),
+    ("Moskva", "moskva"),
+    ("Schönbrunn", "schonbrunn"),
+    ("Музей_«Гараж»", "muzei garazh"),
+])
+def test_fold_text(text, expected):
+    assert fold_text(text) == expected
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Эрмитаж", "ermitazh"),
+    ("Эрмитаж", "ЭРМИТАЖ"),
+    ("Москва", "Moskva"),
+    ("Санкт-Петербург", "Sankt Peterburg"),
+    ("Красная площадь", "krasnaya  ploshchad"),
+])
+def test_fold_text_transliteration_matches(a, b):
+    assert fold_text(a) == fold_text(b)
+
+
+# Reference values of pg_trgm (Postgres documentation and SELECT similarity(...))
+@pytest.mark.parametrize("a, b, expected", [
+    ("word", "word", 1.0),
+    ("word", "two words", 4 / 11),
+    ("abc", "xyz", 0.0),
+    ("", "word", 0.0),
+    ("ermitazh", "hermitage", 4 / 15),
+    ("gosudarstvennyi ermitazh", "ermitazh", 9 / 25),
+])
+def test_similarity(a, b, expected):
+    assert similarity(a, b) == pytest.approx(expected)
+    assert similarity(b, a) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("word", "two words", 0.8),
+    ("word", "word", 1.0),
+    ("ermitazh", "gosudarstvennyi ermitazh", 1.0),
+    ("gosudarstvennyi ermitazh", "ermitazh", 9 / 25),
+    ("ermitazh", "hermitage", 4 / 9),
+    ("", "word", 0.0),
+    ("word", "", 0.0),
+])
+def test_word_similarity(a, b, expected):
+    assert word_similarity(a, b) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    # Contained name scores as a full match in either direction
+    ("gosudarstvennyi ermitazh", "ermitazh", 1.0),
+    ("ermitazh", "gosudarstvennyi ermitazh", 1.0),
+    ("ermitazh", "hermitage", 4 / 9),
+])
+def test_name_score(a, b, expected):
+    assert name_score(a, b) == pytest.approx(expected)
+
+
+@pytest.fixture
+def threshold(monkeypatch):
+    monkeypatch.setattr(duplicates.settings, "duplicate_similarity_threshold", 0.5)
+
+
+@pytest.mark.parametrize("query, candidate, expected", [
+    # Same place written in another script or in full
+    (("Россия", "Санкт-Петербург", "Эрмитаж"), ("Rossiya", "Sankt-Peterburg", "ermitazh"), 1.0),
+    (("Россия", "Санкт-Петербург", "Эрмитаж"), ("Россия", "Санкт-Петербург", "Государственный Эрмитаж"), 1.0),
+    (("Россия", "Москва", None), ("Россия", "Moskva", "Кремль"), 1.0),
+    # The English name is not a transliteration: below the threshold
+    (("Россия", "Санкт-Петербург", "Эрмитаж"), ("Россия", "Санкт-Петербург", "Hermitage"), None),
+    # Another country, city or location
+    (("Россия", "Москва", "Кремль"), ("Беларусь", "Москва", "Кремль"), None),
+    (("Россия", "Москва", "Кремль"), ("Россия", "Казань", "Кремль"), None),
+    (("Россия", "Москва", "Кремль"), ("Россия", "Москва", "Третьяковская галерея"), None),
+    # A location is required to match when the query has one
+    (("Россия", "Москва", "Кремль"), ("Россия", "Москва", None), None),
+])
+def test_match_score(threshold, query, candidate, expected):
+    score = match_score(fold_place(*query), fold_place(*candidate))
+
+    assert score == (pytest.approx(expected) if expected is not None else None)
+
+
+def test_match_score_follows_threshold(monkeypatch):
+    query = FoldedPlace("rossiya", "sankt peterburg", "ermitazh")
+    candidate = FoldedPlace("rossiya", "sankt peterburg", "hermitage")
+
+    monkeypatch.setattr(duplicates.settings, "duplicate_similarity_threshold", 0.4)
+
+    assert match_score(query, candidate) == pytest.approx(4 / 9)
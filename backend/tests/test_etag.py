@@ -0,0 +1,86 @@
+"""
+ETag и 304 для GET-эндпоинтов поездки (app.utils.deps.get_trip_read_access): ETag — версия
+поездки, запрос с актуальным If-None-Match получает 304 без тела, любая запись меняет версию
+"""
+import pytest
+
+from app.utils.deps import _etag_matches
+
+ENDPOINTS = [
+    "/api/trips/{id}",
+    "/api/trips/{id}/participants",
+    "/api/trips/{id}/preferences",
+    "/api/trips/{id}/routes",
+    "/api/trips/{id}/my-votes",
+    "/api/trips/{id}/voting-results",
+    "/api/trips/{id}/checklist",
+    "/api/preferences/trips/{id}/reactions",
+]
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_not_modified(client, trip, endpoint):
+    trip_data, organizer = trip
+    url = endpoint.format(id=trip_data["id"])
+
+    first = client.get(url, headers=organizer)
+    assert first.status_code == 200, first.text
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"') and first.headers["cache-control"] == "private, no-cache"
+
+    second = client.get(url, headers=organizer | {"If-None-Match": etag})
+
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+
+def test_write_changes_etag(client, trip):
+    trip_data, organizer = trip
+    url = f"/api/trips/{trip_data['id']}/preferences"
+    etag = client.get(url, headers=organizer).headers["etag"]
+
+    client.post(url, json={"country": "Россия", "city": "Москва"}, headers=organizer)
+    response = client.get(url, headers=organizer | {"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert [p["city"] for p in response.json()] == ["Москва"]
+    assert response.headers["etag"] != etag
+    # The new ETag is the same on every trip endpoint
+    assert client.get(f"/api/trips/{trip_data['id']}", headers=organizer).headers["etag"] == response.headers["etag"]
+
+
+def test_etag_differs_per_viewer(client, trip, register, join):
+    trip_data, organizer = trip
+    _, member = register()
+    join(trip_data, member)
+    url = f"/api/trips/{trip_data['id']}/preferences"
+    organizer_etag = client.get(url, headers=organizer).headers["etag"]
+
+    response = client.get(url, headers=member | {"If-None-Match": organizer_etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != organizer_etag
+
+
+def test_access_is_checked_before_304(client, trip, register):
+    trip_data, organizer = trip
+    _, stranger = register()
+    url = f"/api/trips/{trip_data['id']}"
+    etag = client.get(url, headers=organizer).headers["etag"]
+
+    assert client.get(url, headers=stranger | {"If-None-Match": etag}).status_code == 403
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 403  # no token
+
+
+@pytest.mark.parametrize("if_none_match, matches", [
+    (None, False),
+    ("", False),
+    ('W/"1-2-3"', True),
+    ('"1-2-3"', True),  # weak comparison ignores W/
+    ('W/"1-2-4"', False),
+    ('W/"1-1-3", W/"1-2-3"', True),
+    ("*", True),
+])
+def test_etag_matches(if_none_match, matches):
+    assert _etag_matches(if_none_match, 'W/"1-2-3"') is matches
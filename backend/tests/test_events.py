@@ -0,0 +1,83 @@
+"""
+Поток событий поездки по WebSocket (app.routers.events): события доходят до участников,
+а поток закрывается, когда поездку удалили, пользователь из неё вышел или истёк его токен
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from jose import jwt
+from starlette.websockets import WebSocketDisconnect
+
+from app.config import settings
+
+
+def _events_url(trip_id: int, headers: dict) -> str:
+    return f"/api/trips/{trip_id}/events?access_token={headers['Authorization'][7:]}"
+
+
+def _close_code(ws) -> int:
+    with pytest.raises(WebSocketDisconnect) as exc:
+        while True:
+            ws.receive_json()
+    return exc.value.code
+
+
+def test_not_a_participant_is_rejected(client, trip, register):
+    trip_data, _ = trip
+    _, stranger = register()
+
+    with client.websocket_connect(_events_url(trip_data["id"], stranger)) as ws:
+        assert _close_code(ws) == 4403
+
+
+def test_events_are_delivered(client, trip, register, join):
+    trip_data, organizer = trip
+    member_id, member = register()
+
+    with client.websocket_connect(_events_url(trip_data["id"], organizer)) as ws:
+        join(trip_data, member)
+        trip_event = ws.receive_json()
+
+    assert trip_event["type"] == "participant_joined"
+    assert trip_event["data"]["user_id"] == member_id
+
+
+def test_stream_closes_when_trip_is_deleted(client, trip):
+    trip_data, organizer = trip
+
+    with client.websocket_connect(_events_url(trip_data["id"], organizer)) as ws:
+        assert client.delete(f"/api/trips/{trip_data['id']}", headers=organizer).status_code == 204
+        assert ws.receive_json()["type"] == "trip_deleted"
+        assert _close_code(ws) == 4404
+
+
+def test_stream_closes_when_user_leaves(client, trip, register, join):
+    trip_data, organizer = trip
+    member_id, member = register()
+    other_id, other = register()
+    join(trip_data, member)
+    join(trip_data, other)
+
+    with client.websocket_connect(_events_url(trip_data["id"], member)) as ws:
+        # Another participant leaving does not affect the stream
+        assert client.post(f"/api/trips/{trip_data['id']}/leave", headers=other).status_code == 204
+        assert ws.receive_json()["data"]["user_id"] == other_id
+        assert client.post(f"/api/trips/{trip_data['id']}/leave", headers=member).status_code == 204
+        assert ws.receive_json()["data"]["user_id"] == member_id
+        assert _close_code(ws) == 4403
+
+
+def test_stream_closes_when_token_expires(client, trip):
+    trip_data, organizer = trip
+    user_id = client.get("/api/auth/me", headers=organizer).json()["id"]
+    token = jwt.encode({
+        "sub": str(user_id),
+        "exp": datetime.utcnow() + timedelta(seconds=2),
+        "type": "access",
+    }, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+
+    started = time.monotonic()
+    with client.websocket_connect(f"/api/trips/{trip_data['id']}/events?access_token={token}") as ws:
+        assert _close_code(ws) == 4401
+    assert time.monotonic() - started < settings.trip_events_keepalive
@@ -0,0 +1,195 @@
+"""
+Лимитер вызовов LLM (app.services.llm_limiter): оценка токенов, пополнение бакетов,
+локальный бюджет воркера и очередь по поездкам
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import LLMRateBucket
+from app.services import llm_limiter
+from app.services.llm_limiter import _FairTurns, _LocalBudget, _refill, estimate_tokens
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(llm_limiter.settings, "llm_requests_per_minute", 60)
+    monkeypatch.setattr(llm_limiter.settings, "llm_tokens_per_minute", 6000)
+    monkeypatch.setattr(llm_limiter.settings, "llm_local_budget_share", 0.1)
+
+
+def _bucket(requests: float, tokens: float) -> LLMRateBucket:
+    return LLMRateBucket(key="k", request_tokens=requests, token_tokens=tokens, updated_at=T0)
+
+
+@pytest.mark.parametrize("request_, expected", [
+    ({"messages": []}, 0),
+    ({"messages": [{"role": "user", "content": "a" * 30}], "max_tokens": 100}, 110),
+    ({"messages": [{"content": "a" * 10}, {"content": None}, {"content": "b" * 2}]}, 4),
+    ({"messages": [{"content": "a" * 2}], "max_tokens": None}, 0),
+])
+def test_estimate_tokens(request_, expected):
+    assert estimate_tokens(request_) == expected
+
+
+@pytest.mark.parametrize("elapsed, expected", [
+    (0, (0, 0)),
+    (1, (1, 100)),
+    (30, (30, 3000)),
+    (600, (60, 6000)),  # capped at the per-minute limit
+    (-5, (0, 0)),  # clock went back
+])
+def test_refill(limits, elapsed, expected):
+    bucket = _bucket(0, 0)
+
+    _refill(bucket, T0 + timedelta(seconds=elapsed))
+
+    assert (bucket.request_tokens, bucket.token_tokens) == pytest.approx(expected)
+    assert bucket.updated_at == T0 + timedelta(seconds=elapsed)
+
+
+def test_refill_pays_off_negative_balance(limits):
+    bucket = _bucket(-10, -600)
+
+    _refill(bucket, T0 + timedelta(seconds=20))
+
+    assert (bucket.request_tokens, bucket.token_tokens) == pytest.approx((10, 1400))
+
+
+def test_refill_unlimited(monkeypatch):
+    monkeypatch.setattr(llm_limiter.settings, "llm_requests_per_minute", 0)
+    monkeypatch.setattr(llm_limiter.settings, "llm_tokens_per_minute", 0)
+    bucket = _bucket(5, 5)
+
+    _refill(bucket, T0 + timedelta(seconds=60))
+
+    assert (bucket.request_tokens, bucket.token_tokens) == (5, 5)
+
+
+def test_local_budget_draws_a_share(limits):
+    budget = _LocalBudget()
+    bucket = _bucket(60, 6000)
+    assert not budget.covers(100)
+
+    budget.draw(bucket, 100)
+
+    assert (budget.requests, budget.tokens) == pytest.approx((6, 600))
+    assert (bucket.request_tokens, bucket.token_tokens) == pytest.approx((54, 5400))
+    for _ in range(6):
+        assert budget.covers(100)
+        budget.take(100)
+    assert not budget.covers(100)
+
+
+def test_local_budget_draws_more_than_share_for_large_call(limits):
+    budget = _LocalBudget()
+    bucket = _bucket(60, 6000)
+
+    budget.draw(bucket, 2000)
+
+    assert budget.tokens == pytest.approx(2000)
+    assert bucket.token_tokens == pytest.approx(4000)
+
+
+def test_local_budget_waits_for_refill(limits):
+    budget = _LocalBudget()
+    bucket = _bucket(0.5, 100)
+
+    # Missing: 0.5 request (0.5 s at 60/min) and 400 tokens (4 s at 6000/min)
+    assert budget.wait_for(bucket, 500) == pytest.approx(4)
+    assert budget.wait_for(_bucket(1, 6000), 500) == 0
+
+
+def test_local_budget_call_larger_than_limit_needs_full_bucket(limits):
+    budget = _LocalBudget()
+
+    assert budget.wait_for(_bucket(60, 6000), 10_000) == 0
+    assert budget.wait_for(_bucket(60, 3000), 10_000) == pytest.approx(30)
+
+
+def test_local_budget_refund_and_debt(limits):
+    budget = _LocalBudget()
+    budget.draw(_bucket(60, 6000), 100)
+    budget.take(500)
+    budget.refund(-300)  # used 800 tokens instead of 500
+    assert budget.tokens == pytest.approx(-200)
+
+    bucket = _bucket(60, 6000)
+    budget.settle_debt(bucket)
+
+    assert budget.tokens == 0
+    assert bucket.token_tokens == pytest.approx(5800)
+
+
+def test_local_budget_expires(limits, monkeypatch):
+    budget = _LocalBudget()
+    budget.draw(_bucket(60, 6000), 100)
+    now = llm_limiter.time.monotonic()
+    monkeypatch.setattr(llm_limiter.time, "monotonic", lambda: now + _LocalBudget.LIFETIME + 1)
+
+    assert not budget.covers(1)
+    assert (budget.requests, budget.tokens) == (0, 0)
+
+
+def test_local_budget_exhaust_keeps_debt(limits):
+    budget = _LocalBudget()
+    budget.draw(_bucket(60, 6000), 100)
+    budget.take(1000)
+
+    budget.exhaust()
+
+    assert budget.requests == 0
+    assert budget.tokens == pytest.approx(-400)
+
+
+def test_fair_turns_round_robin_by_trip():
+    async def run():
+        turns = _FairTurns()
+        order = []
+        release = asyncio.Event()
+
+        async def call(trip_id, name):
+            async with turns.turn(trip_id):
+                order.append(name)
+                if name == "a1":
+                    await release.wait()
+
+        first = asyncio.create_task(call(1, "a1"))
+        await asyncio.sleep(0)
+        tasks = [first]
+        for trip_id, name in [(1, "a2"), (1, "a3"), (2, "b1"), (3, "c1"), (2, "b2")]:
+            tasks.append(asyncio.create_task(call(trip_id, name)))
+            await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_fair_turns_cancelled_waiter_passes_turn():
+    async def run():
+        turns = _FairTurns()
+        order = []
+        release = asyncio.Event()
+
+        async def call(trip_id, name):
+            async with turns.turn(trip_id):
+                order.append(name)
+                if name == "a1":
+                    await release.wait()
+
+        first = asyncio.create_task(call(1, "a1"))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(call(2, "b1"))
+        last = asyncio.create_task(call(3, "c1"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        release.set()
+        await asyncio.gather(first, last)
+        return order
+
+    assert asyncio.run(run()) == ["a1", "c1"]
@@ -0,0 +1,78 @@
+"""
+Бенчмарк проверки паролей (bcrypt в пуле процессов, app.services.password_hasher)
+
+Показывает, сколько входов в секунду выдерживает один воркер API и сколько это
+на одно ядро пула, и проверяет, что при переполнении очереди лишние запросы
+сразу получают отказ (503), а не ждут.
+
+    BENCH_PASSWORD_HASHING=1 BCRYPT_ROUNDS=12 PASSWORD_HASH_WORKERS=4 \\
+        pytest tests/test_login_throughput.py -s
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+pytestmark = pytest.mark.skipif(not os.getenv("BENCH_PASSWORD_HASHING"), reason="BENCH_PASSWORD_HASHING не задан")
+
+LOGINS = 200
+PASSWORD = "correct horse battery staple"
+
+
+@pytest.fixture(scope="module")
+def hasher():
+    from app.services import password_hasher
+
+    yield password_hasher
+    password_hasher.shutdown_password_hasher()
+
+
+def test_logins_per_second(hasher):
+    from app.config import settings
+
+    async def run() -> float:
+        hashed = await hasher.hash_password_async(PASSWORD)
+        await asyncio.gather(*(hasher.verify_password_async(PASSWORD, hashed) for _ in range(settings.password_hash_workers)))  # warm up
+        limit = asyncio.Semaphore(settings.password_hash_max_pending)
+
+        async def login() -> bool:
+            async with limit:
+                valid, _ = await hasher.verify_password_async(PASSWORD, hashed)
+                return valid
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(login() for _ in range(LOGINS)))
+        elapsed = time.perf_counter() - started
+        assert all(results)
+        return elapsed
+
+    elapsed = asyncio.run(run())
+    cores = min(settings.password_hash_workers, os.cpu_count() or 1)
+    rate = LOGINS / elapsed
+    print(f"\nbcrypt cost {settings.bcrypt_rounds}, {settings.password_hash_workers} процессов: "
+          f"{rate:.1f} входов/с, {rate / cores:.1f} входов/с на ядро")
+
+
+def test_overload_is_rejected_fast(hasher):
+    from app.config import settings
+
+    async def run() -> tuple[int, float]:
+        hashed = await hasher.hash_password_async(PASSWORD)
+        rejected_after = []
+
+        async def login():
+            started = time.perf_counter()
+            try:
+                await hasher.verify_password_async(PASSWORD, hashed)
+            except hasher.PasswordHasherBusy:
+                rejected_after.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(login() for _ in range(settings.password_hash_max_pending * 3)))
+        return len(rejected_after), max(rejected_after, default=0.0)
+
+    rejected, slowest_rejection = asyncio.run(run())
+    print(f"\nОтклонено {rejected} из {settings.password_hash_max_pending * 3}, "
+          f"самый медленный отказ {slowest_rejection * 1000:.2f} мс")
+    assert rejected == settings.password_hash_max_pending * 2
+    assert slowest_rejection < 0.01
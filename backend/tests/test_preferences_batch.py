@@ -0,0 +1,92 @@
+"""
+Пакетный импорт пожеланий POST /api/trips/{id}/preferences:batch: результат по каждому
+элементу — создано, дубликат (уже в поездке или выше в списке) или отклонено по лимиту
+"""
+from app.config import settings
+
+
+def _batch(client, trip_id: int, items: list[dict], headers: dict):
+    return client.post(f"/api/trips/{trip_id}/preferences:batch", json={"items": items}, headers=headers)
+
+
+def _summary(response) -> list[tuple]:
+    return [
+        (r["index"], r["status"], r["existing_preference_id"], r["preference"] and r["preference"]["id"])
+        for r in response.json()["results"]
+    ]
+
+
+def test_batch_reports_each_item(client, trip, register, join):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    _, member = register()
+    join(trip_data, member)
+    existing = client.post(f"/api/trips/{trip_id}/preferences", json={
+        "country": "Россия", "city": "Санкт-Петербург", "location": "Эрмитаж",
+    }, headers=organizer).json()["id"]
+
+    response = _batch(client, trip_id, [
+        {"country": "Россия", "city": "санкт-петербург", "location": "Государственный Эрмитаж"},
+        {"country": "Россия", "city": "Казань", "location": "Кремль"},
+        {"country": "Россия", "city": "Kazan", "location": "КРЕМЛЬ"},
+        {"country": "Россия", "city": "Сочи", "priority": 5, "comment": "Море"},
+    ], member)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["created"] == 2
+    (_, _, _, kazan), (_, _, _, sochi) = [r for r in _summary(response) if r[1] == "created"]
+    assert _summary(response) == [
+        (0, "duplicate", existing, None),
+        (1, "created", None, kazan),
+        (2, "duplicate", kazan, None),
+        (3, "created", None, sochi),
+    ]
+    created = response.json()["results"][3]["preference"]
+    assert (created["city"], created["priority"], created["comment"]) == ("Сочи", 5, "Море")
+    assert created["trip_id"] == trip_id and created["username"] == client.get("/api/auth/me", headers=member).json()["username"]
+
+    preferences = client.get(f"/api/trips/{trip_id}/preferences", headers=organizer).json()
+    assert sorted(p["id"] for p in preferences) == sorted([existing, kazan, sochi])
+
+
+def test_batch_rejects_items_over_limit(client, trip, monkeypatch):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    client.post(f"/api/trips/{trip_id}/preferences", json={"country": "Россия", "city": "Москва"}, headers=organizer)
+    monkeypatch.setattr(settings, "max_preferences_per_trip", 3)
+
+    response = _batch(client, trip_id, [
+        {"country": "Россия", "city": "Казань"},
+        {"country": "Россия", "city": "Казань"},  # a duplicate does not take a slot
+        {"country": "Россия", "city": "Сочи"},
+        {"country": "Россия", "city": "Калининград"},
+    ], organizer)
+
+    assert response.status_code == 200, response.text
+    assert [(r[0], r[1]) for r in _summary(response)] == [
+        (0, "created"), (1, "duplicate"), (2, "created"), (3, "rejected"),
+    ]
+    assert response.json()["results"][3]["message"] == "Максимум 3 пожеланий на поездку"
+    assert len(client.get(f"/api/trips/{trip_id}/preferences", headers=organizer).json()) == 3
+
+
+def test_batch_of_duplicates_creates_nothing(client, trip):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    client.post(f"/api/trips/{trip_id}/preferences", json={"country": "Россия", "city": "Москва"}, headers=organizer)
+    version = client.get(f"/api/trips/{trip_id}", headers=organizer).headers["etag"]
+
+    response = _batch(client, trip_id, [{"country": "Россия", "city": "Moskva"}], organizer)
+
+    assert response.json()["created"] == 0
+    assert _summary(response)[0][1] == "duplicate"
+    # Nothing written: the trip version (ETag) is unchanged
+    assert client.get(f"/api/trips/{trip_id}", headers=organizer).headers["etag"] == version
+
+
+def test_batch_validation_and_access(client, trip, register):
+    trip_data, organizer = trip
+    _, stranger = register()
+
+    assert _batch(client, trip_data["id"], [], organizer).status_code == 422
+    assert _batch(client, trip_data["id"], [{"country": "Россия", "city": "Москва"}], stranger).status_code == 403
@@ -0,0 +1,99 @@
+"""
+Кэш готовых ответов GET-эндпоинтов поездки (app.services.response_cache): повторный запрос
+берётся из кэша, а после любой записи (новая версия поездки) ответ строится заново
+"""
+import asyncio
+
+from sqlalchemy import update
+
+from app.database import SessionLocal
+from app.models import PlacePreference, Trip
+from app.services import response_cache
+from app.utils.cache import get_cache_stats
+
+stats = get_cache_stats("trip_response")
+
+
+def _cached_keys(trip_id: int) -> list:
+    return [key for key in response_cache._responses._data if key[0] == trip_id]
+
+
+def test_repeated_read_is_served_from_cache(client, trip):
+    trip_data, organizer = trip
+    url = f"/api/trips/{trip_data['id']}/preferences"
+    client.post(url, json={"country": "Россия", "city": "Москва"}, headers=organizer)
+
+    first = client.get(url, headers=organizer)
+    hits = stats.hits
+    second = client.get(url, headers=organizer)
+
+    assert stats.hits == hits + 1
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+
+
+def test_write_invalidates_cached_response(client, trip):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    url = f"/api/trips/{trip_id}/preferences"
+    created = client.post(url, json={"country": "Россия", "city": "Москва"}, headers=organizer).json()
+    client.get(url, headers=organizer)
+    assert _cached_keys(trip_id)
+
+    client.patch(f"{url}/{created['id']}", json={"priority": 5}, headers=organizer)
+
+    # Delivery of the trip event dropped the trip's entries ...
+    assert not _cached_keys(trip_id)
+    # ... and the response is built from the new data
+    assert client.get(url, headers=organizer).json()[0]["priority"] == 5
+
+
+def test_version_bump_alone_invalidates(client, trip):
+    # Another worker's write: only the version in the database changes, no event reaches this one
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    url = f"/api/trips/{trip_id}/preferences"
+    created = client.post(url, json={"country": "Россия", "city": "Москва"}, headers=organizer).json()
+    assert client.get(url, headers=organizer).json()[0]["comment"] is None
+
+    async def write_elsewhere() -> None:
+        async with SessionLocal() as db:
+            await db.execute(update(PlacePreference).filter(PlacePreference.id == created["id"]).values(comment="Красная площадь"))
+            await db.execute(update(Trip).filter(Trip.id == trip_id).values(version=Trip.version + 1))
+            await db.commit()
+
+    asyncio.run(write_elsewhere())
+
+    assert client.get(url, headers=organizer).json()[0]["comment"] == "Красная площадь"
+
+
+def test_per_viewer_responses_are_not_shared(client, trip, register, join):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    _, member = register()
+    join(trip_data, member)
+    preference_id = client.post(f"/api/trips/{trip_id}/preferences", json={
+        "country": "Россия", "city": "Москва",
+    }, headers=organizer).json()["id"]
+    client.post(f"/api/preferences/{preference_id}/reactions", json={"emoji": "👍"}, headers=member)
+    url = f"/api/preferences/trips/{trip_id}/reactions"
+
+    for _ in range(2):
+        member_view = client.get(url, headers=member).json()
+        organizer_view = client.get(url, headers=organizer).json()
+
+        assert member_view[0]["reactions"][0]["user_reacted"] is True
+        assert organizer_view[0]["reactions"][0]["user_reacted"] is False
+
+
+def test_trip_deletion_drops_cached_responses(client, trip):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    client.get(f"/api/trips/{trip_id}/preferences", headers=organizer)
+    client.get(f"/api/trips/{trip_id}/voting-results", headers=organizer)
+    assert len(_cached_keys(trip_id)) == 2
+
+    client.delete(f"/api/trips/{trip_id}", headers=organizer)
+
+    assert not _cached_keys(trip_id)
+    assert client.get(f"/api/trips/{trip_id}/preferences", headers=organizer).status_code == 404
@@ -0,0 +1,229 @@
+"""
+Потоковые парсеры ответа LLM с маршрутами (app.services.llm_service)
+
+Ответ приходит кусками произвольной длины: результат не должен зависеть от того,
+где поток разрезан, а оборванный на лимите токенов ответ не должен сохраняться
+как неполный набор маршрутов.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from app.database import SessionLocal
+from app.models import RouteGenerationCache
+from app.services import llm_service
+from app.services.generation import run_route_generation
+from app.services.llm_service import (
+    LLMRouteOutputError,
+    RouteStreamParser,
+    StructuredRouteStreamParser,
+    request_cache_key,
+)
+
+MARKDOWN = """Вот варианты:
+
+### Вариант 1: Классический Петербург
+**Маршрут:**
+**День 1:**
+- Утро: Эрмитаж
+
+**Обоснование:** Главные музеи
+
+### Вариант 2: Москва
+**Маршрут:**
+**День 1:**
+- Утро: Кремль
+**Обоснование:** Столица
+"""
+
+
+def _route(title: str, place: str, preference_id: int | None = 1) -> dict:
+    return {
+        "title": title,
+        "days": [{
+            "day": 1,
+            "title": None,
+            "slots": [{
+                "time": "morning",
+                "description": f"{place}: \"главный\" вход {{по брони}}\\",
+                "places": [{"name": place, "preference_id": preference_id}],
+            }],
+        }],
+        "reasoning": "Потому что [так] удобнее",
+    }
+
+
+STRUCTURED = json.dumps({"routes": [_route("Петербург", "Эрмитаж"), _route("Москва", "Кремль", 99)]}, ensure_ascii=False)
+
+
+def _feed_in_chunks(parser, text: str, size: int) -> list[dict]:
+    routes = []
+    for i in range(0, len(text), size):
+        routes += parser.feed(text[i:i + size])
+    return routes + parser.close()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10_000])
+def test_markdown_parser_does_not_depend_on_chunking(size):
+    whole = RouteStreamParser()
+    expected = whole.feed(MARKDOWN) + whole.close()
+
+    routes = _feed_in_chunks(RouteStreamParser(), MARKDOWN, size)
+
+    assert routes == expected
+    assert [r["title"] for r in routes] == ["Классический Петербург", "Москва"]
+    assert "Эрмитаж" in routes[0]["description"]
+    assert routes[1]["reasoning"].endswith("Столица")
+
+
+def test_markdown_route_is_emitted_when_next_one_starts():
+    parser = RouteStreamParser()
+    first, second = MARKDOWN.split("### Вариант 2")
+
+    assert parser.feed(first) == []
+    assert [r["title"] for r in parser.feed("### Вариант 2" + second)] == ["Классический Петербург"]
+    assert [r["title"] for r in parser.close()] == ["Москва"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 13, 10_000])
+def test_structured_parser_does_not_depend_on_chunking(size):
+    parser = StructuredRouteStreamParser({1})
+
+    routes = _feed_in_chunks(parser, STRUCTURED, size)
+
+    assert [r["title"] for r in routes] == ["Петербург", "Москва"]
+    slot = routes[0]["route_data"]["days"][0]["slots"][0]
+    assert slot["description"] == 'Эрмитаж: "главный" вход {по брони}\\'
+    assert slot["places"][0]["preference_id"] == 1
+    # Ids the model made up are dropped
+    assert routes[1]["route_data"]["days"][0]["slots"][0]["places"][0]["preference_id"] is None
+    assert parser.count == 2 and parser.errors == 0 and not parser.truncated
+
+
+def test_structured_route_is_emitted_on_its_closing_brace():
+    parser = StructuredRouteStreamParser({1})
+    first_end = STRUCTURED.index('}, {"title": "Москва"') + 1
+
+    assert parser.feed(STRUCTURED[:first_end - 1]) == []
+    assert [r["title"] for r in parser.feed(STRUCTURED[first_end - 1:first_end])] == ["Петербург"]
+
+
+def test_structured_parser_reports_truncated_output():
+    parser = StructuredRouteStreamParser({1})
+    cut = STRUCTURED.index("Кремль")
+
+    routes = _feed_in_chunks(parser, STRUCTURED[:cut], 10)
+
+    assert [r["title"] for r in routes] == ["Петербург"]
+    assert parser.truncated
+    assert parser.errors == 1
+
+
+def test_structured_parser_skips_invalid_route():
+    text = json.dumps({"routes": [{"title": "Без дней", "days": []}, _route("Москва", "Кремль")]}, ensure_ascii=False)
+    parser = StructuredRouteStreamParser({1})
+
+    routes = _feed_in_chunks(parser, text, 4)
+
+    assert [r["title"] for r in routes] == ["Москва"]
+    assert parser.errors == 1 and not parser.truncated
+
+
+def _completion(content: str, finish_reason: str = "stop") -> ChatCompletion:
+    return ChatCompletion.model_validate({
+        "id": "test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test",
+        "choices": [{
+            "index": 0,
+            "finish_reason": finish_reason,
+            "message": {"role": "assistant", "content": content},
+        }],
+    })
+
+
+def _fake_llm(monkeypatch, content: str, finish_reason: str = "stop") -> list[dict]:
+    """Answer chat completions with `content`; returns the requests made."""
+    requests = []
+
+    async def fake_chat_completion(request, read_timeout, trip_id=None):
+        requests.append(request)
+        return _completion(content, finish_reason)
+
+    monkeypatch.setattr(llm_service, "_chat_completion", fake_chat_completion)
+    monkeypatch.setattr(llm_service.settings, "llm_routes_output_format", "json")
+    return requests
+
+
+def _generate(monkeypatch, content: str, finish_reason: str = "stop") -> tuple[list[dict], bool]:
+    _fake_llm(monkeypatch, content, finish_reason)
+    trip = SimpleNamespace(id=1)
+    preferences = [SimpleNamespace(id=1)]
+    return asyncio.run(llm_service.generate_routes(trip, preferences, request={"model": "test", "messages": []}))
+
+
+def test_generate_routes_parses_structured_output(monkeypatch):
+    routes, fallback = _generate(monkeypatch, STRUCTURED)
+
+    assert [r["title"] for r in routes] == ["Петербург", "Москва"]
+    assert not fallback
+
+
+def test_generate_routes_fails_on_length_cutoff(monkeypatch):
+    # All routes parsed, but the model was stopped by max_tokens: more may have been planned
+    with pytest.raises(LLMRouteOutputError):
+        _generate(monkeypatch, STRUCTURED, finish_reason="length")
+
+
+def test_generate_routes_fails_on_truncated_json(monkeypatch):
+    with pytest.raises(LLMRouteOutputError):
+        _generate(monkeypatch, STRUCTURED[:STRUCTURED.index("Кремль")])
+
+
+def test_generate_routes_does_not_store_invalid_json_as_text(monkeypatch):
+    with pytest.raises(LLMRouteOutputError):
+        _generate(monkeypatch, '{"routes": "нет"}')
+
+
+def test_generate_routes_falls_back_to_markdown(monkeypatch):
+    routes, fallback = _generate(monkeypatch, MARKDOWN)
+
+    assert [r["title"] for r in routes] == ["Классический Петербург", "Москва"]
+    assert fallback
+
+
+def test_generate_routes_keeps_unparsed_response_as_one_route(monkeypatch):
+    routes, fallback = _generate(monkeypatch, "Просто текст без вариантов")
+
+    assert [r["description"] for r in routes] == ["Просто текст без вариантов"]
+    assert fallback
+
+
+def test_fallback_routes_are_not_cached(client, trip, monkeypatch):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    response = client.post(f"/api/trips/{trip_id}/preferences", json={
+        "country": "Россия", "city": "Москва", "location": "Кремль",
+    }, headers=organizer)
+    assert response.status_code == 201, response.text
+
+    requests = _fake_llm(monkeypatch, "Просто текст без вариантов")
+
+    async def generate_twice() -> tuple[list[dict], RouteGenerationCache | None]:
+        results = []
+        for _ in range(2):
+            async with SessionLocal() as db:
+                results.append(await run_route_generation(trip_id, db))
+        async with SessionLocal() as db:
+            return results, await db.get(RouteGenerationCache, request_cache_key(requests[0]))
+
+    results, entry = asyncio.run(generate_twice())
+
+    assert [result["cached"] for result in results] == [False, False]
+    assert len(requests) == 2
+    assert entry is None
+
@@ -0,0 +1,180 @@
+"""
+Голосование за маршруты (app.routers.votes, app.services.votes): счётчик голосов
+route_options.vote_count меняется вместе с голосами, итоги и победитель читаются из него
+"""
+import asyncio
+
+from fastapi import HTTPException
+
+from app.database import SessionLocal
+from app.models import ParticipantRole, Trip
+from app.routers.votes import remove_vote
+from app.utils.deps import Principal, TripAccess
+
+
+def _results(client, trip_id: int, headers: dict) -> dict:
+    response = client.get(f"/api/trips/{trip_id}/voting-results", headers=headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return {item["route_option_id"]: item["vote_count"] for item in body["results"]} | {"winner": body["winner_id"]}
+
+
+def test_vote_count_follows_votes(client, trip, register, join, add_routes):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    _, member = register()
+    join(trip_data, member)
+    first, second, third = add_routes(trip_id)
+
+    for headers, route_id in [(organizer, second), (member, second), (member, third)]:
+        response = client.post(f"/api/trips/{trip_id}/votes", json={"route_option_id": route_id}, headers=headers)
+        assert response.status_code == 201, response.text
+
+    assert _results(client, trip_id, organizer) == {first: 0, second: 2, third: 1, "winner": second}
+
+    assert client.delete(f"/api/trips/{trip_id}/votes/{second}", headers=member).status_code == 204
+    assert client.delete(f"/api/trips/{trip_id}/votes/{second}", headers=organizer).status_code == 204
+
+    assert _results(client, trip_id, organizer) == {first: 0, second: 0, third: 1, "winner": third}
+
+
+def test_repeated_vote_is_not_counted(client, trip, add_routes):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    route_id = add_routes(trip_id)[0]
+
+    assert client.post(f"/api/trips/{trip_id}/votes", json={"route_option_id": route_id}, headers=organizer).status_code == 201
+    response = client.post(f"/api/trips/{trip_id}/votes", json={"route_option_id": route_id}, headers=organizer)
+
+    assert response.status_code == 400
+    assert _results(client, trip_id, organizer)[route_id] == 1
+
+
+def test_no_votes_no_winner(client, trip, add_routes):
+    trip_data, organizer = trip
+    add_routes(trip_data["id"])
+
+    assert _results(client, trip_data["id"], organizer)["winner"] is None
+
+
+def test_reconcile_vote_counts(client, trip, add_routes):
+    import asyncio
+    from sqlalchemy import update
+    from app.database import SessionLocal
+    from app.models import RouteOption
+    from app.services.votes import reconcile_vote_counts
+
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    route_id = add_routes(trip_id)[0]
+    client.post(f"/api/trips/{trip_id}/votes", json={"route_option_id": route_id}, headers=organizer)
+
+    async def corrupt_and_reconcile() -> int:
+        async with SessionLocal() as db:
+            await db.execute(update(RouteOption).filter(RouteOption.trip_id == trip_id).values(vote_count=7))
+            await db.commit()
+            return await reconcile_vote_counts(db, trip_id)
+
+    assert asyncio.run(corrupt_and_reconcile()) == 3
+    assert _results(client, trip_id, organizer)[route_id] == 1
+
+
+def _ballot(client, trip_id: int, route_ids: list[int], headers: dict):
+    return client.put(f"/api/trips/{trip_id}/my-votes", json={"route_option_ids": route_ids}, headers=headers)
+
+
+def test_ballot_replaces_votes(client, trip, register, join, add_routes):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    _, member = register()
+    join(trip_data, member)
+    first, second, third = add_routes(trip_id)
+    assert _ballot(client, trip_id, [second], member).status_code == 200
+
+    response = _ballot(client, trip_id, [first, third, first], organizer)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["route_option_ids"] == [first, third]
+    assert {r["route_option_id"]: r["vote_count"] for r in body["results"]} == {first: 1, second: 1, third: 1}
+
+    body = _ballot(client, trip_id, [second], organizer).json()
+
+    assert body["winner_id"] == second
+    assert {r["route_option_id"]: r["vote_count"] for r in body["results"]} == {first: 0, second: 2, third: 0}
+    assert client.get(f"/api/trips/{trip_id}/my-votes", headers=organizer).json() == {"route_option_ids": [second]}
+
+
+def test_ballot_is_idempotent(client, trip, add_routes):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    first, second, third = add_routes(trip_id)
+
+    for _ in range(3):
+        assert _ballot(client, trip_id, [first, second], organizer).status_code == 200
+
+    results = _results(client, trip_id, organizer)
+    assert (results[first], results[second], results[third]) == (1, 1, 0)
+
+
+def test_empty_ballot_withdraws_votes(client, trip, add_routes):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    first, second, third = add_routes(trip_id)
+    _ballot(client, trip_id, [first, second], organizer)
+
+    body = _ballot(client, trip_id, [], organizer).json()
+
+    assert body["route_option_ids"] == [] and body["winner_id"] is None
+    assert _results(client, trip_id, organizer) == {first: 0, second: 0, third: 0, "winner": None}
+
+
+def test_ballot_with_foreign_route_changes_nothing(client, trip, register, add_routes):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    first, _, _ = add_routes(trip_id)
+    _, stranger = register()
+    other_trip = client.post("/api/trips", json={
+        "title": "Другая", "start_date": "2026-11-01", "end_date": "2026-11-02",
+    }, headers=stranger).json()
+    foreign = add_routes(other_trip["id"], 1)[0]
+    _ballot(client, trip_id, [first], organizer)
+
+    response = _ballot(client, trip_id, [foreign], organizer)
+
+    assert response.status_code == 404
+    assert client.get(f"/api/trips/{trip_id}/my-votes", headers=organizer).json() == {"route_option_ids": [first]}
+    assert _results(client, trip_id, organizer)[first] == 1
+
+
+def test_ballot_before_generation(client, trip):
+    trip_data, organizer = trip
+
+    assert _ballot(client, trip_data["id"], [], organizer).status_code == 400
+
+
+def test_vote_removed_concurrently_is_counted_once(client, trip, register, join, add_routes):
+    trip_data, organizer = trip
+    trip_id = trip_data["id"]
+    member_id, member = register()
+    join(trip_data, member)
+    route_id = add_routes(trip_id)[0]
+    for headers in (organizer, member):
+        client.post(f"/api/trips/{trip_id}/votes", json={"route_option_id": route_id}, headers=headers)
+
+    async def delete_twice_at_once() -> list:
+        async def delete_once():
+            async with SessionLocal() as db:
+                user = Principal(member_id, "", "", True, None)
+                access = TripAccess(user, await db.get(Trip, trip_id), ParticipantRole.PARTICIPANT)
+                await remove_vote(trip_id, route_id, db, access)
+
+        return await asyncio.gather(delete_once(), delete_once(), return_exceptions=True)
+
+    outcomes = asyncio.run(delete_twice_at_once())
+
+    assert sum(outcome is None for outcome in outcomes) == 1
+    assert [e.status_code for e in outcomes if isinstance(e, HTTPException)] == [404]
+    assert _results(client, trip_id, organizer)[route_id] == 1
+    assert client.delete(f"/api/trips/{trip_id}/votes/{route_id}", headers=member).status_code == 404
+    assert _results(client, trip_id, organizer)[route_id] == 1